@@ -0,0 +1,331 @@
+"""
+The benchmark cases run by run_benchmarks.py.
+
+Each case is a setup function that is registered with the @benchmark decorator.  The setup function receives the input
+size, prepares any input data (which is not timed), and returns a tuple of (function to time, teardown function or
+None).  The timed function may return a dictionary of deterministic metrics (such as round trips to the device), which
+are compared exactly against the baseline.
+
+Input data comes from the synthetic corpus generator (crt_tools/show_output_generator.py), and the SecureCRT scripts are
+run with the crt emulator (crt_tools/crt_emulator.py) against a device built from that corpus.
+"""
+
+import io
+import os
+import csv
+import sys
+import types
+import shutil
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SECURECRT_DIR = os.path.dirname(BENCH_DIR)
+CRT_TOOLS_DIR = os.path.join(SECURECRT_DIR, "crt_tools")
+TOOLS_MACS_DIR = os.path.join(SECURECRT_DIR, "tools-macs")
+
+if CRT_TOOLS_DIR not in sys.path:
+    sys.path.insert(0, CRT_TOOLS_DIR)
+
+# The crt_tools modules import each other through the "securecrt_tools" package name (the name of the folder when it
+# is installed next to the scripts), so register the crt_tools directory under that name.
+if "securecrt_tools" not in sys.modules:
+    _package = types.ModuleType("securecrt_tools")
+    _package.__path__ = [CRT_TOOLS_DIR]
+    sys.modules["securecrt_tools"] = _package
+
+import textfsm
+from crt_emulator import CrtEmulator, run_script
+from show_output_generator import SwitchCorpus, format_mac
+from mac_table import MacTable, MacTableParser
+from mac_sightings import SightingStore
+from mac_harvest import FleetIndex, SwitchHarvest
+from oui_lookup import OuiDatabase, CompiledOuiDatabase, compile_registry
+from securecrt_tools import utilities
+
+CDP_TEMPLATE = os.path.join(CRT_TOOLS_DIR, "textfsm-templates", "cisco_os_show_cdp_neigh_det.template")
+
+REGISTRY = {}
+
+
+class Case(object):
+    """
+    A registered benchmark case.
+    """
+
+    def __init__(self, name, setup, sizes, description, max_exponent=None):
+        self.name = name
+        self.setup = setup
+        self.sizes = sizes
+        self.description = description
+        self.max_exponent = max_exponent
+
+
+def benchmark(name, sizes, max_exponent=None):
+    """
+    Registers a setup function as a benchmark case.
+
+    :param name: The unique name of the case
+    :type name: str
+    :param sizes: The input sizes to run the case with (normally a small and a 10x larger size)
+    :type sizes: tuple
+    :param max_exponent: Overrides the maximum allowed growth exponent between the sizes for this case.
+    :type max_exponent: float
+    """
+    def register(setup):
+        REGISTRY[name] = Case(name, setup, sizes, (setup.__doc__ or "").strip().split("\n")[0], max_exponent)
+        return setup
+    return register
+
+
+# ################################################      HELPERS     ###################################################
+
+
+def call(func, *args):
+    """
+    Builds a timed function that calls func(*args) and discards the result (only metrics may be returned).
+    """
+    def run():
+        func(*args)
+    return run
+
+
+def script_globals(script_name, device, **kwargs):
+    """
+    Runs a script once against a device with the emulator and returns its globals, so that the functions it defines
+    can be benchmarked directly.
+    """
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        crt = CrtEmulator(device, work_dir=work_dir, **kwargs)
+        result = run_script(os.path.join(TOOLS_MACS_DIR, script_name), crt)
+        if result.error:
+            raise result.error
+        return result.script_globals
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def end_to_end(script_name, corpus, **kwargs):
+    """
+    Builds a timed function that runs the whole script against the corpus device, and reports the emulator's counters
+    as metrics.
+    """
+    device = corpus.build_device()
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    sightings = os.path.join(work_dir, "cache", "mac_sightings.db")
+    logins = os.path.join(work_dir, "cache", "auth_limiter.json")
+
+    def run():
+        # Each run starts without sightings, so the tracker traces the MAC live instead of answering from a past run, and
+        # without the logins of past runs, which the rate limiter would make it wait for in real time.
+        for filename in (sightings, logins):
+            if os.path.exists(filename):
+                os.remove(filename)
+        crt = CrtEmulator(device, work_dir=work_dir, **kwargs)
+        result = run_script(os.path.join(TOOLS_MACS_DIR, script_name), crt)
+        if result.error:
+            raise result.error
+        stats = result.stats
+        return {"round_trips": stats.round_trips, "commands": stats.commands, "timeouts": stats.timeouts}
+
+    return run, lambda: shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ################################################      CASES       ###################################################
+
+
+@benchmark("textfsm_cdp_detail", sizes=(200, 2000))
+def textfsm_cdp_detail(size):
+    """TextFSM parse of 'show cdp neighbors detail' with the cdp_to_csv.py template."""
+    output = SwitchCorpus(rows=10, neighbors=size, port_channels=0).show_cdp_neighbors_detail()
+    with open(CDP_TEMPLATE, "r") as template_file:
+        template = template_file.read()
+
+    def run():
+        fsm = textfsm.TextFSM(io.StringIO(template))
+        fsm.ParseText(output)
+
+    return run, None
+
+
+@benchmark("get_mac_csv_parse_cdp_detail", sizes=(500, 5000))
+def get_mac_csv_parse_cdp_detail(size):
+    """parse_cdp_detail() from get_mac_csv.py."""
+    functions = script_globals("get_mac_csv.py", SwitchCorpus(rows=10).build_device(latency=0))
+    lines = SwitchCorpus(rows=10, neighbors=size, port_channels=0).show_cdp_neighbors_detail().splitlines(True)
+    parse_cdp_detail = functions["parse_cdp_detail"]
+    return call(parse_cdp_detail, lines), None
+
+
+@benchmark("tracker_parse_mac_table", sizes=(20000, 200000))
+def tracker_parse_mac_table(size):
+    """parse_mac_table() from get_mac_tracker.py over a full MAC table."""
+    functions = script_globals("get_mac_tracker.py", SwitchCorpus(rows=10).build_device(latency=0))
+    corpus = SwitchCorpus(rows=size)
+    output = corpus.show_mac_address_table()
+    mac = format_mac(corpus.macs[size // 2][1])
+    parse_mac_table = functions["parse_mac_table"]
+    return call(parse_mac_table, output, mac), None
+
+
+@benchmark("mac_table_parse", sizes=(20000, 200000))
+def mac_table_parse(size):
+    """mac_table.MacTableParser.parse() over a full MAC table."""
+    output = SwitchCorpus(rows=size).show_mac_address_table()
+    return call(MacTableParser().parse, output), None
+
+
+@benchmark("mac_table_dedup_sort", sizes=(20000, 200000))
+def mac_table_dedup_sort(size):
+    """mac_table.MacTable built from parsed rows, de-duplicated and sorted by port."""
+    rows = MacTableParser().parse(SwitchCorpus(rows=size).show_mac_address_table())
+    rows.extend(rows[:size // 4])
+
+    def run():
+        table = MacTable(rows)
+        table.dedup()
+        table.sort("port")
+
+    return run, None
+
+
+@benchmark("oui_lookup_bulk", sizes=(20000, 200000))
+def oui_lookup_bulk(size):
+    """oui_lookup.OuiDatabase.lookup() of every MAC in a MAC table (the registry is loaded in setup)."""
+    table = MacTable(MacTableParser().parse(SwitchCorpus(rows=size).show_mac_address_table()))
+    return call(OuiDatabase().lookup, table.macs), None
+
+
+@benchmark("oui_cold_start_csv", sizes=(1000,))
+def oui_cold_start_csv(size):
+    """Loading the OUI registry from the CSV file, then looking up a MAC table's vendors."""
+    table = MacTable(MacTableParser().parse(SwitchCorpus(rows=size).show_mac_address_table()))
+
+    def run():
+        OuiDatabase().lookup(table.macs)
+
+    return run, None
+
+
+@benchmark("oui_cold_start_mmap", sizes=(1000,))
+def oui_cold_start_mmap(size):
+    """Opening the compiled (memory-mapped) OUI registry, then looking up a MAC table's vendors."""
+    table = MacTable(MacTableParser().parse(SwitchCorpus(rows=size).show_mac_address_table()))
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    compiled_filename = compile_registry(compiled_filename=os.path.join(work_dir, "oui.db"))
+
+    def run():
+        ouis = CompiledOuiDatabase(compiled_filename)
+        ouis.lookup(table.macs)
+        ouis.close()
+
+    return run, lambda: shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@benchmark("mac_sightings_record", sizes=(2000, 20000))
+def mac_sightings_record(size):
+    """mac_sightings.SightingStore.record() of a MAC table into a new database, then again into the same one."""
+    rows = MacTableParser().parse(SwitchCorpus(rows=size).show_mac_address_table())
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    filename = os.path.join(work_dir, "mac_sightings.db")
+
+    def run():
+        if os.path.exists(filename):
+            os.remove(filename)
+        with SightingStore(filename) as store:
+            store.record("SW1", rows)
+            store.record("SW1", rows)
+
+    return run, lambda: shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@benchmark("mac_harvest_merge", sizes=(2000, 20000))
+def mac_harvest_merge(size):
+    """mac_harvest.FleetIndex merging 10 access switches with a distribution switch that sees all of their MACs."""
+    outputs = []
+    distribution = SwitchCorpus(hostname="DIST1", rows=size // 10, seed=100, neighbors=10, port_channels=10)
+    for index in range(10):
+        corpus = SwitchCorpus(hostname="ACC{0}".format(index + 1), rows=size // 10, seed=index, neighbors=1)
+        distribution.macs.extend((vlan, value, "Po{0}".format(index + 1)) for vlan, value, port in corpus.macs)
+        outputs.append(corpus)
+    outputs.append(distribution)
+    outputs = [(corpus.hostname, corpus.show_mac_address_table(), corpus.show_interfaces_description(),
+                corpus.show_cdp_neighbors_detail()) for corpus in outputs]
+
+    def run():
+        index = FleetIndex()
+        for hostname, mac_output, description_output, cdp_output in outputs:
+            index.add(SwitchHarvest.from_outputs(hostname, hostname, mac_output, description_output, cdp_output))
+        return {"macs": len(index.locations())}
+
+    return run, None
+
+
+@benchmark("get_mac_e2e", sizes=(10000, 100000))
+def get_mac_e2e(size):
+    """get_mac.py end to end against an emulated IOS-XE switch."""
+    return end_to_end("get_mac.py", SwitchCorpus(rows=size))
+
+
+@benchmark("get_mac_csv_e2e", sizes=(10000, 100000))
+def get_mac_csv_e2e(size):
+    """get_mac_csv.py end to end against an emulated IOS-XE switch."""
+    return end_to_end("get_mac_csv.py", SwitchCorpus(rows=size))
+
+
+@benchmark("get_mac_tracker_e2e", sizes=(10000,))
+def get_mac_tracker_e2e(size):
+    """get_mac_tracker.py tracing a MAC on an access port of an emulated switch."""
+    corpus = SwitchCorpus(rows=size)
+    # Pick a MAC that is learned on an access port, so the trace ends on this switch.
+    mac = next(format_mac(value) for vlan, value, port in corpus.macs if port.startswith("Gi"))
+    return end_to_end("get_mac_tracker.py", corpus, clipboard=mac)
+
+
+@benchmark("get_mac_tracker_hop_e2e", sizes=(10000,))
+def get_mac_tracker_hop_e2e(size):
+    """get_mac_tracker.py following a MAC through a port-channel to an access port of the next switch."""
+    corpus = SwitchCorpus(hostname="DIST1", rows=size, seed=1, neighbors=2, port_channels=1)
+    neighbor = SwitchCorpus(hostname="ACC1", rows=size, seed=2, neighbors=2, port_channels=1)
+    # A MAC on an access port of the neighbor, learned on the port-channel to the neighbor on the first switch.
+    vlan, value, port = next(row for row in neighbor.macs if row[2].startswith("Gi"))
+    corpus.macs.append((vlan, value, "Po1"))
+    # The password has a double quote in it, which has to be escaped on the connection's command line.
+    network = {corpus.neighbors[0]["ip"]: neighbor.build_device(username="admin", password='p"w\\')}
+    # The hop logs in with an account chosen from login.py's menu, read from a credentials CSV.
+    credentials_dir = tempfile.mkdtemp(prefix="bench-")
+    credentials = os.path.join(credentials_dir, "credentials.csv")
+    with open(credentials, "w", newline="") as credentials_file:
+        writer = csv.writer(credentials_file)
+        writer.writerow(["credentials", "username", "password", "enable_password"])
+        writer.writerow(["ad_account", "admin", 'p"w\\', ""])
+    run, teardown = end_to_end("get_mac_tracker.py", corpus, clipboard=format_mac(value), network=network,
+                               rules={"credentials CSV": credentials, "AD Account": "1"})
+
+    def cleanup():
+        teardown()
+        shutil.rmtree(credentials_dir, ignore_errors=True)
+
+    return run, cleanup
+
+
+@benchmark("utilities_list_of_lists_to_csv", sizes=(20000, 200000))
+def utilities_list_of_lists_to_csv(size):
+    """utilities.list_of_lists_to_csv() writing a MAC table sized CSV."""
+    corpus = SwitchCorpus(rows=size)
+    data = [["Switch Name", "MAC", "Port", "VLAN"]]
+    data.extend([corpus.hostname, format_mac(value), port, str(vlan)] for vlan, value, port in corpus.macs)
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    filename = os.path.join(work_dir, "out.csv")
+    return call(utilities.list_of_lists_to_csv, data, filename), lambda: shutil.rmtree(work_dir, True)
+
+
+@benchmark("utilities_list_of_dicts_to_csv", sizes=(20000, 200000))
+def utilities_list_of_dicts_to_csv(size):
+    """utilities.list_of_dicts_to_csv() writing a MAC table sized CSV."""
+    corpus = SwitchCorpus(rows=size)
+    header = ["Switch Name", "MAC", "Port", "VLAN"]
+    data = [dict(zip(header, (corpus.hostname, format_mac(value), port, vlan))) for vlan, value, port in corpus.macs]
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    filename = os.path.join(work_dir, "out.csv")
+    return call(utilities.list_of_dicts_to_csv, data, filename, header), lambda: shutil.rmtree(work_dir, True)
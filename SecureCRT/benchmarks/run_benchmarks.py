@@ -0,0 +1,232 @@
+"""
+Performance regression benchmarks for the SecureCRT scripts and the crt_tools modules.
+
+Every benchmark case (see cases.py) is timed at two input sizes.  The results are compared against a JSON baseline that
+is stored per machine in the "baselines" directory, since timings from different machines can't be compared.  A run
+fails (exit code 1) when:
+
+- The median time of a case is slower than the baseline by more than the tolerance (default 15%) AND the difference is
+  larger than the noise seen in the samples (3x the scaled median absolute deviation).
+- A case that reports deterministic metrics (round trips, commands sent, etc) got worse than the baseline.
+- The time of a case grows faster than allowed between the small and large input sizes (default exponent of 1.3, so
+  linear code passes and quadratic code fails) -- this check doesn't need a baseline.
+
+Usage:
+
+    python run_benchmarks.py                # Compare against this machine's baseline (or just print if none exists)
+    python run_benchmarks.py --save         # Run and store the results as the new baseline for this machine
+    python run_benchmarks.py --quick        # Use 1/10th of the input sizes, for a fast sanity check
+    python run_benchmarks.py -k textfsm     # Only run cases with 'textfsm' in the name
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+sys.path.insert(0, BENCH_DIR)
+import cases
+
+
+# ################################################    STATISTICS    ###################################################
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def mad(values):
+    """
+    :return: The median absolute deviation of the values, scaled (x1.4826) to be comparable to a standard deviation.
+    :rtype: float
+    """
+    center = median(values)
+    return 1.4826 * median([abs(v - center) for v in values])
+
+
+def scaling_exponent(small_size, small_time, large_size, large_time):
+    """
+    :return: The exponent k in time ~ size^k between two measurements (1.0 is linear, 2.0 is quadratic).
+    :rtype: float
+    """
+    if small_time <= 0 or large_time <= 0 or large_size == small_size:
+        return 0.0
+    return math.log(large_time / small_time) / math.log(float(large_size) / small_size)
+
+
+# ################################################     RUNNING      ###################################################
+
+
+def machine_id():
+    """
+    :return: A filename safe identifier for this machine and Python version.
+    :rtype: str
+    """
+    raw = "{0}-{1}-py{2}.{3}".format(platform.node() or "unknown", platform.machine() or "unknown",
+                                     sys.version_info[0], sys.version_info[1])
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", raw)
+
+
+def run_case(case, size, repeat):
+    """
+    Runs one benchmark case at one size.
+
+    :return: A dictionary with the timing samples and statistics, and any deterministic metrics the case reported.
+    :rtype: dict
+    """
+    func, teardown = case.setup(size)
+    try:
+        # Warm up run, so that imports and caches don't count against the first sample.
+        metrics = func() or {}
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    finally:
+        if teardown:
+            teardown()
+    return {"size": size, "samples": samples, "median": median(samples), "mad": mad(samples), "metrics": metrics}
+
+
+def run_all(selected, repeat, quick):
+    results = {}
+    scaling = {}
+    for case in selected:
+        sizes = [max(1, size // 10) for size in case.sizes] if quick else list(case.sizes)
+        measured = []
+        for size in sizes:
+            key = "{0}@{1}".format(case.name, size)
+            result = run_case(case, size, repeat)
+            results[key] = result
+            measured.append(result)
+            print("{0:<45} median {1:>10.5f}s  mad {2:>9.5f}s  {3}".format(
+                key, result["median"], result["mad"], format_metrics(result["metrics"])))
+        if len(measured) >= 2:
+            scaling[case.name] = scaling_exponent(measured[0]["size"], measured[0]["median"],
+                                                  measured[-1]["size"], measured[-1]["median"])
+    return results, scaling
+
+
+def format_metrics(metrics):
+    return " ".join("{0}={1}".format(key, value) for key, value in sorted(metrics.items()))
+
+
+# ################################################    COMPARISON    ###################################################
+
+
+def compare(baseline, results, scaling, tolerance, noise_factor, max_exponent):
+    """
+    Compares a run against the baseline and the scaling limits.
+
+    :return: A list of strings describing each failure.
+    :rtype: list of str
+    """
+    failures = []
+    base_results = baseline.get("results", {}) if baseline else {}
+    for key, result in sorted(results.items()):
+        base = base_results.get(key)
+        if not base:
+            continue
+        delta = result["median"] - base["median"]
+        noise = noise_factor * max(base["mad"], result["mad"])
+        if result["median"] > base["median"] * (1 + tolerance) and delta > noise:
+            failures.append("{0}: {1:.5f}s vs baseline {2:.5f}s (+{3:.0%}, noise {4:.5f}s)".format(
+                key, result["median"], base["median"], delta / base["median"], noise))
+        for metric, value in sorted(result["metrics"].items()):
+            base_value = base.get("metrics", {}).get(metric)
+            if base_value is not None and value > base_value:
+                failures.append("{0}: {1} increased from {2} to {3}".format(key, metric, base_value, value))
+
+    for name, exponent in sorted(scaling.items()):
+        limit = cases.REGISTRY[name].max_exponent or max_exponent
+        if exponent > limit:
+            failures.append("{0}: time grows as size^{1:.2f} (limit {2:.2f}) -- super-linear behavior".format(
+                name, exponent, limit))
+    return failures
+
+
+def load_baseline(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r") as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results, scaling):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    data = {"machine": machine_id(), "python": sys.version, "platform": platform.platform(),
+            "created": datetime.datetime.now().isoformat(), "results": results, "scaling": scaling}
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as baseline_file:
+        json.dump(data, baseline_file, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the performance regression benchmarks.")
+    parser.add_argument("-k", dest="filter", help="Only run cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed samples per case and size (default 5)")
+    parser.add_argument("--quick", action="store_true", help="Use 1/10th of the input sizes")
+    parser.add_argument("--save", action="store_true", help="Save the results as this machine's baseline")
+    parser.add_argument("--baseline", help="Baseline file to compare against (default: baselines/<machine>.json)")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown fraction (default 0.15)")
+    parser.add_argument("--noise-factor", type=float, default=3.0,
+                        help="Slowdowns must also exceed this many deviations of noise (default 3)")
+    parser.add_argument("--max-exponent", type=float, default=1.3,
+                        help="Maximum growth exponent between the small and large size (default 1.3)")
+    parser.add_argument("--list", action="store_true", help="List the benchmark cases and exit")
+    args = parser.parse_args(argv)
+
+    selected = [case for name, case in sorted(cases.REGISTRY.items()) if not args.filter or args.filter in name]
+    if args.list:
+        for case in selected:
+            print("{0:<35} sizes={1}  {2}".format(case.name, case.sizes, case.description))
+        return 0
+    if not selected:
+        print("No benchmark cases match '{0}'".format(args.filter))
+        return 1
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, "{0}{1}.json".format(
+        machine_id(), "-quick" if args.quick else ""))
+    print("Machine: {0}".format(machine_id()))
+    results, scaling = run_all(selected, args.repeat, args.quick)
+    for name, exponent in sorted(scaling.items()):
+        print("{0:<45} scaling exponent {1:.2f}".format(name, exponent))
+
+    baseline = None if args.save else load_baseline(baseline_path)
+    if baseline is None and not args.save:
+        print("No baseline found at {0} (use --save to create one).  Only checking scaling.".format(baseline_path))
+    failures = compare(baseline, results, scaling, args.tolerance, args.noise_factor, args.max_exponent)
+
+    if failures:
+        print("\n" + "!" * 80)
+        print("PERFORMANCE REGRESSIONS DETECTED:")
+        for failure in failures:
+            print("  * " + failure)
+        print("!" * 80)
+        return 1
+
+    if args.save:
+        save_baseline(baseline_path, results, scaling)
+        print("Saved baseline to {0}".format(baseline_path))
+    else:
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
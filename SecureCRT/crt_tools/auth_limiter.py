@@ -0,0 +1,325 @@
+"""
+This module meters login attempts so that large runs don't overload the TACACS/RADIUS servers behind the devices.  When
+hundreds of logins hit the AAA servers at once, the service account gets throttled or locked, and the run ends up slower
+(or stopped) instead of faster.
+
+Login attempts are metered with token buckets at two levels:
+
+- One bucket per credential (username) in each AAA domain, so a single account isn't used faster than allowed.
+- One bucket per AAA domain (a group of devices that authenticate against the same servers), shared by all credentials.
+
+An attempt waits until both buckets have a token.  When a login fails with an authentication error (such as
+"% Authentication failed" or "% Login invalid"), the rates of both buckets are halved and the credential is paused for a
+cooldown that doubles with each failure in a row.  Successful logins raise the rates again a little at a time, back up to
+the configured maximum, so the limiter settles at the fastest rate the servers accept.  After too many failures in a row
+for the same credential during a run, the rest of that run's attempts are refused so that the account isn't locked out.
+
+The state is saved to a JSON file, so the limits and pauses carry over between script runs (for example, login.py is run
+once for each tab).  The refusal doesn't: a later run (after the password has been fixed, say) gets to try again, still
+paused after the earlier failures.  A credential's failures are forgotten once failure_window seconds have passed since
+its pause ended, or with reset() when the credentials are entered again.
+
+Example:
+
+    limiter = AuthRateLimiter(os.path.join(cache_dir, "auth_limiter.json"))
+    limiter.acquire(username, domain)
+    ... send the credentials ...
+    limiter.report(username, domain, success=not is_auth_failure(response))
+    limiter.save()
+
+    # Order a device list so that devices in other AAA domains are connected to while one domain is being limited.
+    for device in limiter.schedule(script.import_device_list()):
+        ...
+"""
+
+import os
+import json
+import time
+import logging
+from collections import deque, OrderedDict
+
+from host_cache import save_json
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Responses from a device that mean the credentials were rejected.
+AUTH_FAILURES = ["% Access denied", "Access denied", "% Authentication failed", "Authentication failed",
+                 "% Login invalid", "Login invalid", "% Bad passwords", "Bad passwords", "% Bad secrets", "Bad secrets",
+                 "incorrect", "authentication failure", "Permission denied"]
+
+
+def is_auth_failure(text):
+    """
+    :param text: Output received from a device after sending credentials
+    :type text: str
+
+    :return: True if the output contains one of the authentication failure messages.
+    :rtype: bool
+    """
+    return any(failure in text for failure in AUTH_FAILURES)
+
+
+def aaa_domain(account_key, host):
+    """
+    Maps a credential key from the login CSV (such as "ad_account", "tac_NetEng" or "local_NetEng") to the AAA domain
+    its logins are metered in.  Local accounts are checked by each device itself, so every device is its own domain.
+    The others are checked by the AAA servers named by the key's prefix ("ad", "tac").
+
+    :param account_key: The key of the credential in the login CSV
+    :type account_key: str
+    :param host: The device being logged into
+    :type host: str
+
+    :return: The AAA domain to pass to AuthRateLimiter.acquire() and report()
+    :rtype: str
+    """
+    if account_key.startswith("local"):
+        return host
+    return account_key.split("_")[0]
+
+
+class AuthLimitError(Exception):
+    """
+    An exception type that is raised when a credential has failed too many times in a row to risk another attempt.
+    """
+    pass
+
+
+class TokenBucket(object):
+    """
+    A token bucket that refills at a (changeable) rate, up to its capacity.
+    """
+
+    def __init__(self, rate, capacity, tokens=None, updated=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = updated
+
+    def wait_time(self, now):
+        """
+        :return: The number of seconds until a token is available.
+        :rtype: float
+        """
+        self.__refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.__refill(now)
+        self.tokens -= 1
+
+    def __refill(self, now):
+        if self.updated is not None and now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def as_dict(self):
+        return {"rate": self.rate, "capacity": self.capacity, "tokens": self.tokens, "updated": self.updated}
+
+
+class AuthRateLimiter(object):
+    """
+    Meters login attempts per credential and per AAA domain, backing off when logins are rejected.
+    """
+
+    def __init__(self, filename=None, rate=1.0, burst=3, domain_rate=4.0, domain_burst=10, min_rate=0.05,
+                 recovery=0.1, cooldown=5.0, max_cooldown=300.0, max_failures=3, failure_window=600.0, clock=time.time,
+                 sleep=time.sleep):
+        """
+        :param filename: The JSON file to keep the limiter state in between runs.  None keeps it in memory only.
+        :type filename: str
+        :param rate: The most login attempts per second for one credential
+        :type rate: float
+        :param burst: The number of attempts one credential can make at once before the rate applies
+        :type burst: int
+        :param domain_rate: The most login attempts per second for all credentials in one AAA domain
+        :type domain_rate: float
+        :param domain_burst: The number of attempts that can be made at once in one AAA domain
+        :type domain_burst: int
+        :param min_rate: The rates are never backed off below this fraction of their maximum
+        :type min_rate: float
+        :param recovery: Each successful login raises the rates by this fraction of their maximum
+        :type recovery: float
+        :param cooldown: The pause (in seconds) after the first failure in a row, which doubles with each failure
+        :type cooldown: float
+        :param max_cooldown: The longest pause after failures, in seconds
+        :type max_cooldown: float
+        :param max_failures: The number of failures in a row for a credential after which attempts are refused for the
+                             rest of the run
+        :type max_failures: int
+        :param failure_window: A credential's failures are forgotten this many seconds after its pause has ended
+        :type failure_window: float
+        :param clock: The function that returns the current time in seconds
+        :param sleep: The function used to wait, in seconds (for example lambda s: crt.Sleep(s * 1000) in SecureCRT)
+        """
+        self.filename = filename
+        self.limits = {"credential": (rate, burst), "domain": (domain_rate, domain_burst)}
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.credentials = {}
+        # Failures in a row during this run, per credential.  These are what refuse attempts, and aren't saved.
+        self.run_failures = {}
+        self.skipped = []
+        if filename and os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as state_file:
+                    state = json.load(state_file)
+                self.buckets = dict((key, TokenBucket(**value)) for key, value in state["buckets"].items())
+                self.credentials = state["credentials"]
+            except (IOError, ValueError, KeyError, TypeError) as e:
+                logger.debug("<AUTH_LIMIT> Ignoring unreadable state file {0}: {1}".format(filename, e))
+
+    def save(self):
+        if self.filename:
+            save_json(self.filename, {"buckets": dict((key, bucket.as_dict()) for key, bucket in self.buckets.items()),
+                                      "credentials": self.credentials})
+
+    def __bucket(self, kind, name):
+        key = "{0}:{1}".format(kind, name)
+        if key not in self.buckets:
+            rate, burst = self.limits[kind]
+            self.buckets[key] = TokenBucket(rate, burst)
+        return self.buckets[key]
+
+    def __state(self, username, domain):
+        state = self.credentials.setdefault("{0}@{1}".format(username, domain), {"failures": 0, "paused_until": 0})
+        if state["failures"] and self.clock() >= state["paused_until"] + self.failure_window:
+            state["failures"] = 0
+            state["paused_until"] = 0
+        return state
+
+    def __refused(self, username, domain):
+        return self.run_failures.get("{0}@{1}".format(username, domain), 0) >= self.max_failures
+
+    def wait_time(self, username, domain="default"):
+        """
+        :return: The number of seconds until a login attempt with the credential would be allowed (without using up a
+            token), or None if the credential has failed too many times in a row to be tried again.
+        :rtype: float
+        """
+        if self.__refused(username, domain):
+            return None
+        state = self.credentials.get("{0}@{1}".format(username, domain), {"failures": 0, "paused_until": 0})
+        now = self.clock()
+        buckets = [self.__bucket("credential", "{0}@{1}".format(username, domain)), self.__bucket("domain", domain)]
+        return max([state["paused_until"] - now, 0.0] + [bucket.wait_time(now) for bucket in buckets])
+
+    def schedule(self, devices, username_key='Username', domain_key='AAA Domain'):
+        """
+        Orders devices so that the next device is always one that can be logged into soonest.  While the credential or
+        AAA domain of one group of devices is being limited (or paused after failures), devices in the other domains
+        are returned, and the domains take turns while none of them is limited.  Devices whose credential has failed
+        too many times in a row are not returned, and are collected in self.skipped instead.
+
+        The device list is read in full up front, as each device has to be compared with the others.
+
+        :param devices: The device entries, such as those from Script.import_device_list()
+        :type devices: iterable of dict
+        :param username_key: The key of the username in each device entry
+        :type username_key: str
+        :param domain_key: The key of the AAA domain in each device entry.  Devices without one use "default".
+        :type domain_key: str
+
+        :return: A generator of the device entries, in the order they should be connected to.
+        :rtype: generator of dict
+        """
+        queues = OrderedDict()
+        for device in devices:
+            key = (device.get(username_key) or "", device.get(domain_key) or "default")
+            queues.setdefault(key, deque()).append(device)
+        self.skipped = []
+        while queues:
+            waits = [(self.wait_time(username, domain), (username, domain)) for username, domain in queues]
+            for wait, key in waits:
+                if wait is None:
+                    logger.debug("<AUTH_LIMIT> Skipping {0} devices for {1}@{2}".format(len(queues[key]), *key))
+                    self.skipped.extend(queues.pop(key))
+            waits = [(wait, key) for wait, key in waits if wait is not None]
+            if not waits:
+                break
+            # min() keeps the first of equal waits, so rotating the winner to the end makes the domains take turns.
+            key = min(waits, key=lambda item: item[0])[1]
+            queue = queues.pop(key)
+            yield queue.popleft()
+            if queue:
+                queues[key] = queue
+
+    def acquire(self, username, domain="default"):
+        """
+        Waits until a login attempt with the credential is allowed, and uses up a token for it.
+
+        :param username: The username that will be sent
+        :type username: str
+        :param domain: The AAA domain of the device (devices that authenticate against the same servers)
+        :type domain: str
+
+        :return: The number of seconds that were waited
+        :rtype: float
+        """
+        if self.__refused(username, domain):
+            raise AuthLimitError("Login for {0} failed {1} times in a row in {2}.  Not trying again, to avoid locking "
+                                 "the account.".format(username, self.max_failures, domain))
+        state = self.__state(username, domain)
+        buckets = [self.__bucket("credential", "{0}@{1}".format(username, domain)), self.__bucket("domain", domain)]
+        waited = 0.0
+        while True:
+            now = self.clock()
+            delay = max([state["paused_until"] - now] + [bucket.wait_time(now) for bucket in buckets])
+            if delay <= 0:
+                break
+            logger.debug("<AUTH_LIMIT> Waiting {0:.2f}s before logging in as {1} ({2})".format(delay, username, domain))
+            self.sleep(delay)
+            waited += delay
+        for bucket in buckets:
+            bucket.take(now)
+        return waited
+
+    def report(self, username, domain="default", success=True):
+        """
+        Records the result of a login attempt, and adjusts the rates.
+
+        :param username: The username that was sent
+        :type username: str
+        :param domain: The AAA domain of the device
+        :type domain: str
+        :param success: False if the device rejected the credentials
+        :type success: bool
+        """
+        state = self.__state(username, domain)
+        buckets = [("credential", self.__bucket("credential", "{0}@{1}".format(username, domain))),
+                   ("domain", self.__bucket("domain", domain))]
+        for kind, bucket in buckets:
+            maximum = self.limits[kind][0]
+            if success:
+                bucket.rate = min(maximum, bucket.rate + self.recovery * maximum)
+            else:
+                bucket.rate = max(maximum * self.min_rate, bucket.rate / 2)
+        key = "{0}@{1}".format(username, domain)
+        if success:
+            state["failures"] = 0
+            state["paused_until"] = 0
+            self.run_failures.pop(key, None)
+        else:
+            state["failures"] += 1
+            self.run_failures[key] = self.run_failures.get(key, 0) + 1
+            pause = min(self.max_cooldown, self.cooldown * 2 ** (state["failures"] - 1))
+            state["paused_until"] = self.clock() + pause
+            logger.debug("<AUTH_LIMIT> Login as {0} ({1}) rejected, {2} in a row.  Pausing it for {3:.0f}s".format(
+                username, domain, state["failures"], pause))
+
+    def reset(self, username, domain="default"):
+        """
+        Clears the failures of a credential (for example after the user has entered a new password).
+        """
+        self.credentials.pop("{0}@{1}".format(username, domain), None)
+        self.run_failures.pop("{0}@{1}".format(username, domain), None)
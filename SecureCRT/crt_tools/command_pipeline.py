@@ -0,0 +1,231 @@
+"""
+This module sends a batch of show commands to a device in one write, instead of sending each command and waiting for
+the prompt before sending the next one.  Over a slow link each of those waits costs a full round trip plus the time to
+spot the prompt, so a list like "show ver, show int status, show run, show standby brief" pays for four round trips
+where one is enough.
+
+The device handles typed-ahead commands in order, so the data that comes back is the echo of the first command, its
+output, the prompt, the echo of the second command, its output, the prompt, and so on.  The stream is cut at each
+prompt, and every piece is checked against the echoed command it should start with, so that a piece can't be given to
+the wrong command (if the prompt text shows up inside an output, the piece after it doesn't start with the next command,
+and is put back into the output it came from, although the rest of the very last output isn't waited for).  Error
+messages such as "% Invalid input detected at '^' marker." follow the echo of the command that caused them, and are
+reported on that command's result.
+
+Only commands that don't ask questions (show commands) should be pipelined, as a command that asks for confirmation
+would take the next command as its answer.  Paging must be turned off first ("terminal length 0"), or the output will
+stop at the first "--More--".
+
+This is written against the SecureCRT tab object, so it works from the standalone scripts as well as from scripts.py.
+
+Example:
+
+    prompt = learn_prompt(tab)
+    for result in get_command_outputs(tab, ["show ver", "show int status", "show standby brief"], prompt):
+        if result.error:
+            print("{0} failed: {1}".format(result.command, result.error))
+        else:
+            print(result.output)
+"""
+
+import time
+import logging
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The start of the messages a Cisco CLI prints when a command can't be run.
+ERROR_MARKERS = ["% Invalid input", "% Incomplete command", "% Ambiguous command", "% Unknown command",
+                 "% Invalid command", "% Permission denied", "% Command authorization failed", "% Error"]
+
+
+class CommandResult(object):
+    """
+    The output of one command from a pipelined batch.
+    """
+
+    def __init__(self, command, output=None, error=None):
+        """
+        :param command: The command that was sent
+        :type command: str
+        :param output: The output of the command, without the echoed command or the prompt.  None if it timed out.
+        :type output: str
+        :param error: The error message printed by the device for this command, "timeout" if the output didn't
+                      arrive in time, or None if the command ran.
+        :type error: str
+        """
+        self.command = command
+        self.output = output
+        self.error = error
+
+    def __repr__(self):
+        return "CommandResult({0!r}, {1} chars, error={2!r})".format(self.command, len(self.output or ""), self.error)
+
+
+def learn_prompt(tab, endings=("#", ">"), timeout=10):
+    """
+    Sends a blank line and reads back the prompt.
+
+    :param tab: The SecureCRT tab, which must be at the CLI prompt with Screen.Synchronous set to True.
+    :param endings: The characters that can end the prompt
+    :type endings: tuple
+    :param timeout: The number of seconds to wait for the prompt
+    :type timeout: float
+
+    :return: The full prompt, such as "SW1#", or None if no prompt was seen.
+    :rtype: str
+    """
+    tab.Screen.Send("\r")
+    text = tab.Screen.ReadString(list(endings), timeout)
+    if not tab.Screen.MatchIndex:
+        return None
+    lines = text.replace("\r", "\n").split("\n")
+    return lines[-1].strip() + endings[tab.Screen.MatchIndex - 1]
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def _echo_matches(line, command):
+    """
+    :return: True if a line is the echo of the command.  A command longer than the terminal is echoed scrolled, with a
+        "$" where the hidden part is, so only the visible part is compared.
+    :rtype: bool
+    """
+    line = _normalize(line)
+    command = _normalize(command)
+    if line == command:
+        return True
+    visible = line.strip("$ ")
+    return len(visible) >= 10 and (command.startswith(visible) or command.endswith(visible))
+
+
+def find_error(output):
+    """
+    :return: The first error message in the output of a command, or None if there isn't one.
+    :rtype: str
+    """
+    for line in output.splitlines():
+        stripped = line.strip()
+        if any(stripped.startswith(marker) for marker in ERROR_MARKERS):
+            return stripped
+    return None
+
+
+def split_outputs(chunks, commands, prompt, previous=None):
+    """
+    Assigns the pieces of a pipelined stream (the text between each prompt) to the commands that produced them.
+
+    :param chunks: The text read up to each prompt, in order.
+    :type chunks: list of str
+    :param commands: The commands that were sent, in order.
+    :type commands: list of str
+    :param prompt: The prompt the stream was cut at
+    :type prompt: str
+    :param previous: The result of the command sent just before these (from an earlier batch), which any text before
+                     the first echoed command belongs to.
+    :type previous: CommandResult
+
+    :return: A result for each command, in the same order.  Commands with no piece have an output of None.
+    :rtype: list of CommandResult
+    """
+    results = []
+    for chunk in chunks:
+        text = chunk.lstrip("\r\n")
+        first_line, _, rest = text.partition("\n")
+        if len(results) < len(commands) and _echo_matches(first_line.rstrip("\r"), commands[len(results)]):
+            results.append(CommandResult(commands[len(results)], rest))
+        elif results or (previous and previous.output is not None):
+            # The prompt text was part of the output, so this piece belongs to the command before.
+            _finish(results[-1] if results else previous, prompt + chunk)
+        else:
+            logger.debug("<PIPELINE> Discarding text received before the first command: {0!r}".format(chunk[:80]))
+    for result in results:
+        _finish(result)
+    for command in commands[len(results):]:
+        results.append(CommandResult(command, None, "timeout"))
+    return results
+
+
+def _finish(result, more=""):
+    result.output = (result.output + more).replace("\r\n", "\n").rstrip("\n")
+    result.error = find_error(result.output)
+
+
+def send_commands(tab, commands):
+    """
+    Sends the commands in one write, without waiting for any output.  The outputs are read later with read_outputs(),
+    so the device can work on them while the script does something else (such as sending commands to other tabs).
+
+    :param tab: The SecureCRT tab, which must be at the CLI prompt.
+    :param commands: The commands to run.  They must not ask questions (show commands).
+    :type commands: list of str
+    """
+    tab.Screen.Send("".join(command + "\r" for command in commands))
+
+
+def read_outputs(tab, commands, prompt, timeout=30, previous=None):
+    """
+    Reads the outputs of commands that were sent with send_commands().
+
+    :param tab: The SecureCRT tab, with Screen.Synchronous set to True.
+    :param commands: The commands that were sent, in order.
+    :type commands: list of str
+    :param prompt: The full CLI prompt, such as "SW1#" (see learn_prompt())
+    :type prompt: str
+    :param timeout: The number of seconds to wait for each command's output
+    :type timeout: float
+    :param previous: The result of the command sent just before these (see split_outputs()).
+    :type previous: CommandResult
+
+    :return: A result for each command, in the same order.  Commands whose output didn't arrive in time have an error of
+        "timeout".
+    :rtype: list of CommandResult
+    """
+    chunks = []
+    matched = 0
+    while matched < len(commands):
+        chunk = tab.Screen.ReadString(prompt, timeout)
+        if not tab.Screen.MatchIndex:
+            logger.debug("<PIPELINE> Timed out waiting for the output of {0!r}".format(commands[matched]))
+            break
+        chunks.append(chunk)
+        # Only a piece that starts with the echo of the next command counts towards the batch.
+        if _echo_matches(chunk.lstrip("\r\n").partition("\n")[0].rstrip("\r"), commands[matched]):
+            matched += 1
+    return split_outputs(chunks, commands, prompt, previous)
+
+
+def get_command_outputs(tab, commands, prompt, timeout=30, batch_size=10):
+    """
+    Sends the commands in batches (each batch in one write) and returns the output of each command.
+
+    :param tab: The SecureCRT tab, which must be at the CLI prompt with Screen.Synchronous set to True.
+    :param commands: The commands to run.  They must not ask questions (show commands).
+    :type commands: list of str
+    :param prompt: The full CLI prompt, such as "SW1#" (see learn_prompt())
+    :type prompt: str
+    :param timeout: The number of seconds to wait for each command's output
+    :type timeout: float
+    :param batch_size: The number of commands sent together, so that the device's input buffer isn't overrun.
+    :type batch_size: int
+
+    :return: A result for each command, in the same order.
+    :rtype: list of CommandResult
+    """
+    results = []
+    timed_out = False
+    for start in range(0, len(commands), batch_size):
+        if timed_out:
+            # Commands still queued on the device would be mixed up with the next batch, so stop here.
+            results.extend(CommandResult(command, None, "timeout") for command in commands[start:start + batch_size])
+            continue
+        batch = commands[start:start + batch_size]
+        batch_start = time.time()
+        send_commands(tab, batch)
+        batch_results = read_outputs(tab, batch, prompt, timeout, results[-1] if results else None)
+        timed_out = any(result.error == "timeout" for result in batch_results)
+        results.extend(batch_results)
+        logger.debug("<PIPELINE> Ran {0} commands in {1:.2f}s".format(len(batch), time.time() - batch_start))
+    return results
@@ -0,0 +1,47 @@
+"""
+This module builds the command line style arguments of Session.Connect() and Session.ConnectInTab().  SecureCRT splits
+them into words the way Windows splits a command line, so a value with a space or a double quote in it (most often a
+password) has to be quoted and escaped: a double quote in "/PASSWORD "{password}"" ends the password early, and the rest
+of it is read as more arguments.
+
+Example:
+
+    tab = crt.Session.ConnectInTab(ssh2_arguments(username, password, "10.1.1.1"))
+"""
+
+import re
+
+# A run of backslashes followed by a double quote (or the end of the value), the only place backslashes are special.
+_ESCAPES = re.compile(r'(\\*)("|$)')
+
+
+def quote_argument(value):
+    """
+    Quotes a value as a single argument.  Inside the quotes, each double quote is escaped with a backslash, and the
+    backslashes in front of a double quote (or of the closing quote) are doubled so they aren't read as escapes.
+
+    :param value: The value, such as a password
+    :type value: str
+
+    :return: The value in double quotes, escaped
+    :rtype: str
+    """
+    return '"' + _ESCAPES.sub(lambda match: match.group(1) * 2 + ('\\"' if match.group(2) else ''), value) + '"'
+
+
+def ssh2_arguments(username, password, host):
+    """
+    Builds the arguments of an SSH2 connection that logs in with a password and accepts the host key.
+
+    :param username: The username to log in with
+    :type username: str
+    :param password: The password to log in with
+    :type password: str
+    :param host: The hostname or IP address to connect to
+    :type host: str
+
+    :return: The arguments for Session.Connect() or Session.ConnectInTab()
+    :rtype: str
+    """
+    return "/SSH2 /ACCEPTHOSTKEYS /L {0} /PASSWORD {1} {2}".format(quote_argument(username), quote_argument(password),
+                                                                   host)
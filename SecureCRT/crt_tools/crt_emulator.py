@@ -0,0 +1,1231 @@
+"""
+This module contains an emulator for the global "crt" object that SecureCRT injects into every script it runs.  The
+scripts under tools-macs and script-logins call that object directly (crt.GetScriptTab(), Screen.Send(),
+WaitForString(), ReadString(), Session.Log(), Dialog.Prompt(), etc), which means they can normally only be run from
+inside of SecureCRT.  The CrtEmulator class in this module implements those calls against fake devices (either defined
+in code or built from a recorded session transcript), with scripted answers for any dialog windows and a virtual clock
+that advances based on a simple latency model instead of real sleeps.
+
+This allows any of those scripts to be executed, timed and profiled with a plain python installation, and the emulator
+keeps statistics (commands sent, round trips, bytes received, timeouts) that show how chatty a script is with the
+remote device.
+
+Example:
+
+    python crt_emulator.py ../tools-macs/get_mac.py --transcript sw1-capture.log --profile
+"""
+
+import os
+import re
+import sys
+import time
+import runpy
+import logging
+import argparse
+import cProfile
+import pstats
+import contextlib
+import urllib.request
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Return codes used by crt.Dialog.MessageBox()
+IDOK = 1
+IDCANCEL = 2
+IDYES = 6
+IDNO = 7
+
+# Raw GitHub location of this repository.  Scripts that download other scripts from here can be pointed at the local
+# checkout instead when running under the emulator.
+GITHUB_RAW_PREFIX = "https://raw.githubusercontent.com/onkings-mfl/MFL-Scripts/"
+
+
+# ################################################    EXCEPTIONS     ###################################################
+
+
+class EmulatorError(Exception):
+    """
+    An exception type that is raised when a script does something that would hang or fail inside of SecureCRT, such as
+    waiting forever for a string that the device will never send.
+    """
+    pass
+
+
+class EmulatorConnectError(EmulatorError):
+    """
+    An exception type that is raised when a connection attempt fails (unknown host, unsupported protocol or bad
+    credentials).  Inside SecureCRT this is a COM error, and the message is available from crt.GetLastErrorMessage().
+    """
+    pass
+
+
+# ################################################  VIRTUAL CLOCK    ###################################################
+
+
+class VirtualClock(object):
+    """
+    A clock that only moves forward when the emulator tells it to.  Every wait, sleep and command response advances the
+    clock by the amount of time it would have taken against a real device, so that a full script run can be "timed"
+    without actually sleeping.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def time(self):
+        """
+        :return: The current virtual time, in seconds.
+        :rtype: float
+        """
+        return self.now
+
+    def advance(self, seconds):
+        """
+        Moves the clock forward.
+
+        :param seconds: The number of seconds to move forward.  Negative values are ignored.
+        :type seconds: float
+        """
+        if seconds > 0:
+            self.now += seconds
+
+    def advance_to(self, timestamp):
+        """
+        Moves the clock forward to an absolute time, if that time is in the future.
+
+        :param timestamp: The virtual time to move to.
+        :type timestamp: float
+        """
+        if timestamp > self.now:
+            self.now = timestamp
+
+
+class EmulatorStats(object):
+    """
+    Counters that describe how a script interacted with the emulated devices.  A "round trip" is counted any time a
+    script has to wait for data that the device had not finished sending yet, which is the number that matters when
+    running across a high latency link.
+    """
+
+    def __init__(self):
+        self.sends = 0
+        self.commands = 0
+        self.waits = 0
+        self.round_trips = 0
+        self.timeouts = 0
+        self.bytes_received = 0
+        self.connects = 0
+        self.dialogs = 0
+        self.command_log = []
+
+    def as_dict(self):
+        """
+        :return: The counters in this object (without the per-command log) as a dictionary.
+        :rtype: dict
+        """
+        return {"sends": self.sends, "commands": self.commands, "waits": self.waits, "round_trips": self.round_trips,
+                "timeouts": self.timeouts, "bytes_received": self.bytes_received, "connects": self.connects,
+                "dialogs": self.dialogs}
+
+
+# ################################################   FAKE  DEVICES   ###################################################
+
+
+# Pipe filters understood by the fake device, and their accepted abbreviations.
+_PIPE_FILTERS = {
+    "i": "include", "in": "include", "inc": "include", "incl": "include", "include": "include", "grep": "include",
+    "e": "exclude", "ex": "exclude", "exc": "exclude", "excl": "exclude", "exclude": "exclude",
+    "b": "begin", "be": "begin", "beg": "begin", "begin": "begin",
+    "s": "section", "se": "section", "sec": "section", "section": "section",
+    "c": "count", "co": "count", "count": "count",
+}
+
+# A "|" only starts a new filter when a filter name follows it.  Otherwise it is an alternative in the filter's regular
+# expression, as in "show mac address-table | exclude CPU|Po[0-9]".
+_PIPE_SPLIT = re.compile(r"\|(?=\s*(?:{0})(?:\s|$))".format("|".join(sorted(_PIPE_FILTERS, key=len, reverse=True))),
+                         re.I)
+
+_TERMINAL_COMMANDS = re.compile(r"^term(?:inal)?\s+(?:len(?:gth)?|width)\s+\d+$", re.I)
+
+
+def _normalize_command(command):
+    return " ".join(command.split()).lower()
+
+
+class FakeDevice(object):
+    """
+    A simple model of a Cisco-like device CLI.  Commands are mapped to their output (either a string or a function that
+    receives the command and returns a string).  The device understands the common pipe filters (include, exclude,
+    begin, section and count), answers "terminal length/width" silently and returns an IOS style error for unknown
+    commands.
+
+    Response time for each command is modeled as: latency + (output size / bandwidth)
+    """
+
+    def __init__(self, hostname, commands=None, prompt_char="#", username=None, password=None, enable_password=None,
+                 protocols=("ssh2", "ssh1", "telnet"), banner="", latency=0.05, bandwidth=250000.0,
+                 connect_time=1.0):
+        """
+        :param hostname: The hostname shown in the device prompt
+        :type hostname: str
+        :param commands: A dictionary mapping each command to its output (str) or a callable that returns the output.
+        :type commands: dict
+        :param prompt_char: The character that ends the prompt after login ("#" or ">")
+        :type prompt_char: str
+        :param username: If set, the username that must be used to log in.
+        :type username: str
+        :param password: If set, the password that must be used to log in.
+        :type password: str
+        :param enable_password: If set, the password that the "enable" command will ask for.
+        :type enable_password: str
+        :param protocols: The connection protocols this device accepts.
+        :type protocols: tuple
+        :param banner: Text printed after login, before the first prompt.
+        :type banner: str
+        :param latency: Seconds between sending a command and the first byte of the reply.
+        :type latency: float
+        :param bandwidth: Bytes per second the device can send.
+        :type bandwidth: float
+        :param connect_time: Seconds it takes to establish a new connection to this device.
+        :type connect_time: float
+        """
+        self.hostname = hostname
+        self.prompt_char = prompt_char
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.protocols = tuple(p.lower() for p in protocols)
+        self.banner = banner
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.connect_time = connect_time
+        self.commands = {}
+        self.patterns = []
+        self.history = []
+        for command, output in (commands or {}).items():
+            self.add_command(command, output)
+
+    @property
+    def prompt(self):
+        return self.hostname + self.prompt_char
+
+    def add_command(self, command, output):
+        """
+        Adds (or replaces) the output for a command.
+
+        :param command: The command as it would be typed.  Whitespace and case are not significant.
+        :type command: str
+        :param output: The output of the command, or a callable that receives the command and returns the output.
+        :type output: str or callable
+        """
+        self.commands[_normalize_command(command)] = output
+
+    def add_pattern(self, regex, handler):
+        """
+        Adds a handler for any command that matches the regular expression, for commands that take arguments (e.g.
+        "show mac address-table address <mac>").
+
+        :param regex: A regular expression that must match the full (normalized) command
+        :type regex: str
+        :param handler: A callable that receives the re.Match object and returns the output.
+        :type handler: callable
+        """
+        self.patterns.append((re.compile(regex, re.I), handler))
+
+    def response_time(self, output):
+        """
+        :param output: The output that will be returned for a command.
+        :type output: str
+        :return: The number of seconds it takes the device to send the output.
+        :rtype: float
+        """
+        return self.latency + len(output) / float(self.bandwidth)
+
+    def execute(self, command):
+        """
+        Runs a command on the device and returns its output (without the echoed command or the trailing prompt).
+
+        :param command: The command line sent to the device.
+        :type command: str
+        :return: The output of the command
+        :rtype: str
+        """
+        self.history.append(command)
+        line = command.strip()
+        if not line:
+            return ""
+        if _TERMINAL_COMMANDS.match(line):
+            return ""
+
+        # Commands recorded with their filters (e.g. from a transcript) are replayed as-is.
+        output = self._lookup(_normalize_command(line))
+        if output is not None:
+            return output
+
+        parts = _PIPE_SPLIT.split(line)
+        output = self._lookup(_normalize_command(parts[0]))
+        if output is None:
+            return "% Invalid input detected at '^' marker.\n"
+
+        for pipe in parts[1:]:
+            pipe = pipe.strip()
+            name, _, expression = pipe.partition(" ")
+            action = _PIPE_FILTERS.get(name.lower())
+            if action is None:
+                return "% Invalid input detected at '^' marker.\n"
+            output = self._apply_filter(output, action, expression.strip().strip('"'))
+        return output
+
+    def _lookup(self, base):
+        output = self.commands.get(base)
+        if output is None:
+            for regex, handler in self.patterns:
+                match = regex.match(base)
+                if match:
+                    return handler(match)
+            return None
+        if callable(output):
+            return output(base)
+        return output
+
+    @staticmethod
+    def _apply_filter(output, action, expression):
+        lines = output.splitlines()
+        if action == "count":
+            regex = re.compile(expression)
+            return "Number of lines which match regexp = {0}\n".format(sum(1 for l in lines if regex.search(l)))
+        regex = re.compile(expression)
+        if action == "include":
+            kept = [l for l in lines if regex.search(l)]
+        elif action == "exclude":
+            kept = [l for l in lines if not regex.search(l)]
+        elif action == "begin":
+            kept = []
+            for index, l in enumerate(lines):
+                if regex.search(l):
+                    kept = lines[index:]
+                    break
+        else:
+            # "section" keeps every top level block (and its indented children) whose header matches.
+            kept = []
+            keep_block = False
+            for l in lines:
+                if l and not l[0].isspace():
+                    keep_block = bool(regex.search(l))
+                    if keep_block:
+                        kept.append(l)
+                elif keep_block or regex.search(l):
+                    kept.append(l)
+        return "\n".join(kept) + ("\n" if kept else "")
+
+    @classmethod
+    def from_transcript(cls, transcript, hostname=None, **kwargs):
+        """
+        Builds a fake device from a recorded session (such as a SecureCRT session log).  Every line that begins with the
+        device prompt is treated as a command, and everything up to the next prompt is treated as that command's output.
+
+        :param transcript: The full text of the recorded session.
+        :type transcript: str
+        :param hostname: The hostname of the device.  If not given, it is detected from the most common prompt.
+        :type hostname: str
+        :return: A FakeDevice that replays the commands found in the transcript.
+        :rtype: FakeDevice
+        """
+        lines = transcript.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        prompt_re = re.compile(r"^([A-Za-z0-9_.:/()\-]+)([#>])(.*)$")
+        if not hostname:
+            counts = {}
+            for line in lines:
+                match = prompt_re.match(line)
+                if match:
+                    counts[match.group(1)] = counts.get(match.group(1), 0) + 1
+            if not counts:
+                raise EmulatorError("Could not find a device prompt in the transcript.")
+            hostname = max(counts, key=counts.get)
+
+        line_re = re.compile(r"^{0}([#>])(.*)$".format(re.escape(hostname)))
+        device = None
+        command = None
+        output = []
+        for line in lines:
+            match = line_re.match(line)
+            if match:
+                if device is None:
+                    device = cls(hostname, prompt_char=match.group(1), **kwargs)
+                if command:
+                    device.add_command(command, "\n".join(output) + "\n" if output else "")
+                command = match.group(2).strip()
+                output = []
+            elif command is not None:
+                output.append(line)
+        if device is None:
+            raise EmulatorError("Could not find prompt for '{0}' in the transcript.".format(hostname))
+        if command:
+            device.add_command(command, "\n".join(output) + "\n" if output else "")
+        return device
+
+
+class _Terminal(object):
+    """
+    The remote end of a connected tab.  Keeps track of which device is currently at the other end (devices can be
+    stacked when the script uses "ssh" from one device's CLI to reach another), and handles the interactive username,
+    password and enable prompts.
+    """
+
+    def __init__(self, device, network, login_required=False):
+        self.network = network
+        self.stack = [device]
+        self.state = None
+        self.state_data = {}
+        self.connected = True
+        if login_required:
+            self.state = "username"
+
+    @property
+    def device(self):
+        return self.stack[-1]
+
+    @property
+    def echo(self):
+        return self.state not in ("password", "hop_password", "enable_password")
+
+    def greeting(self):
+        """
+        :return: The text shown right after connecting.
+        :rtype: str
+        """
+        if self.state == "username":
+            return "\r\nUser Access Verification\r\n\r\nUsername: "
+        return self._after_login(self.device)
+
+    def _after_login(self, device):
+        banner = device.banner.replace("\n", "\r\n") if device.banner else ""
+        return "{0}\r\n{1}".format(banner, device.prompt)
+
+    def submit(self, line):
+        """
+        Handles one line of input from the script.
+
+        :param line: The line typed by the script (without the trailing carriage return)
+        :type line: str
+        :return: A tuple of (output text, device that produced it)
+        :rtype: tuple
+        """
+        device = self.device
+        if self.state == "username":
+            self.state_data["username"] = line
+            self.state = "password"
+            return "\r\nPassword: ", device
+        if self.state == "password":
+            self.state = None
+            if device.username and (self.state_data.get("username") != device.username or line != device.password):
+                self.state = "username"
+                return "\r\n% Authentication failed\r\n\r\nUsername: ", device
+            return self._after_login(device), device
+        if self.state == "enable_password":
+            self.state = None
+            if device.enable_password is not None and line != device.enable_password:
+                return "\r\n% Bad secrets\r\n\r\n{0}".format(device.prompt), device
+            device.prompt_char = "#"
+            return "\r\n{0}".format(device.prompt), device
+        if self.state == "hop_password":
+            self.state = None
+            target = self.state_data.pop("target")
+            if target.password is not None and line != target.password:
+                return "\r\n% Authentication failed\r\n{0}".format(device.prompt), device
+            self.stack.append(target)
+            return self._after_login(target), target
+
+        stripped = line.strip()
+        lowered = stripped.lower()
+        if lowered in ("en", "enable") and device.prompt_char == ">":
+            self.state = "enable_password"
+            return "\r\nPassword: ", device
+        if lowered in ("exit", "quit", "logout"):
+            self.stack.pop()
+            if not self.stack:
+                self.connected = False
+                return "\r\n", device
+            return "\r\n\r\n[Connection to {0} closed by foreign host]\r\n{1}".format(
+                device.hostname, self.device.prompt), self.device
+        hop = re.match(r"^ssh\s+(?:-l\s+(\S+)\s+)?(?:\S+@)?(\S+)$", stripped)
+        if hop and hop.group(2) in self.network:
+            target = self.network[hop.group(2)]
+            self.state = "hop_password"
+            self.state_data["target"] = target
+            return "\r\nPassword: ", device
+
+        output = device.execute(line)
+        output = output.replace("\r\n", "\n").replace("\n", "\r\n")
+        if output and not output.endswith("\r\n"):
+            output += "\r\n"
+        return "\r\n{0}{1}".format(output, device.prompt), device
+
+
+def _unquote(token):
+    # Undo the quoting of a command line argument, the way Windows does it: backslashes are only escapes in front of a
+    # double quote (or the closing quote)
+    if len(token) < 2 or not token.startswith('"') or not token.endswith('"'):
+        return token
+    return re.sub(r'(\\+)("|$)', lambda match: match.group(1)[:len(match.group(1)) // 2] + match.group(2), token[1:-1])
+
+
+# ################################################  CRT API OBJECTS  ###################################################
+
+
+class Screen(object):
+    """
+    Emulates the SecureCRT Screen object for one tab.  Data sent by the device is held in a pending buffer (with the
+    virtual time it becomes available) until the script consumes it with one of the WaitFor or ReadString methods.
+    Consumed data is rendered onto a small virtual screen so that CurrentRow, CurrentColumn and Get() behave like they do
+    inside SecureCRT, and is written to the session log file when logging is enabled.
+    """
+
+    def __init__(self, tab, rows=50, columns=132):
+        self._tab = tab
+        self.Rows = rows
+        self.Columns = columns
+        self.Synchronous = False
+        self.IgnoreEscape = False
+        self.MatchIndex = 0
+        self._pending = ""
+        # List of [end_offset, available_at] for each chunk of data in _pending
+        self._arrivals = []
+        self._lines = [""]
+        self._col = 0
+        self._typed = ""
+        self._skip_lf = False
+
+    @property
+    def CurrentRow(self):
+        return len(self._lines)
+
+    @property
+    def CurrentColumn(self):
+        return self._col + 1
+
+    # ---- Data from the device ----
+
+    def _receive(self, text, available_at):
+        if not text:
+            return
+        if self._arrivals:
+            # Data always arrives in the order it was sent.
+            available_at = max(available_at, self._arrivals[-1][1])
+        self._pending += text
+        self._arrivals.append([len(self._pending), available_at])
+        self._tab._crt.stats.bytes_received += len(text)
+
+    def _consume(self, length):
+        """
+        Removes the first 'length' characters from the pending buffer, renders them on the screen and advances the clock
+        to the time the last of those characters arrived.
+        """
+        clock = self._tab._crt.clock
+        text = self._pending[:length]
+        self._pending = self._pending[length:]
+
+        # The consumed text is available once the chunk holding its last character has arrived.
+        arrived = None
+        remaining = []
+        for end, available_at in self._arrivals:
+            if arrived is None and end >= length and length:
+                arrived = available_at
+            if end > length:
+                remaining.append([end - length, available_at])
+        self._arrivals = remaining
+
+        if arrived is not None and arrived > clock.now:
+            self._tab._crt.stats.round_trips += 1
+            clock.advance_to(arrived)
+        self._render(text)
+        self._tab.Session._write_log(text)
+        return text
+
+    def _render(self, text):
+        # Only the tail of the text can still be on the screen, so don't waste time rendering anything else.
+        if text.count("\n") > self.Rows:
+            tail = text.split("\n")[-self.Rows:]
+            self._lines = [""]
+            self._col = 0
+            text = "\n".join(tail)
+        for char in text:
+            if char == "\n":
+                self._lines.append("")
+                self._col = 0
+            elif char == "\r":
+                self._col = 0
+            elif char == "\b":
+                self._col = max(0, self._col - 1)
+            else:
+                line = self._lines[-1]
+                if self._col < len(line):
+                    line = line[:self._col] + char + line[self._col + 1:]
+                else:
+                    line = line + " " * (self._col - len(line)) + char
+                self._lines[-1] = line
+                self._col += 1
+        if len(self._lines) > self.Rows:
+            self._lines = self._lines[-self.Rows:]
+
+    def _available(self):
+        """
+        :return: The pending data that has arrived by the current virtual time.
+        """
+        now = self._tab._crt.clock.now
+        end = 0
+        for offset, available_at in self._arrivals:
+            if available_at <= now:
+                end = offset
+            else:
+                break
+        return self._pending[:end]
+
+    # ---- Script facing API ----
+
+    def Send(self, text, synchronous=False):
+        """
+        Sends text to the remote device, exactly like typing it.  Each carriage return (or line feed) submits the typed
+        line to the device.
+        """
+        crt = self._tab._crt
+        crt.stats.sends += 1
+        terminal = self._tab._terminal
+        if terminal is None or not self._tab.Session.Connected:
+            raise EmulatorError("Screen.Send() called on a tab that is not connected.")
+        echo = []
+
+        def flush_echo():
+            if echo:
+                self._receive("".join(echo), crt.clock.now + terminal.device.latency)
+                del echo[:]
+
+        for char in text:
+            if char in "\r\n":
+                if char == "\n" and self._skip_lf:
+                    self._skip_lf = False
+                    continue
+                self._skip_lf = char == "\r"
+                flush_echo()
+                line = self._typed
+                self._typed = ""
+                self._submit(line)
+                if not terminal.connected:
+                    break
+                continue
+            self._skip_lf = False
+            if char == "\b":
+                if self._typed:
+                    self._typed = self._typed[:-1]
+                    if terminal.echo:
+                        echo.append("\b \b")
+            elif char == "\x03":
+                # Ctrl-C discards the current line and re-prints the prompt.
+                self._typed = ""
+                echo.append("^C\r\n" + terminal.device.prompt)
+            else:
+                self._typed += char
+                if terminal.echo:
+                    echo.append(char)
+        flush_echo()
+
+    def _submit(self, line):
+        crt = self._tab._crt
+        terminal = self._tab._terminal
+        crt.stats.commands += 1
+        depth = len(terminal.stack)
+        output, device = terminal.submit(line)
+        # The reply starts after the last queued data (the device handles typed-ahead commands in order)
+        start = crt.clock.now
+        if self._arrivals:
+            start = max(start, self._arrivals[-1][1])
+        available_at = start + device.response_time(output)
+        # A device reached with ssh from another one is relayed through every device before it, and logging in to it
+        # takes as long as a new connection would.
+        available_at += sum(upstream.latency for upstream in terminal.stack[:-1])
+        if len(terminal.stack) > depth:
+            available_at += device.connect_time
+        crt.stats.command_log.append({"host": device.hostname, "command": line, "bytes": len(output),
+                                      "sent_at": crt.clock.now, "available_at": available_at})
+        self._receive(output, available_at)
+
+    def _wait(self, strings, timeout, read):
+        crt = self._tab._crt
+        crt.stats.waits += 1
+        if isinstance(strings, str):
+            strings = [strings]
+        best = None
+        for index, string in enumerate(strings):
+            position = self._pending.find(string)
+            if position != -1 and (best is None or position < best[0]):
+                best = (position, index, string)
+
+        if best is None:
+            self.MatchIndex = 0
+            crt.stats.timeouts += 1
+            if not timeout:
+                raise EmulatorError("Script would wait forever for {0!r} on tab {1} ({2!r} is on the screen)"
+                                    .format(strings, self._tab.Index, self._lines[-1]))
+            # Everything the device sent during the timeout is consumed (and displayed) by SecureCRT.
+            crt.clock.advance(timeout)
+            available = self._available()
+            self._consume(len(available))
+            return "" if read else 0
+
+        position, index, string = best
+        end = position + len(string)
+        if timeout:
+            # A match that arrives after the timeout is a timeout in SecureCRT as well.
+            arrival = None
+            for offset, available_at in self._arrivals:
+                if offset >= end:
+                    arrival = available_at
+                    break
+            if arrival is not None and arrival > crt.clock.now + timeout:
+                self.MatchIndex = 0
+                crt.stats.timeouts += 1
+                crt.clock.advance(timeout)
+                self._consume(len(self._available()))
+                return "" if read else 0
+
+        self.MatchIndex = index + 1
+        text = self._consume(end)
+        if read:
+            return text[:position]
+        return index + 1
+
+    def WaitForString(self, string, timeout=0, bCaseInsensitive=False):
+        """
+        Waits for the string to be sent by the device.  Returns True if found, False if the timeout was reached.
+        """
+        return bool(self._wait([string], timeout, read=False))
+
+    def WaitForStrings(self, strings, timeout=0, bCaseInsensitive=False):
+        """
+        Waits for any of the strings.  Returns the (1-based) index of the string that was found, or 0 on timeout.
+        """
+        return self._wait(strings, timeout, read=False)
+
+    def ReadString(self, strings, timeout=0, bCaseInsensitive=False):
+        """
+        Captures everything sent by the device until one of the strings is found (the matched string is not returned).
+        Returns an empty string on timeout.
+        """
+        return self._wait(strings, timeout, read=True)
+
+    def Get(self, row1, col1, row2, col2):
+        """
+        Returns the text on the screen between the two positions, with the rows joined together.
+        """
+        return "".join(self._get_rows(row1, col1, row2, col2))
+
+    def Get2(self, row1, col1, row2, col2):
+        """
+        Returns the text on the screen between the two positions, with each row on its own line.
+        """
+        return "\r\n".join(self._get_rows(row1, col1, row2, col2))
+
+    def _get_rows(self, row1, col1, row2, col2):
+        rows = []
+        for row in range(row1, row2 + 1):
+            line = self._lines[row - 1] if 0 < row <= len(self._lines) else ""
+            rows.append(line.ljust(col2)[col1 - 1:col2])
+        return rows
+
+    def Clear(self):
+        self._lines = [""]
+        self._col = 0
+
+
+class Session(object):
+    """
+    Emulates the SecureCRT Session object for one tab (connection state and session logging).
+    """
+
+    def __init__(self, tab):
+        self._tab = tab
+        self.LogFileName = ""
+        self.Logging = False
+        self._log_file = None
+
+    @property
+    def Connected(self):
+        terminal = self._tab._terminal
+        return bool(terminal and terminal.connected and self._tab._crt.clock.now >= self._tab._connected_at)
+
+    @property
+    def RemoteAddress(self):
+        """
+        The address the tab connected to (the first device, not any device reached from it with ssh/telnet).
+        """
+        terminal = self._tab._terminal
+        return terminal.stack[0].hostname if terminal else ""
+
+    def Log(self, start, append=False, raw=False):
+        """
+        Starts or stops logging everything that is displayed in this tab to the file in LogFileName.
+        """
+        if start and not self.Logging:
+            if not self.LogFileName:
+                raise EmulatorError("Session.Log(True) called without setting Session.LogFileName")
+            self._log_file = open(self.LogFileName, "a" if append else "w", newline="")
+            self.Logging = True
+        elif not start and self.Logging:
+            self._log_file.close()
+            self._log_file = None
+            self.Logging = False
+
+    def _write_log(self, text):
+        if self.Logging and text:
+            self._log_file.write(text)
+
+    def Connect(self, arguments, wait_for_connect=True, timeout=30):
+        """
+        Connects this tab using SecureCRT command line style arguments (e.g. "/SSH2 /L user /PASSWORD pw host").  With
+        wait_for_connect set to False, the tab is still connecting when this returns, and a failed connection doesn't
+        raise (the tab just never becomes Connected).
+        """
+        self._tab._crt._connect(self._tab, arguments, wait_for_connect)
+
+    def ConnectInTab(self, arguments, wait_for_connect=True, timeout=30):
+        """
+        Opens a new tab and connects it using SecureCRT command line style arguments (see Connect()).
+
+        :return: The new Tab object
+        """
+        return self._tab._crt._open_tab(arguments, wait_for_connect)
+
+    def Disconnect(self):
+        if self._tab._terminal:
+            self._tab._terminal.connected = False
+        self.Log(False)
+
+    def WaitForConnected(self, timeout=0):
+        """
+        Waits for a connection started without waiting for it to finish.  Returns True once the tab is connected, False
+        if the connection failed or the timeout was reached.
+        """
+        tab = self._tab
+        clock = tab._crt.clock
+        if tab._terminal is not None and tab._terminal.connected:
+            ready_at = tab._connected_at
+        elif tab._failed_at is not None:
+            ready_at = tab._failed_at
+        else:
+            return False
+        if timeout and ready_at > clock.now + timeout:
+            clock.advance(timeout)
+            return False
+        clock.advance_to(ready_at)
+        return self.Connected
+
+
+class Tab(object):
+    """
+    Emulates a SecureCRT Tab object.
+    """
+
+    def __init__(self, crt, index):
+        self._crt = crt
+        self._terminal = None
+        # The virtual time the connection is up (or fails), for a tab connected without waiting for it
+        self._connected_at = 0.0
+        self._failed_at = None
+        self.Index = index
+        self.Caption = ""
+        self.Screen = Screen(self)
+        self.Session = Session(self)
+
+    def Activate(self):
+        self._crt._active = self
+
+    def Close(self):
+        self.Session.Disconnect()
+        self._crt._tabs = [tab for tab in self._crt._tabs if tab is not self]
+        for position, tab in enumerate(self._crt._tabs):
+            tab.Index = position + 1
+        if self._crt._active is self and self._crt._tabs:
+            self._crt._active = self._crt._tabs[0]
+
+
+class Dialog(object):
+    """
+    Emulates crt.Dialog, answering prompts from a script of answers instead of a pop-up window.
+
+    Answers are looked up in this order:
+    1) 'rules' - a dictionary mapping a substring of the prompt message to the answer to give
+    2) 'answers' - a list of answers given in order, one per Prompt() call
+    3) The default value passed to Prompt()
+
+    Every dialog the script opens is recorded in 'history'.
+    """
+
+    def __init__(self, crt, answers=None, rules=None, message_box_answers=None):
+        self._crt = crt
+        self.answers = list(answers or [])
+        self.rules = dict(rules or {})
+        self.message_box_answers = list(message_box_answers or [])
+        self.history = []
+
+    def _rule(self, message):
+        for key, value in self.rules.items():
+            if key in message:
+                return value
+        return None
+
+    def Prompt(self, message, title="", default="", isPassword=False):
+        self._crt.stats.dialogs += 1
+        answer = self._rule(message)
+        if answer is None:
+            answer = self.answers.pop(0) if self.answers else default
+        self.history.append(("Prompt", message, answer))
+        return answer
+
+    def MessageBox(self, message, title="", buttons=0):
+        self._crt.stats.dialogs += 1
+        answer = self._rule(message)
+        if answer is None:
+            answer = self.message_box_answers.pop(0) if self.message_box_answers else IDOK
+        self.history.append(("MessageBox", message, answer))
+        logger.debug("<EMULATOR> MessageBox: {0}".format(message))
+        return answer
+
+    def FileOpenDialog(self, title, button_label="Open", default_filename="", file_filter=""):
+        self._crt.stats.dialogs += 1
+        answer = self._rule(title)
+        if answer is None:
+            answer = os.path.join(self._crt.work_dir, default_filename) if default_filename else ""
+        self.history.append(("FileOpenDialog", title, answer))
+        return answer
+
+
+class Clipboard(object):
+    """
+    Emulates crt.Clipboard.
+    """
+
+    def __init__(self, text=""):
+        self.Text = text
+
+
+class CrtEmulator(object):
+    """
+    A replacement for the global "crt" object that SecureCRT provides to scripts.
+
+    The emulator starts with a single tab (the "script tab") connected to 'device'.  Additional devices that the script
+    may connect to (with Session.ConnectInTab() or by using "ssh" from a device CLI) are looked up by hostname/IP in
+    'network'.
+    """
+
+    def __init__(self, device=None, network=None, script_path="", answers=None, rules=None, message_box_answers=None,
+                 clipboard="", work_dir=None, clock=None, login_required=False):
+        """
+        :param device: The device the script tab is connected to when the script starts (None for a disconnected tab)
+        :type device: FakeDevice
+        :param network: A dictionary mapping IPs/hostnames to FakeDevice objects that the script can connect to.
+        :type network: dict
+        :param script_path: The value returned by crt.ScriptFullName
+        :type script_path: str
+        :param answers: Answers given, in order, to crt.Dialog.Prompt()
+        :type answers: list
+        :param rules: Answers given to any dialog whose message contains the key.
+        :type rules: dict
+        :param message_box_answers: Return codes given, in order, to crt.Dialog.MessageBox()
+        :type message_box_answers: list
+        :param clipboard: The initial text in crt.Clipboard
+        :type clipboard: str
+        :param work_dir: The directory where files chosen in a FileOpenDialog are placed by default.
+        :type work_dir: str
+        :param clock: The clock shared by all tabs.  A new VirtualClock is created if not provided.
+        :type clock: VirtualClock
+        :param login_required: If True, the script tab starts at a "Username:" prompt instead of the device prompt.
+        :type login_required: bool
+        """
+        self.clock = clock or VirtualClock()
+        self.stats = EmulatorStats()
+        self.network = dict(network or {})
+        self.ScriptFullName = os.path.abspath(script_path) if script_path else ""
+        self.Dialog = Dialog(self, answers, rules, message_box_answers)
+        self.Clipboard = Clipboard(clipboard)
+        self.work_dir = work_dir or os.getcwd()
+        self.Arguments = []
+        self._last_error = ""
+        self._tabs = []
+        self._active = None
+
+        tab = self._new_tab()
+        if device is not None:
+            self.network.setdefault(device.hostname, device)
+            self._attach(tab, device, login_required=login_required, charge_connect=False)
+            # Whatever was on the screen when the script was launched has already been displayed.
+            tab.Screen._consume(len(tab.Screen._pending))
+        self._script_tab = tab
+
+    # ---- Script facing API ----
+
+    @property
+    def Screen(self):
+        return self._active.Screen
+
+    @property
+    def Session(self):
+        return self._active.Session
+
+    @property
+    def Window(self):
+        return self
+
+    def GetScriptTab(self):
+        return self._script_tab
+
+    def GetActiveTab(self):
+        return self._active
+
+    def GetTab(self, index):
+        return self._tabs[index - 1]
+
+    def GetTabCount(self):
+        return len(self._tabs)
+
+    def GetLastErrorMessage(self):
+        return self._last_error
+
+    def Sleep(self, milliseconds):
+        self.clock.advance(milliseconds / 1000.0)
+
+    def Quit(self):
+        raise SystemExit(0)
+
+    # ---- Helpers ----
+
+    def _new_tab(self):
+        tab = Tab(self, len(self._tabs) + 1)
+        self._tabs.append(tab)
+        self._active = tab
+        return tab
+
+    def _attach(self, tab, device, login_required=False, charge_connect=True):
+        tab._terminal = _Terminal(device, self.network, login_required=login_required)
+        tab.Caption = device.hostname
+        start = self.clock.now + (device.connect_time if charge_connect else 0)
+        tab.Screen._receive(tab._terminal.greeting(), start)
+
+    @staticmethod
+    def parse_arguments(arguments):
+        """
+        Parses SecureCRT command line style connection arguments.
+
+        :param arguments: The connection arguments (e.g. '/SSH2 /ACCEPTHOSTKEYS /L user /PASSWORD pw 10.1.1.1')
+        :type arguments: str
+        :return: A dictionary with the protocol, host, username, password, session and firewall values.
+        :rtype: dict
+        """
+        tokens = re.findall(r'/FIREWALL=Session:"[^"]*"|"(?:[^"\\]|\\.)*"|\S+', arguments)
+        result = {"protocol": None, "host": None, "username": None, "password": None, "session": None,
+                  "firewall": None}
+        position = 0
+        while position < len(tokens):
+            token = tokens[position]
+            upper = token.upper()
+            if upper.startswith("/FIREWALL="):
+                result["firewall"] = token.split(":", 1)[1].strip('"')
+            elif upper in ("/SSH2", "/SSH1", "/TELNET", "/RAW", "/SERIAL"):
+                result["protocol"] = upper[1:].lower()
+            elif upper in ("/L", "/PASSWORD", "/S", "/P") and position + 1 < len(tokens):
+                value = _unquote(tokens[position + 1])
+                key = {"/L": "username", "/PASSWORD": "password", "/S": "session", "/P": "port"}[upper]
+                result[key] = value
+                position += 1
+            elif not token.startswith("/"):
+                result["host"] = _unquote(token)
+            position += 1
+        return result
+
+    def _connect(self, tab, arguments, wait=True):
+        self.stats.connects += 1
+        options = self.parse_arguments(arguments)
+        host = options["host"] or options["session"]
+        device = self.network.get(host)
+        protocol = options["protocol"] or "ssh2"
+        error = None
+        if device is None:
+            error, delay = "Unable to connect to {0}: host unreachable".format(host), 10
+        elif protocol not in device.protocols:
+            error = "Unable to connect to {0}: {1} connection refused".format(host, protocol.upper())
+            delay = device.connect_time
+        elif protocol.startswith("ssh") and device.username and options["password"] is not None and \
+                (options["username"] != device.username or options["password"] != device.password):
+            error, delay = "Authentication failed for {0}@{1}".format(options["username"], host), device.connect_time
+        if error:
+            self._last_error = error
+            if not wait:
+                # The tab stays open and never connects, like SecureCRT when the script doesn't wait for the connection
+                tab._failed_at = self.clock.now + delay
+                return
+            self.clock.advance(delay)
+            raise EmulatorConnectError(error)
+        self._attach(tab, device, login_required=(protocol == "telnet" and device.username is not None))
+        if not wait:
+            tab._connected_at = self.clock.now + device.connect_time
+
+    def _open_tab(self, arguments, wait=True):
+        tab = self._new_tab()
+        try:
+            self._connect(tab, arguments, wait)
+        except EmulatorConnectError:
+            tab.Close()
+            raise
+        return tab
+
+
+# ################################################   SCRIPT RUNNER   ###################################################
+
+
+class RunResult(object):
+    """
+    The results of running a script under the emulator.
+    """
+
+    def __init__(self, crt, script_globals, wall_time, error=None, profile=None):
+        self.crt = crt
+        self.script_globals = script_globals
+        self.wall_time = wall_time
+        self.virtual_time = crt.clock.now
+        self.stats = crt.stats
+        self.error = error
+        self.profile = profile
+
+    def summary(self):
+        """
+        :return: A human readable summary of the run.
+        :rtype: str
+        """
+        lines = ["Wall time:      {0:.4f}s".format(self.wall_time),
+                 "Virtual time:   {0:.2f}s".format(self.virtual_time)]
+        for key, value in sorted(self.stats.as_dict().items()):
+            lines.append("{0:<15} {1}".format(key + ":", value))
+        if self.error:
+            lines.append("Error:          {0!r}".format(self.error))
+        return "\n".join(lines)
+
+
+class _LocalResponse(object):
+    def __init__(self, path):
+        self._file = open(path, "rb")
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+@contextlib.contextmanager
+def local_github(repo_root):
+    """
+    A context manager that redirects urllib downloads of files from this repository on GitHub (like the login script
+    that get_mac_tracker.py downloads) to the local checkout, so runs are offline and repeatable.
+
+    :param repo_root: The path to the root of the local repository.
+    :type repo_root: str
+    """
+    original = urllib.request.urlopen
+
+    def urlopen(url, *args, **kwargs):
+        full_url = url.full_url if isinstance(url, urllib.request.Request) else url
+        if full_url.startswith(GITHUB_RAW_PREFIX):
+            path = full_url[len(GITHUB_RAW_PREFIX):].split("?")[0]
+            # Strip the branch name (either "main/" or "refs/heads/main/")
+            if path.startswith("refs/heads/"):
+                path = path[len("refs/heads/"):]
+            path = path.split("/", 1)[1]
+            return _LocalResponse(os.path.join(repo_root, *path.split("/")))
+        return original(url, *args, **kwargs)
+
+    urllib.request.urlopen = urlopen
+    try:
+        yield
+    finally:
+        urllib.request.urlopen = original
+
+
+def run_script(script_path, crt, profile=False, offline=True):
+    """
+    Runs a SecureCRT script against the emulator.  The script is executed the same way SecureCRT executes it: as the
+    main module, with "crt" available as a global.
+
+    :param script_path: The path to the script to run.
+    :type script_path: str
+    :param crt: The emulator to provide as the global "crt" object.
+    :type crt: CrtEmulator
+    :param profile: If True, the run is profiled with cProfile and the stats are included in the result.
+    :type profile: bool
+    :param offline: If True, downloads from this repository on GitHub are served from the local checkout.
+    :type offline: bool
+    :return: The results of the run.
+    :rtype: RunResult
+    """
+    script_path = os.path.abspath(script_path)
+    if not crt.ScriptFullName:
+        crt.ScriptFullName = script_path
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    profiler = cProfile.Profile() if profile else None
+    script_globals = None
+    error = None
+
+    # Keep any caches the script writes (see host_cache.py) out of the user's real cache directory.
+    original_cache_dir = os.environ.get("SECURECRT_CACHE_DIR")
+    os.environ["SECURECRT_CACHE_DIR"] = os.path.join(crt.work_dir, "cache")
+
+    with local_github(repo_root) if offline else contextlib.suppress():
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            script_globals = runpy.run_path(script_path, init_globals={"crt": crt}, run_name="__main__")
+        except SystemExit:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            if profiler:
+                profiler.disable()
+        wall_time = time.perf_counter() - start
+
+    if original_cache_dir is None:
+        del os.environ["SECURECRT_CACHE_DIR"]
+    else:
+        os.environ["SECURECRT_CACHE_DIR"] = original_cache_dir
+    for tab in crt._tabs:
+        tab.Session.Log(False)
+    return RunResult(crt, script_globals, wall_time, error=error,
+                     profile=pstats.Stats(profiler) if profiler else None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a SecureCRT script against an emulated device.")
+    parser.add_argument("script", help="The SecureCRT script to run")
+    parser.add_argument("--transcript", required=True, help="A recorded session log to build the device from")
+    parser.add_argument("--hostname", help="Hostname in the transcript prompt (detected if not given)")
+    parser.add_argument("--answer", action="append", default=[], help="Answer for the next Dialog.Prompt() call")
+    parser.add_argument("--clipboard", default="", help="Initial clipboard text")
+    parser.add_argument("--latency", type=float, default=0.05, help="Device latency in seconds")
+    parser.add_argument("--profile", action="store_true", help="Profile the run and print the top functions")
+    args = parser.parse_args(argv)
+
+    with open(args.transcript, "r") as transcript:
+        device = FakeDevice.from_transcript(transcript.read(), hostname=args.hostname, latency=args.latency)
+    crt = CrtEmulator(device, script_path=args.script, answers=args.answer, clipboard=args.clipboard)
+    result = run_script(args.script, crt, profile=args.profile)
+    print(result.summary())
+    if result.profile:
+        result.profile.sort_stats("cumulative").print_stats(25)
+    return 1 if result.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
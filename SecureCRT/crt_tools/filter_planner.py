@@ -0,0 +1,263 @@
+"""
+This module narrows show commands on the device side.  Many scripts pull a full output (the whole MAC address table, the
+whole running config) only to throw most of it away, and every one of those bytes has to cross the WAN link and go
+through the SecureCRT screen.  Instead, a script declares which rows it needs in a Query, and the planner rewrites the
+command with the filters the device's OS can apply itself (an "interface" argument, "| section", "| include" or
+"| exclude").  Whatever the OS can't do on the device is applied locally to the output, so the rows returned are the
+same whichever OS the command is planned for.
+
+Filters are written as regular expressions in the subset that both Python and the Cisco CLI understand (literal text,
+".", "\\.", "[...]", "*", "+", "?", "^", "$" and "|" for alternatives).  A pattern that uses anything else (such as "\\d"
+or "\\s") is only applied locally.
+
+What each OS can do:
+
+- IOS / IOS-XE allow a single pipe, so the most selective filter is pushed to the device (section, then include, then
+  exclude) and the others are applied locally.
+- NX-OS allows several pipes, so all of the filters are pushed.  A "|" in a pattern would start another pipe, so
+  patterns with alternatives are quoted.
+- ASA and IOS-XR allow a single pipe, and have no "| section".
+
+The OS of a switch can be told from its answer to OS_PROBE_COMMAND, with os_type_from_probe().
+
+Example:
+
+    query = Query("show mac address-table", exclude=["CPU|Switch|Po[0-9]|Vl[0-9]"])
+    planned = plan(query, os_type_from_probe(get_output(OS_PROBE_COMMAND)))
+    output = planned.apply(get_output(planned.command))
+
+    # The interfaces with a DHCP relay, instead of the whole running config (for update_dhcp_relay)
+    query = Query("show running-config", section="^interface", section_contains="ip helper-address")
+"""
+
+import re
+import logging
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The number of pipes each OS allows in a command (None for no limit) and whether it supports "| section".
+CAPABILITIES = {
+    "ios": {"pipes": 1, "section": True},
+    "iosxe": {"pipes": 1, "section": True},
+    "nxos": {"pipes": None, "section": True},
+    "asa": {"pipes": 1, "section": False},
+    "ios-xr": {"pipes": 1, "section": False},
+}
+
+# How each command is narrowed down to one interface.  Commands that aren't listed are filtered locally.
+INTERFACE_COMMANDS = {
+    "show mac address-table": "show mac address-table interface {0}",
+    "show running-config": "show running-config interface {0}",
+    "show interfaces": "show interfaces {0}",
+    "show interfaces description": "show interfaces {0} description",
+    "show cdp neighbors detail": "show cdp neighbors {0} detail",
+    "show lldp neighbors detail": "show lldp neighbors {0} detail",
+}
+# NX-OS uses different syntax for some of them.
+NXOS_INTERFACE_COMMANDS = {
+    "show interfaces": "show interface {0}",
+    "show interfaces description": "show interface {0} description",
+    "show cdp neighbors detail": "show cdp neighbors interface {0} detail",
+    "show lldp neighbors detail": "show lldp neighbors interface {0} detail",
+}
+
+# A command that IOS and IOS-XE accept and NX-OS rejects (it calls it "show port-channel summary"), to tell them apart.
+OS_PROBE_COMMAND = "show etherchannel summary"
+
+# Regular expression syntax that means the same thing in Python and on the Cisco CLI.
+_PORTABLE_PATTERN = re.compile(r'^(?:\\\.|[^\\{}_"])*$')
+
+
+def is_portable(pattern):
+    """
+    :return: True if the pattern can be used in a Cisco CLI filter and matches the same lines as it does in Python.
+        Leading and trailing spaces are dropped by the CLI, so patterns that start or end with one aren't portable.
+    :rtype: bool
+    """
+    return (bool(_PORTABLE_PATTERN.match(pattern)) and "(?" not in pattern and pattern == pattern.strip())
+
+
+class Query(object):
+    """
+    The rows a script needs from the output of a show command.
+    """
+
+    def __init__(self, command, include=None, exclude=None, section=None, section_contains=None, interface=None):
+        """
+        :param command: The show command, without any filters
+        :type command: str
+        :param include: Keep only the lines that match one of these patterns.
+        :type include: list of str
+        :param exclude: Drop the lines that match any of these patterns.
+        :type exclude: list of str
+        :param section: Keep only the sections (a line that isn't indented, plus the indented lines after it) whose
+                        first line matches this pattern, such as "^interface ".  include and exclude are applied to the
+                        lines of the sections that are kept.
+        :type section: str
+        :param section_contains: Keep only the sections with a line that matches this pattern, such as
+                                 "ip helper-address".
+        :type section_contains: str
+        :param interface: Keep only the rows for this interface.
+        :type interface: str
+        """
+        self.command = command
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.section = section
+        self.section_contains = section_contains
+        self.interface = interface
+
+
+class Plan(object):
+    """
+    The command to send to the device for a query, and the filters that still have to be applied to its output.
+    """
+
+    def __init__(self, command, section=None, section_contains=None, include=None, exclude=None, interface=None):
+        self.command = command
+        self.section = section
+        self.section_contains = section_contains
+        self.include = include or []
+        self.exclude = exclude or []
+        self.interface = interface
+
+    @property
+    def local_filters(self):
+        """
+        :return: The number of filters that are applied locally.
+        :rtype: int
+        """
+        return (len(self.include) + len(self.exclude) + bool(self.section) + bool(self.section_contains) +
+                bool(self.interface))
+
+    def apply(self, output):
+        """
+        Applies the filters that weren't pushed to the device.
+
+        :param output: The output of self.command
+        :type output: str
+
+        :return: The lines of the output that the query asked for.
+        :rtype: str
+        """
+        if not self.local_filters:
+            return output
+        lines = output.splitlines()
+        if self.section or self.section_contains:
+            lines = filter_sections(lines, self.section, self.section_contains)
+        if self.interface:
+            interface = re.compile(r"(^|\s){0}(\s|,|$)".format(re.escape(self.interface)))
+            lines = [line for line in lines if interface.search(line)]
+        if self.include:
+            include = re.compile("|".join("(?:{0})".format(pattern) for pattern in self.include))
+            lines = [line for line in lines if include.search(line)]
+        if self.exclude:
+            exclude = re.compile("|".join("(?:{0})".format(pattern) for pattern in self.exclude))
+            lines = [line for line in lines if not exclude.search(line)]
+        return "\n".join(lines)
+
+
+def filter_sections(lines, section=None, section_contains=None):
+    """
+    Keeps the sections of a config (a line that isn't indented, plus the indented lines after it) that match, like
+    "| section" does on the device.
+
+    :param lines: The lines of the output
+    :type lines: list of str
+    :param section: Keep the sections whose first line matches this pattern.
+    :type section: str
+    :param section_contains: Keep the sections with any line that matches this pattern.
+    :type section_contains: str
+
+    :return: The lines of the sections that were kept.
+    :rtype: list of str
+    """
+    header = re.compile(section) if section else None
+    contains = re.compile(section_contains) if section_contains else None
+    kept = []
+    current = []
+
+    def flush():
+        if current and (header is None or header.search(current[0])) and \
+                (contains is None or any(contains.search(line) for line in current)):
+            kept.extend(current)
+
+    for line in lines:
+        if line and not line[0].isspace():
+            flush()
+            current = []
+        current.append(line)
+    flush()
+    return kept
+
+
+def os_type_from_probe(output):
+    """
+    :param output: The output of OS_PROBE_COMMAND on the switch
+    :type output: str
+
+    :return: The OS type to plan commands for: "nxos" if the switch rejected the command, otherwise "iosxe".
+    :rtype: str
+    """
+    if "Invalid input" in output or "% Invalid command" in output:
+        return "nxos"
+    return "iosxe"
+
+
+def _pipe_pattern(patterns, os_type):
+    pattern = "|".join(patterns)
+    if os_type == "nxos" and "|" in pattern:
+        return '"{0}"'.format(pattern)
+    return pattern
+
+
+def plan(query, os_type):
+    """
+    Rewrites a query's command with the filters that the OS can apply on the device.
+
+    :param query: The rows the script needs
+    :type query: Query
+    :param os_type: The OS of the device: ios, iosxe, nxos, asa or ios-xr.  Anything else gets the plain command and all
+                    of the filters are applied locally.
+    :type os_type: str
+
+    :return: The command to send, with the filters that are left to apply locally.
+    :rtype: Plan
+    """
+    os_type = (os_type or "").lower()
+    capabilities = CAPABILITIES.get(os_type, {"pipes": 0, "section": False})
+    command = query.command
+    remaining = Plan(command, query.section, query.section_contains, list(query.include), list(query.exclude),
+                     query.interface)
+
+    # An interface argument isn't a pipe, so it is always used when the command takes one.
+    templates = dict(INTERFACE_COMMANDS, **NXOS_INTERFACE_COMMANDS) if os_type == "nxos" else INTERFACE_COMMANDS
+    if query.interface and capabilities["pipes"] != 0 and command in templates:
+        remaining.command = templates[command].format(query.interface)
+        remaining.interface = None
+
+    pipes = []
+    if query.section and capabilities["section"] and is_portable(query.section):
+        pipes.append("section " + query.section)
+        remaining.section = None
+    # The lines are only filtered after the sections are picked, so if the sections are picked locally, the lines must
+    # be filtered locally too.  That includes section_contains, which is always checked locally: a line filter on the
+    # device would remove the lines it looks for.
+    if not remaining.section and not remaining.section_contains:
+        if query.include and is_portable("|".join(query.include)):
+            pipes.append("include " + _pipe_pattern(query.include, os_type))
+        if query.exclude and is_portable("|".join(query.exclude)):
+            pipes.append("exclude " + _pipe_pattern(query.exclude, os_type))
+    if capabilities["pipes"] is not None:
+        pipes = pipes[:capabilities["pipes"]]
+
+    for pipe in pipes:
+        remaining.command += " | " + pipe
+        if pipe.startswith("include "):
+            remaining.include = []
+        elif pipe.startswith("exclude "):
+            remaining.exclude = []
+    logger.debug("<FILTER_PLAN> {0} ({1}): '{2}', {3} filters applied locally".format(
+        query.command, os_type, remaining.command, remaining.local_filters))
+    return remaining
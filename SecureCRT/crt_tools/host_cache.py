@@ -0,0 +1,150 @@
+"""
+This module contains a small persistent cache of facts learned about remote hosts (such as the exact CLI prompt a
+device uses), so that later runs of a script don't have to work them out again.  The cache is a JSON file that is kept
+in the script output directory and maps each host to a dictionary of facts.  Every fact is stored with the time it was
+learned, and facts older than the TTL are treated as missing.
+
+Example:
+
+    cache = HostCache(os.path.join(script.output_dir, "cache", "hosts.json"))
+    prompt = cache.get("10.1.1.1", "prompt")
+    if prompt is None:
+        prompt = learn_prompt()
+        cache.set("10.1.1.1", "prompt", prompt)
+    cache.save()
+"""
+
+import os
+import json
+import time
+import logging
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Default number of seconds before a cached fact is considered stale (30 days)
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+
+def default_cache_dir():
+    """
+    :return: The directory where scripts that don't use the settings file (and so have no output directory) keep their
+        cache files.  This is ~/.securecrt-cache unless the SECURECRT_CACHE_DIR environment variable is set.
+    :rtype: str
+    """
+    return os.environ.get("SECURECRT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".securecrt-cache")
+
+
+def save_json(filename, data):
+    """
+    Writes data to a JSON file atomically, by writing a temporary file first and then replacing the original, so that
+    an interrupted script can't leave a half written file behind.  The directory is created if needed.
+
+    :param filename: The path of the JSON file
+    :type filename: str
+    :param data: Any data that can be written as JSON
+    """
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, 'w') as json_file:
+        json.dump(data, json_file, indent=2, sort_keys=True)
+    # os.rename() won't replace an existing file on Windows (and os.replace() doesn't exist in Python 2)
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temp_filename, filename)
+
+
+class HostCache(object):
+    """
+    A persistent cache of facts about hosts, saved as a JSON file.  The file is written atomically (see save_json()) and a
+    cache file that can't be read is ignored instead of stopping the script.
+    """
+
+    def __init__(self, filename, ttl=DEFAULT_TTL):
+        """
+        :param filename: The path to the JSON cache file.  The directory is created when the cache is saved.
+        :type filename: str
+        :param ttl: The number of seconds a fact stays valid after it was learned.  None means facts never expire.
+        :type ttl: int
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.hosts = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """
+        Loads the cache file from disk, if it exists.
+        """
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as cache_file:
+                self.hosts = json.load(cache_file)
+            logger.debug("<HOST_CACHE> Loaded {0} hosts from {1}".format(len(self.hosts), self.filename))
+        except (IOError, ValueError) as e:
+            logger.debug("<HOST_CACHE> Ignoring unreadable cache file {0}: {1}".format(self.filename, e))
+            self.hosts = {}
+
+    def save(self):
+        """
+        Writes the cache to disk, if anything has changed since it was loaded.
+        """
+        if not self.dirty:
+            return
+        save_json(self.filename, self.hosts)
+        self.dirty = False
+
+    def get(self, host, key, default=None, max_age=None):
+        """
+        :param host: The hostname or IP address used to connect to the device
+        :type host: str
+        :param key: The name of the fact, such as "prompt"
+        :type key: str
+        :param default: The value returned if the fact isn't cached or has expired
+        :param max_age: A shorter TTL (in seconds) to use for this fact instead of the cache's TTL.
+        :type max_age: int
+        :return: The cached value
+        """
+        entry = self.hosts.get(host, {}).get(key)
+        if entry is None:
+            return default
+        ttl = max_age if max_age is not None else self.ttl
+        if ttl is not None and time.time() - entry["updated"] > ttl:
+            logger.debug("<HOST_CACHE> Cached {0} for {1} has expired.".format(key, host))
+            return default
+        return entry["value"]
+
+    def set(self, host, key, value):
+        """
+        Stores a fact about a host.  The cache must be saved with save() to keep it for future runs.
+
+        :param host: The hostname or IP address used to connect to the device
+        :type host: str
+        :param key: The name of the fact, such as "prompt"
+        :type key: str
+        :param value: Any value that can be stored as JSON
+        """
+        self.hosts.setdefault(host, {})[key] = {"value": value, "updated": time.time()}
+        self.dirty = True
+
+    def invalidate(self, host, key=None):
+        """
+        Removes one fact (or all facts, if no key is given) about a host.
+
+        :param host: The hostname or IP address used to connect to the device
+        :type host: str
+        :param key: The name of the fact to remove.
+        :type key: str
+        """
+        if host not in self.hosts:
+            return
+        if key is None:
+            del self.hosts[host]
+            self.dirty = True
+        elif key in self.hosts[host]:
+            del self.hosts[host][key]
+            self.dirty = True
@@ -0,0 +1,363 @@
+"""
+This module lets scripts reach devices through a jumpbox (a SecureCRT saved session used as a proxy) without paying
+for a new jumpbox login for every device.
+
+Connecting with /FIREWALL=Session:"jumpbox" makes SecureCRT open a new SSH connection to the jumpbox for every device.
+Instead, a JumpboxPool keeps a few tabs logged into the jumpbox open for the whole run, and each device is reached by
+running ssh (or telnet) from the jumpbox's command line in one of those tabs.  When the script is done with the device,
+it exits back to the jumpbox prompt and the tab goes back into the pool for the next device.
+
+The JumpboxManager holds one pool for each jumpbox, each with its own limit on how many tabs can be open at once, and
+orders the work for a device list so that the jumpboxes take turns.  SecureCRT runs a script in a single thread, so the
+work is done one device at a time: the tabs are reused one after another, not used in parallel, and a limit above 1
+only matters to a script that keeps more than one device connected.  CRTScript.connect_via_jumpbox() connects to one
+device at a time, so it keeps a single tab to each jumpbox.  A jumpbox that keeps failing is put aside (its devices are
+moved to the end of the run and then skipped) so that one bad jumpbox doesn't hold up the devices behind the others.
+Jumpboxes that are only slow are not reordered.
+
+Example:
+
+    manager = JumpboxManager(crt, caps={"bastion-east": 3})
+    for device in manager.schedule(device_list):
+        pool = manager.pool(device['Proxy Session'])
+        channel = pool.acquire()
+        try:
+            channel.connect_device(device['Hostname'], device['Username'], device['Password'])
+            manager.report(device['Proxy Session'], success=True)
+            ... work with channel.tab ...
+            channel.disconnect_device()
+        except JumpboxError:
+            manager.report(device['Proxy Session'], success=False)
+        finally:
+            pool.release(channel)
+    manager.close()
+"""
+
+import time
+import logging
+from collections import deque
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Responses that mean the login to a device from the jumpbox has failed.
+LOGIN_FAILURES = ["% Access denied", "Access denied", "% Authentication failed", "Authentication failed",
+                  "% Login invalid", "Login invalid", "Permission denied", "Connection refused", "Connection timed out",
+                  "No route to host", "Could not resolve", "Unknown host", "Host key verification failed",
+                  "Connection closed by"]
+
+
+class JumpboxError(Exception):
+    """
+    An exception type that is raised when a jumpbox or a device behind it can't be reached.
+    """
+    pass
+
+
+def get_cursor_line(screen):
+    """
+    :return: The text on the cursor's row, up to the cursor, with surrounding whitespace removed.
+    :rtype: str
+    """
+    row, column = screen.CurrentRow, screen.CurrentColumn
+    if column <= 1:
+        return ""
+    return screen.Get(row, 1, row, column - 1).strip()
+
+
+class JumpboxChannel(object):
+    """
+    One tab that is logged into a jumpbox.  The tab is either sitting at the jumpbox prompt, or logged into a device
+    from there.
+    """
+
+    def __init__(self, tab, session_name, prompt):
+        self.tab = tab
+        self.session_name = session_name
+        self.prompt = prompt
+        self.device = None
+        self.uses = 0
+
+    def is_alive(self):
+        return bool(self.tab.Session.Connected)
+
+    def connect_device(self, host, username, password, protocol="ssh", prompt_endings=("#", ">"), timeout=10):
+        """
+        Logs into a device from the jumpbox's command line.
+
+        :param host: The IP address or DNS name of the device
+        :type host: str
+        :param username: The username to login to the device with
+        :type username: str
+        :param password: The password that goes with the username
+        :type password: str
+        :param protocol: "telnet" to use telnet from the jumpbox, otherwise ssh is used.
+        :type protocol: str
+        :param prompt_endings: The characters that the device's prompt can end with.
+        :type prompt_endings: tuple
+        :param timeout: The number of seconds to wait for each step of the login.
+        :type timeout: float
+
+        :return: The device's prompt
+        :rtype: str
+        """
+        if self.device:
+            raise JumpboxError("Tab is already connected to {0} through {1}".format(self.device, self.session_name))
+        screen = self.tab.Screen
+        if protocol and protocol.lower() == "telnet":
+            screen.Send("telnet {0}\r".format(host))
+        else:
+            screen.Send("ssh -l {0} {1}\r".format(username, host))
+
+        username_prompts = ["sername:", "ogin:"]
+        password_prompts = ["assword:"]
+        prompt_endings = tuple(prompt_endings)
+        sent_password = False
+        while True:
+            result = screen.WaitForStrings(["(yes/no"] + username_prompts + password_prompts + LOGIN_FAILURES +
+                                           list(prompt_endings) + [self.prompt], timeout)
+            if result == 0:
+                self.__abort(host, timeout)
+                raise JumpboxError("Timed out logging into {0} through {1}".format(host, self.session_name))
+            matched = result - 1
+            if matched == 0:
+                screen.Send("yes\r")
+                continue
+            matched -= 1
+            if matched < len(username_prompts):
+                screen.Send("{0}\r".format(username))
+                continue
+            matched -= len(username_prompts)
+            if matched < len(password_prompts):
+                if sent_password:
+                    # Asked for the password again, so it was wrong.
+                    self.__abort(host, timeout)
+                    raise JumpboxError("Authentication failed for {0} through {1}".format(host, self.session_name))
+                screen.Send("{0}\r".format(password))
+                sent_password = True
+                continue
+            matched -= len(password_prompts)
+            if matched < len(LOGIN_FAILURES):
+                self.__abort(host, timeout)
+                raise JumpboxError("Login to {0} through {1} failed: {2}".format(host, self.session_name,
+                                                                                LOGIN_FAILURES[matched]))
+            line = get_cursor_line(screen)
+            if line == self.prompt:
+                # Back at the jumpbox prompt, so the ssh/telnet command itself failed.
+                raise JumpboxError("Could not reach {0} through {1}".format(host, self.session_name))
+            if line.endswith(prompt_endings) and " " not in line:
+                self.device = host
+                self.uses += 1
+                logger.debug("<JUMPBOX> Logged into {0} through {1} (tab {2}, use {3})".format(
+                    host, self.session_name, self.tab.Index, self.uses))
+                return line
+            # Otherwise a prompt ending was part of a banner, so keep waiting.
+
+    def __abort(self, host, timeout):
+        """
+        Tries to get back to the jumpbox prompt after a failed login.  If that doesn't work, the channel is left marked
+        as connected to the device, so that the pool closes the tab instead of reusing it.
+        """
+        screen = self.tab.Screen
+        if screen.WaitForString(self.prompt, 1):
+            return
+        screen.Send("\x03")
+        if not screen.WaitForString(self.prompt, timeout):
+            self.device = host
+
+    def disconnect_device(self, command="exit", timeout=10):
+        """
+        Logs out of the device, back to the jumpbox prompt.
+        """
+        if not self.device:
+            return
+        self.tab.Screen.Send("{0}\r".format(command))
+        if not self.tab.Screen.WaitForString(self.prompt, timeout):
+            raise JumpboxError("Did not get back to the {0} prompt after leaving {1}".format(self.session_name,
+                                                                                             self.device))
+        self.device = None
+
+
+class JumpboxPool(object):
+    """
+    A set of tabs logged into the same jumpbox.  Tabs are opened as they are needed, up to the size of the pool, and
+    reused for one device after another.
+    """
+
+    def __init__(self, crt, session_name, size=2, prompt_endings=("$", "#", ">"), timeout=15):
+        """
+        :param crt: The SecureCRT "crt" object
+        :param session_name: The name of the SecureCRT saved session for the jumpbox
+        :type session_name: str
+        :param size: The most tabs that will be open to this jumpbox at the same time
+        :type size: int
+        :param prompt_endings: The characters that the jumpbox's prompt can end with
+        :type prompt_endings: tuple
+        :param timeout: The number of seconds to wait for the jumpbox prompt after connecting
+        :type timeout: float
+        """
+        self.crt = crt
+        self.session_name = session_name
+        self.size = size
+        self.prompt_endings = prompt_endings
+        self.timeout = timeout
+        self.idle = []
+        self.busy = []
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self):
+        """
+        :return: A tab at the jumpbox prompt, reusing an idle one if there is one.
+        :rtype: JumpboxChannel
+        """
+        while self.idle:
+            channel = self.idle.pop()
+            if channel.is_alive():
+                self.busy.append(channel)
+                self.reused += 1
+                return channel
+            logger.debug("<JUMPBOX> Dropping disconnected tab to {0}".format(self.session_name))
+        if len(self.busy) >= self.size:
+            raise JumpboxError("All {0} tabs to {1} are in use".format(self.size, self.session_name))
+        channel = self.__open()
+        self.busy.append(channel)
+        return channel
+
+    def release(self, channel):
+        """
+        Returns a tab to the pool.  Tabs that are still logged into a device (because logging out failed) are closed.
+        """
+        self.busy.remove(channel)
+        if channel.device or not channel.is_alive():
+            channel.tab.Close()
+        else:
+            self.idle.append(channel)
+
+    def close(self):
+        """
+        Logs out of the jumpbox and closes all of the tabs in the pool.
+        """
+        for channel in self.idle + self.busy:
+            if channel.is_alive():
+                channel.tab.Session.Disconnect()
+            channel.tab.Close()
+        self.idle, self.busy = [], []
+
+    def __open(self):
+        start = time.time()
+        try:
+            tab = self.crt.GetScriptTab().Session.ConnectInTab("/S \"{0}\"".format(self.session_name))
+        except Exception:
+            raise JumpboxError("Unable to connect to jumpbox {0}: {1}".format(self.session_name,
+                                                                            self.crt.GetLastErrorMessage()))
+        tab.Screen.Synchronous = True
+        tab.Screen.IgnoreEscape = True
+        if not tab.Screen.WaitForStrings(list(self.prompt_endings), self.timeout):
+            tab.Close()
+            raise JumpboxError("No prompt from jumpbox {0}".format(self.session_name))
+        prompt = get_cursor_line(tab.Screen)
+        self.opened += 1
+        logger.debug("<JUMPBOX> Opened tab {0} to {1} (prompt '{2}') in {3:.2f}s".format(
+            tab.Index, self.session_name, prompt, time.time() - start))
+        return JumpboxChannel(tab, self.session_name, prompt)
+
+
+class JumpboxManager(object):
+    """
+    Keeps a pool for each jumpbox, and schedules the devices of a device list across the jumpboxes.
+    """
+
+    def __init__(self, crt, caps=None, default_cap=2, max_failures=3):
+        """
+        :param crt: The SecureCRT "crt" object
+        :param caps: The number of tabs allowed for specific jumpboxes, by session name
+        :type caps: dict
+        :param default_cap: The number of tabs allowed for any other jumpbox
+        :type default_cap: int
+        :param max_failures: How many failures in a row a jumpbox can have before its devices are put aside
+        :type max_failures: int
+        """
+        self.crt = crt
+        self.caps = caps or {}
+        self.default_cap = default_cap
+        self.max_failures = max_failures
+        self.pools = {}
+        self.failures = {}
+        self.skipped = []
+
+    def pool(self, session_name):
+        """
+        :return: The pool of tabs for a jumpbox, created the first time it is needed.
+        :rtype: JumpboxPool
+        """
+        if session_name not in self.pools:
+            self.pools[session_name] = JumpboxPool(self.crt, session_name,
+                                                   size=self.caps.get(session_name, self.default_cap))
+        return self.pools[session_name]
+
+    def report(self, session_name, success):
+        """
+        Records whether a device could be reached through a jumpbox.
+        """
+        self.failures[session_name] = 0 if success else self.failures.get(session_name, 0) + 1
+
+    def healthy(self, session_name):
+        return self.failures.get(session_name, 0) < self.max_failures
+
+    def schedule(self, devices, key='Proxy Session'):
+        """
+        Orders the devices so that each jumpbox gets a turn (devices without a jumpbox count as their own group).
+        Devices of a jumpbox that has failed too many times in a row are held back until the other jumpboxes are done,
+        and are then given one more try.  Devices that are still held back after that are listed in self.skipped.
+
+        :param devices: The device entries from import_device_list() or stream_device_list()
+        :type devices: iterable of dict
+        :param key: The name of the entry field with the jumpbox session name
+        :type key: str
+
+        :return: A generator of the device entries
+        :rtype: generator of dict
+        """
+        queues = {}
+        order = []
+        for device in devices:
+            session_name = device.get(key) or ""
+            if session_name not in queues:
+                queues[session_name] = deque()
+                order.append(session_name)
+            queues[session_name].append(device)
+
+        held = []
+        retried = set()
+        while True:
+            active = [name for name in order if queues[name] and name not in held]
+            if not active:
+                remaining = [name for name in held if queues[name]]
+                if not remaining:
+                    return
+                for session_name in remaining:
+                    if session_name in retried:
+                        logger.debug("<JUMPBOX> Skipping {0} devices behind {1}".format(len(queues[session_name]),
+                                                                                       session_name))
+                        self.skipped.extend(queues[session_name])
+                        queues[session_name].clear()
+                    else:
+                        # Everything else is done, so give the jumpbox one more chance.
+                        retried.add(session_name)
+                        self.failures[session_name] = self.max_failures - 1
+                held = []
+                continue
+
+            for session_name in active:
+                if session_name and not self.healthy(session_name):
+                    logger.debug("<JUMPBOX> Holding back {0} devices behind {1}".format(len(queues[session_name]),
+                                                                                       session_name))
+                    held.append(session_name)
+                    continue
+                yield queues[session_name].popleft()
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.pools = {}
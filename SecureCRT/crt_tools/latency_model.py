@@ -0,0 +1,265 @@
+"""
+This module keeps a model of how long each command takes on each device, and uses it to pick timeouts.  A single fixed
+timeout is always wrong for someone: 10 seconds is far too long to wait on a device that is dead, and 30 seconds can be
+too short for 'show mac address-table' on a large chassis switch.
+
+Every time a command (or a login step, or a connection) finishes, its duration and output size are recorded for that
+host and command.  The model keeps an exponentially weighted moving average (EWMA) and variance of the duration, plus
+the most recent samples for a percentile.  The timeout for the next run of the command is then derived from those:
+
+    timeout = max(95th percentile, EWMA + 4 standard deviations) * 1.5 + 1 second
+
+clamped between a floor and a ceiling.  Until a host has enough samples for a command, the caller's default timeout is
+used.  The statistics for that command across all hosts can only lengthen it: they were learned on other devices, and a
+large core switch with no history of its own must not get the budget of the small access switches seen so far.
+
+Commands are grouped by replacing the parts that change between runs (MAC addresses, IP addresses and numbers), so that
+'show mac address-table address 0011.2233.4455' and the same command with another MAC share their statistics.
+
+Example:
+
+    model = LatencyModel(os.path.join(cache_dir, "latency.json"))
+    timeout = model.timeout(host, cmd, default=30)
+    start = time.time()
+    output = tab.Screen.ReadString("#", timeout)
+    if output:
+        model.record(host, cmd, time.time() - start, len(output))
+    else:
+        model.timed_out(host, cmd, timeout, time.time() - start)
+    ...
+    model.save()    # once, at the end of the run
+
+The timeouts are logged as <TIMEOUT> events to the "securecrt" logger.  Scripts that don't set up that logger (such as
+the ones in tools-macs) can have the events written to a file with log_timeouts().
+"""
+
+import os
+import re
+import json
+import math
+import time
+import logging
+
+from host_cache import save_json
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The key used for the statistics of each command across all hosts.
+ALL_HOSTS = "*"
+
+# The prefix of the timeout events in the log.
+TIMEOUT_EVENT = "<TIMEOUT>"
+
+_VARIABLE_PARTS = [
+    (re.compile(r"\b[0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4}\b|\b[0-9a-f]{2}([:-][0-9a-f]{2}){5}\b", re.I), "<mac>"),
+    (re.compile(r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b"), "<ip>"),
+    (re.compile(r"\d+"), "<n>"),
+]
+
+
+def command_key(command):
+    """
+    Converts a command into the key that its statistics are stored under, by replacing the parts that change between
+    runs of the same command.
+
+    :param command: The command sent to the device (or the name of a step such as "login password")
+    :type command: str
+
+    :return: The key for the command, such as "show etherchannel <n> summary"
+    :rtype: str
+    """
+    key = " ".join(command.lower().split())
+    for pattern, replacement in _VARIABLE_PARTS:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def percentile(values, fraction):
+    """
+    :return: The value at the fraction (0.0 to 1.0) of the sorted values, using the nearest rank method.
+    :rtype: float
+    """
+    ordered = sorted(values)
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class _TimeoutEvents(logging.Filter):
+    def filter(self, record):
+        return record.getMessage().startswith(TIMEOUT_EVENT)
+
+
+def log_timeouts(filename):
+    """
+    Appends the timeout events (see LatencyModel.timed_out()) to a file, for scripts that don't set up a handler for
+    the "securecrt" logger.  Only the timeout events are written, whatever else is logged.
+
+    :param filename: The path of the file to append to
+    :type filename: str
+    """
+    filename = os.path.abspath(filename)
+    # Scripts that run again in the same interpreter would otherwise write each event once per run
+    if any(getattr(handler, "baseFilename", None) == filename for handler in logger.handlers):
+        return
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    handler = logging.FileHandler(filename, mode='a')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S'))
+    handler.addFilter(_TimeoutEvents())
+    logger.addHandler(handler)
+    if logger.getEffectiveLevel() > logging.DEBUG:
+        logger.setLevel(logging.DEBUG)
+
+
+class LatencyModel(object):
+    """
+    Records command durations and output sizes for each host, and derives timeouts from them.  The statistics are kept
+    in a JSON file so they carry over between runs.
+    """
+
+    def __init__(self, filename, alpha=0.3, samples=50, min_samples=3, floor=2.0, ceiling=300.0):
+        """
+        :param filename: The path to the JSON file the statistics are kept in.
+        :type filename: str
+        :param alpha: The weight of a new sample in the moving averages (0.0 to 1.0)
+        :type alpha: float
+        :param samples: The number of recent samples kept for each host and command, for the percentile.
+        :type samples: int
+        :param min_samples: The number of samples needed before a timeout is derived from the statistics.
+        :type min_samples: int
+        :param floor: The smallest timeout that will be returned, in seconds.
+        :type floor: float
+        :param ceiling: The largest timeout that will be returned, in seconds.
+        :type ceiling: float
+        """
+        self.filename = filename
+        self.alpha = alpha
+        self.samples = samples
+        self.min_samples = min_samples
+        self.floor = floor
+        self.ceiling = ceiling
+        self.stats = {}
+        self.dirty = False
+        if os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as stats_file:
+                    self.stats = json.load(stats_file)
+            except (IOError, ValueError) as e:
+                logger.debug("<LATENCY> Ignoring unreadable latency file {0}: {1}".format(filename, e))
+
+    def save(self):
+        """
+        Writes the statistics to disk, if any were recorded since the last save.
+        """
+        if self.dirty:
+            save_json(self.filename, self.stats)
+            self.dirty = False
+
+    def record(self, host, command, duration, size=0):
+        """
+        Records how long a command took on a host.
+
+        :param host: The hostname or IP address of the device
+        :type host: str
+        :param command: The command that was sent (or the name of a step, such as "login password")
+        :type command: str
+        :param duration: How long the command took to complete, in seconds
+        :type duration: float
+        :param size: The number of characters of output received
+        :type size: int
+        """
+        key = command_key(command)
+        for name in (host, ALL_HOSTS):
+            self.__update(self.stats.setdefault(name, {}).setdefault(key, {}), duration, size)
+        self.dirty = True
+
+    def __update(self, entry, duration, size):
+        if not entry.get("count"):
+            entry.update({"count": 0, "ewma": duration, "ewvar": 0.0, "size": size, "recent": []})
+        delta = duration - entry["ewma"]
+        entry["ewma"] += self.alpha * delta
+        entry["ewvar"] = (1 - self.alpha) * (entry["ewvar"] + self.alpha * delta * delta)
+        entry["size"] += self.alpha * (size - entry["size"])
+        entry["recent"] = (entry["recent"] + [round(duration, 3)])[-self.samples:]
+        entry["count"] += 1
+        entry["updated"] = time.time()
+
+    def __entry(self, host, command):
+        key = command_key(command)
+        for name in (host, ALL_HOSTS):
+            entry = self.stats.get(name, {}).get(key)
+            if entry and entry["count"] >= self.min_samples:
+                return entry
+        return None
+
+    def __budget(self, entry):
+        budget = max(percentile(entry["recent"], 0.95), entry["ewma"] + 4 * math.sqrt(entry["ewvar"])) * 1.5 + 1.0
+        return min(max(budget, self.floor), self.ceiling)
+
+    def timeout(self, host, command, default):
+        """
+        Derives the timeout to use for a command on a host.
+
+        :param host: The hostname or IP address of the device
+        :type host: str
+        :param command: The command that will be sent (or the name of a step, such as "login password")
+        :type command: str
+        :param default: The timeout to use when there isn't enough history for the command on this host.  The history of
+                        other hosts can lengthen it, but never shorten it.
+        :type default: float
+
+        :return: The timeout in seconds
+        :rtype: float
+        """
+        key = command_key(command)
+        entry = self.stats.get(host, {}).get(key)
+        if entry and entry["count"] >= self.min_samples:
+            return round(self.__budget(entry), 1)
+        entry = self.stats.get(ALL_HOSTS, {}).get(key)
+        if entry and entry["count"] >= self.min_samples:
+            return round(max(self.__budget(entry), default), 1)
+        return default
+
+    def expected(self, host, command):
+        """
+        The typical duration of a command on a host, to tell which of several devices is likely to answer first.  Only
+        the host's own history is used.
+
+        :param host: The hostname or IP address of the device
+        :type host: str
+        :param command: The command that will be sent
+        :type command: str
+
+        :return: The moving average of the command's duration on the host in seconds, or None without enough history.
+        :rtype: float
+        """
+        entry = self.stats.get(host, {}).get(command_key(command))
+        if entry and entry["count"] >= self.min_samples:
+            return entry["ewma"]
+        return None
+
+    def timed_out(self, host, command, budget, elapsed):
+        """
+        Logs a timeout with the numbers behind it, and records it so that the next timeout for the command is longer.
+        The real duration isn't known, so the command is recorded as taking twice the timeout.
+
+        :param host: The hostname or IP address of the device
+        :type host: str
+        :param command: The command that timed out
+        :type command: str
+        :param budget: The timeout that was used, in seconds
+        :type budget: float
+        :param elapsed: How long was actually waited, in seconds
+        :type elapsed: float
+        """
+        entry = self.__entry(host, command)
+        if entry:
+            history = "p95 {0:.2f}s, ewma {1:.2f}s over {2} samples".format(percentile(entry["recent"], 0.95),
+                                                                             entry["ewma"], entry["count"])
+        else:
+            history = "no history"
+        logger.debug(TIMEOUT_EVENT + " {0}: '{1}' waited {2:.2f}s of a {3:.2f}s budget ({4})".format(
+            host, command, elapsed, budget, history))
+        self.record(host, command, min(budget * 2, self.ceiling))
@@ -0,0 +1,377 @@
+"""
+This module collects the MAC address tables of a whole list of switches and merges them into one index of where each
+MAC address is connected: the switch, port, VLAN, port description and CDP neighbor of its access port.
+
+Each switch is asked for "show mac address-table", "show interfaces description" and "show cdp neighbors detail".  The
+switches are worked on at the same time, in a window of tabs: the commands for a switch are sent in one write as soon
+as its tab is logged in (see command_pipeline.send_commands()), and its outputs are only read once the window is full,
+so the switches build their outputs while the script is connecting to the next ones.  SecureCRT runs a script in a
+single thread, so this is how the waits are overlapped; a 100 switch run costs about the time of its slowest switches
+instead of the sum of all of them.
+
+A MAC is learned on every switch between it and the core, so most switches see it on an uplink.  The uplinks and trunks
+of each switch are found from its own outputs:
+
+- ports with a CDP neighbor that is a switch or a router (but not an IP phone, which sits on an access port),
+- Port-channels.
+
+When a MAC is seen on more than one switch, the index keeps the sighting on an access port.  If it is on an access port
+of more than one switch (for example, behind a trunk whose neighbor doesn't run CDP), the port with the fewest MACs
+wins, as an access port has far fewer MACs behind it than a trunk.  A MAC that is only seen on uplinks (it is behind a
+switch that isn't in the list) is kept at the uplink closest to it, with a port role of "uplink".
+
+Example:
+
+    harvests = harvest(hosts, connect, window=8)
+    index = FleetIndex()
+    for result in harvests:
+        if result.error:
+            print("{0}: {1}".format(result.host, result.error))
+        else:
+            index.add(result)
+    for location in index.locations():
+        print("{mac} {switch} {port} VLAN {vlan} {role}".format(**location))
+"""
+
+import re
+import logging
+
+from mac_table import MacTable, MacTableParser, PortFilter, EXCLUDED_PORT_NAMES, mac_value, int_to_mac
+from command_pipeline import send_commands, read_outputs
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The commands collected from every switch, sent in one write after paging is turned off.
+HARVEST_COMMANDS = ["show mac address-table", "show interfaces description", "show cdp neighbors detail"]
+
+# The number of switches worked on at the same time (each in its own tab).
+DEFAULT_WINDOW = 8
+
+# CDP capabilities of the neighbors that make a port an uplink, and those that don't (an IP phone is also a switch).
+UPLINK_CAPABILITIES = ["Router", "Switch"]
+ACCESS_CAPABILITIES = ["Phone"]
+
+# The Port-channel rows are kept, to know which MACs are behind an uplink.
+HARVEST_PORT_FILTER = PortFilter(names=EXCLUDED_PORT_NAMES, types=["Vlan"])
+
+# The short forms of the interface types, as shown in the MAC table of IOS-XE and NX-OS.
+PORT_ABBREVIATIONS = [
+    ("TwoPointFiveGigabitEthernet", "Tw"),
+    ("TwentyFiveGigabitEthernet", "Twe"),
+    ("TwentyFiveGigE", "Twe"),
+    ("HundredGigabitEthernet", "Hu"),
+    ("HundredGigE", "Hu"),
+    ("FortyGigabitEthernet", "Fo"),
+    ("TenGigabitEthernet", "Te"),
+    ("FiveGigabitEthernet", "Fi"),
+    ("GigabitEthernet", "Gi"),
+    ("FastEthernet", "Fa"),
+    ("MultigigabitEthernet", "Mg"),
+    ("AppGigabitEthernet", "Ap"),
+    ("Ethernet", "Eth"),
+    ("Port-channel", "Po"),
+    ("port-channel", "Po"),
+]
+
+_CDP_SEPARATOR = re.compile(r"^-{10,}\s*$", re.MULTILINE)
+_CDP_FIELDS = {
+    "device": re.compile(r"^Device ID:\s*(\S+)", re.MULTILINE),
+    "ip": re.compile(r"(?:IP address|IPv4 Address):\s*(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"),
+    "platform": re.compile(r"^Platform:\s*(?:cisco\s+|Cisco\s+)?([^,]+)", re.MULTILINE),
+    "capabilities": re.compile(r"Capabilities:\s*(.*?)\s*$", re.MULTILINE),
+    "interface": re.compile(r"^Interface:\s*([^,]+)", re.MULTILINE),
+}
+
+
+def short_port_name(port):
+    """
+    :return: The short form of a port name, as shown in the MAC table (GigabitEthernet1/0/1 becomes Gi1/0/1).
+    :rtype: str
+    """
+    port = port.replace(" ", "")
+    for long_name, short_name in PORT_ABBREVIATIONS:
+        if port.startswith(long_name):
+            return short_name + port[len(long_name):]
+    return port
+
+
+def parse_descriptions(output):
+    """
+    Parses "show interfaces description" (IOS / IOS-XE) or "show interface description" (NX-OS).  The description is
+    read from the column under the "Description" header, so descriptions with spaces (and the "admin down" status) are
+    kept whole.
+
+    :return: The description of each port (by its short name).  Ports without a description are left out.
+    :rtype: dict
+    """
+    descriptions = {}
+    column = None
+    for line in output.splitlines():
+        if "Description" in line and (line.startswith("Interface") or line.startswith("Port")):
+            column = line.index("Description")
+            continue
+        if column is None or not line.strip() or line.startswith("---"):
+            continue
+        description = line[column:].strip() if len(line) > column else ""
+        if description and description != "--":
+            descriptions[short_port_name(line.split()[0])] = description
+    return descriptions
+
+
+def parse_cdp_neighbors(output):
+    """
+    Parses "show cdp neighbors detail" (IOS, IOS-XE or NX-OS).
+
+    :return: The neighbors on each local port (by its short name), as dictionaries of device, ip, platform and
+        capabilities.
+    :rtype: dict
+    """
+    neighbors = {}
+    for block in _CDP_SEPARATOR.split(output):
+        fields = {}
+        for name, pattern in _CDP_FIELDS.items():
+            match = pattern.search(block)
+            fields[name] = match.group(1).strip() if match else ""
+        if not fields["device"] or not fields["interface"]:
+            continue
+        # NX-OS adds the serial number to the Device ID: "SW1(FOX1234ABCD)"
+        fields["device"] = fields["device"].split("(")[0]
+        neighbors.setdefault(short_port_name(fields.pop("interface")), []).append(fields)
+    return neighbors
+
+
+def is_uplink_neighbor(neighbor):
+    """
+    :param neighbor: A CDP neighbor (see parse_cdp_neighbors())
+    :type neighbor: dict
+
+    :return: True if the neighbor is a switch or a router, so the MACs learned on its port are behind it.
+    :rtype: bool
+    """
+    capabilities = neighbor.get("capabilities", "").split()
+    if any(capability in capabilities for capability in ACCESS_CAPABILITIES):
+        return False
+    return any(capability in capabilities for capability in UPLINK_CAPABILITIES)
+
+
+def is_uplink_port(port, neighbors):
+    """
+    :param port: A port of the MAC table
+    :type port: str
+    :param neighbors: The CDP neighbors on each port (see parse_cdp_neighbors())
+    :type neighbors: dict
+
+    :return: True if the port is a Port-channel or has a switch or router CDP neighbor.
+    :rtype: bool
+    """
+    short_name = short_port_name(port)
+    if short_name.startswith("Po"):
+        return True
+    return any(is_uplink_neighbor(neighbor) for neighbor in neighbors.get(short_name, []))
+
+
+def access_port_rows(rows, cdp_output):
+    """
+    Drops the rows of a MAC table that are on uplinks or trunks, so only the MACs connected to the switch itself are
+    left (for example, to record them with mac_sightings.record_sightings()).
+
+    :param rows: (vlan, mac, port) rows of a MAC table
+    :type rows: iterable of tuple
+    :param cdp_output: The output of "show cdp neighbors detail" from the same switch
+    :type cdp_output: str
+
+    :return: The rows on access ports
+    :rtype: list of tuple
+    """
+    neighbors = parse_cdp_neighbors(cdp_output)
+    uplinks = {}
+    access_rows = []
+    for vlan, mac, port in rows:
+        if port not in uplinks:
+            uplinks[port] = is_uplink_port(port, neighbors)
+        if not uplinks[port]:
+            access_rows.append((vlan, mac, port))
+    return access_rows
+
+
+class SwitchHarvest(object):
+    """
+    The outputs collected from one switch, parsed.
+    """
+
+    def __init__(self, host, switch=None, rows=None, descriptions=None, neighbors=None, error=None):
+        """
+        :param host: The hostname or IP address that was connected to
+        :type host: str
+        :param switch: The hostname of the switch, from its prompt
+        :type switch: str
+        :param rows: The (vlan, mac, port) rows of its MAC table, with the Port-channel rows kept
+        :type rows: iterable of tuple
+        :param descriptions: The description of each port (see parse_descriptions())
+        :type descriptions: dict
+        :param neighbors: The CDP neighbors on each port (see parse_cdp_neighbors())
+        :type neighbors: dict
+        :param error: Why the switch couldn't be harvested, or None
+        :type error: str
+        """
+        self.host = host
+        self.switch = switch or host
+        self.table = MacTable(rows or [])
+        self.table.dedup()
+        self.descriptions = descriptions or {}
+        self.neighbors = neighbors or {}
+        self.error = error
+
+    @classmethod
+    def from_outputs(cls, host, switch, mac_output, description_output, cdp_output):
+        """
+        :return: The harvest of a switch, parsed from the outputs of HARVEST_COMMANDS.
+        :rtype: SwitchHarvest
+        """
+        rows = MacTableParser(HARVEST_PORT_FILTER).parse(mac_output)
+        return cls(host, switch, rows, parse_descriptions(description_output), parse_cdp_neighbors(cdp_output))
+
+    def uplink_ports(self):
+        """
+        :return: The ports of the MAC table that are uplinks or trunks: the Port-channels and the ports with a switch or
+            router CDP neighbor.
+        :rtype: set of str
+        """
+        return set(port for port in self.table.port_names if is_uplink_port(port, self.neighbors))
+
+
+class FleetIndex(object):
+    """
+    The merged location of every MAC (in each VLAN) seen on a list of switches.
+    """
+
+    def __init__(self):
+        self.switches = {}
+        # (mac, vlan) -> (rank, switch, port).  The lowest rank is the location closest to the MAC.
+        self.__best = {}
+
+    def __len__(self):
+        return len(self.__best)
+
+    def add(self, harvest):
+        """
+        Merges the MAC table of a switch into the index.
+
+        :param harvest: A switch that was harvested
+        :type harvest: SwitchHarvest
+        """
+        self.switches[harvest.switch] = harvest
+        uplinks = harvest.uplink_ports()
+        port_sizes = {}
+        for port_id in harvest.table.ports:
+            port_sizes[port_id] = port_sizes.get(port_id, 0) + 1
+        port_names = harvest.table.port_names
+        best = self.__best
+        for mac, vlan, port_id in zip(harvest.table.macs, harvest.table.vlans, harvest.table.ports):
+            port = port_names[port_id]
+            rank = (port in uplinks, port_sizes[port_id])
+            key = (mac_value(mac), vlan)
+            current = best.get(key)
+            if current is None or rank < current[0]:
+                best[key] = (rank, harvest.switch, port)
+        logger.debug("<HARVEST> Merged {0} rows from {1} ({2} uplinks), {3} MACs in the index".format(
+            len(harvest.table), harvest.switch, len(uplinks), len(best)))
+
+    def locations(self):
+        """
+        :return: The location of each MAC (dictionaries of mac, vlan, switch, port, role, description, neighbor and
+            platform), sorted by switch, port and MAC.
+        :rtype: list of dict
+        """
+        locations = []
+        for (mac, vlan), ((uplink, size), switch, port) in self.__best.items():
+            harvest = self.switches[switch]
+            short_name = short_port_name(port)
+            neighbors = harvest.neighbors.get(short_name, [])
+            locations.append({
+                "mac": int_to_mac(mac),
+                "vlan": str(vlan),
+                "switch": switch,
+                "port": port,
+                "role": "uplink" if uplink else "access",
+                "description": harvest.descriptions.get(short_name, ""),
+                "neighbor": ", ".join(neighbor["device"] for neighbor in neighbors),
+                "platform": ", ".join(neighbor["platform"] for neighbor in neighbors if neighbor["platform"]),
+            })
+        locations.sort(key=lambda location: (location["switch"], location["port"], location["mac"]))
+        return locations
+
+    def access_rows(self, switch):
+        """
+        :return: The (vlan, mac, port) rows of the MACs the index places on an access port of the switch.
+        :rtype: list of tuple
+        """
+        return [(vlan, mac, port) for (mac, vlan), ((uplink, size), location, port) in self.__best.items()
+                if location == switch and not uplink]
+
+
+def harvest(hosts, connect, window=DEFAULT_WINDOW, timeout=60):
+    """
+    Harvests a list of switches, a window of them at a time.  Each switch's commands are sent as soon as it is
+    connected, and its outputs are read (and its tab closed) when the window is full, oldest first.
+
+    :param hosts: The hostnames or IP addresses of the switches
+    :type hosts: iterable of str
+    :param connect: A function that opens a tab to a host and returns (tab, prompt), with the tab at the enable prompt
+                    and Screen.Synchronous set to True, or raises an exception if it can't.
+    :type connect: function
+    :param window: The number of switches worked on at the same time
+    :type window: int
+    :param timeout: The number of seconds to wait for each command's output
+    :type timeout: float
+
+    :return: A generator of the harvest of each switch, in the order they finish.  Switches that failed have an error.
+    :rtype: generator of SwitchHarvest
+    """
+    commands = ["terminal length 0"] + HARVEST_COMMANDS
+    in_flight = []
+    for host in hosts:
+        try:
+            tab, prompt = connect(host)
+        except Exception as e:
+            logger.debug("<HARVEST> Couldn't connect to {0}: {1}".format(host, e))
+            yield SwitchHarvest(host, error=str(e) or "connection failed")
+            continue
+        try:
+            send_commands(tab, commands)
+        except Exception as e:
+            logger.debug("<HARVEST> Couldn't send the commands to {0}: {1}".format(host, e))
+            _close(tab)
+            yield SwitchHarvest(host, prompt[:-1], error=str(e) or "session lost")
+            continue
+        in_flight.append((host, tab, prompt))
+        if len(in_flight) >= window:
+            yield _collect(in_flight.pop(0), commands, timeout)
+    while in_flight:
+        yield _collect(in_flight.pop(0), commands, timeout)
+
+
+def _collect(session, commands, timeout):
+    host, tab, prompt = session
+    try:
+        results = read_outputs(tab, commands, prompt, timeout)
+    except Exception as e:
+        # Most often the session dropped in the middle of the outputs.  Only this switch is lost, not the run.
+        logger.debug("<HARVEST> Couldn't read the outputs from {0}: {1}".format(host, e))
+        return SwitchHarvest(host, prompt[:-1], error=str(e) or "session lost")
+    finally:
+        _close(tab)
+    timed_out = [result.command for result in results if result.error == "timeout"]
+    if timed_out:
+        return SwitchHarvest(host, prompt[:-1], error="timed out waiting for '{0}'".format(timed_out[0]))
+    outputs = [result.output for result in results[1:]]
+    return SwitchHarvest.from_outputs(host, prompt[:-1], *outputs)
+
+
+def _close(tab):
+    try:
+        tab.Session.Disconnect()
+        tab.Close()
+    except Exception as e:
+        logger.debug("<HARVEST> Couldn't close tab {0}: {1}".format(tab.Index, e))
@@ -0,0 +1,211 @@
+"""
+This module keeps a local SQLite database of where MAC addresses have been seen, so that "where is this MAC?" can be
+answered from earlier MAC table collections instead of hopping from switch to switch every time.  The access port rows
+of every MAC table that get_mac.py, get_mac_csv.py or harvest_macs.py collects are added to the database (a MAC seen on
+an uplink is connected to another switch), and get_mac_tracker.py looks a MAC up there first, only tracing it live when
+it hasn't been seen recently.
+
+Each row is a sighting of a MAC on a switch port in a VLAN, with the first and last time it was seen there.  Collecting
+the same table again only moves last_seen forward, so the database grows with the number of distinct MAC locations,
+not with the number of collections.  MACs are stored as 48 bit integers.  The database has an index on the MAC (which
+also keeps the sightings unique) and one on (switch, port), for "what was seen on this port?".
+
+Rows are written in batches, each in one transaction, so adding a 200,000 entry core table takes one commit per batch
+instead of one per row.
+
+Example:
+
+    record_sightings("SW1", [("10", "0000.0c07.ac0a", "Gi1/0/1")])
+
+    for sighting in find_sightings("0000.0c07.ac0a", max_age=3600):
+        print("{switch} {port} VLAN {vlan}".format(**sighting))
+"""
+
+import os
+import time
+import sqlite3
+import logging
+
+from mac_table import mac_value, int_to_mac
+from host_cache import default_cache_dir
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The number of rows written in each transaction.
+BATCH_SIZE = 5000
+
+# Upserts (INSERT ... ON CONFLICT) need SQLite 3.24.  Older versions (such as the one Python 2 may ship with) insert the
+# new rows and update the others with a second statement.
+UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS sightings (mac INTEGER NOT NULL, switch TEXT NOT NULL, port TEXT NOT NULL, "
+    "vlan INTEGER NOT NULL, first_seen REAL NOT NULL, last_seen REAL NOT NULL)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS sightings_mac ON sightings (mac, switch, port, vlan)",
+    "CREATE INDEX IF NOT EXISTS sightings_switch_port ON sightings (switch, port)",
+]
+
+
+def default_database_filename():
+    """
+    :return: The path of the sightings database in the cache directory.
+    :rtype: str
+    """
+    return os.path.join(default_cache_dir(), "mac_sightings.db")
+
+
+class SightingStore(object):
+    """
+    A SQLite database of the switch ports MAC addresses were seen on.
+    """
+
+    def __init__(self, filename=None, batch_size=BATCH_SIZE):
+        """
+        :param filename: The path of the database file, which is created if needed.  Defaults to mac_sightings.db in
+                         the cache directory.
+        :type filename: str
+        :param batch_size: The number of rows written in each transaction
+        :type batch_size: int
+        """
+        self.filename = filename or default_database_filename()
+        self.batch_size = batch_size
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Another script may be writing a large table, so wait for its transaction instead of failing right away.
+        self.connection = sqlite3.connect(self.filename, timeout=30)
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def record(self, switch, rows, seen=None):
+        """
+        Adds the rows of a MAC table.  Rows that were seen before get their last_seen time updated.
+
+        :param switch: The hostname of the switch the table was collected from
+        :type switch: str
+        :param rows: (vlan, mac, port) rows, such as those from mac_table.MacTableParser.parse() or a MacTable.  The MAC
+                     can be in any of the usual formats, or a 48 bit integer.
+        :type rows: iterable of tuple
+        :param seen: The time the table was collected (seconds since the epoch).  Defaults to now.
+        :type seen: float
+
+        :return: The number of rows written
+        :rtype: int
+        """
+        seen = time.time() if seen is None else seen
+        count = 0
+        batch = []
+        for vlan, mac, port in rows:
+            batch.append((mac_value(mac), switch, port, int(vlan)))
+            if len(batch) >= self.batch_size:
+                count += self.__write(batch, seen)
+                batch = []
+        if batch:
+            count += self.__write(batch, seen)
+        logger.debug("<SIGHTINGS> Recorded {0} MACs seen on {1}".format(count, switch))
+        return count
+
+    def __write(self, batch, seen):
+        # Writing the rows in index order keeps the index updates close together.
+        batch.sort()
+        with self.connection:
+            if UPSERT:
+                self.connection.executemany(
+                    "INSERT INTO sightings (mac, switch, port, vlan, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (mac, switch, port, vlan) DO UPDATE SET last_seen = excluded.last_seen "
+                    "WHERE last_seen < excluded.last_seen", [row + (seen, seen) for row in batch])
+            else:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO sightings (mac, switch, port, vlan, first_seen, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", [row + (seen, seen) for row in batch])
+                self.connection.executemany(
+                    "UPDATE sightings SET last_seen = ? WHERE mac = ? AND switch = ? AND port = ? AND vlan = ? "
+                    "AND last_seen < ?", [(seen,) + row + (seen,) for row in batch])
+        return len(batch)
+
+    def __sightings(self, query, parameters):
+        return [{"mac": int_to_mac(mac), "switch": switch, "port": port, "vlan": str(vlan), "first_seen": first_seen,
+                 "last_seen": last_seen}
+                for mac, switch, port, vlan, first_seen, last_seen in self.connection.execute(query, parameters)]
+
+    def find(self, mac, max_age=None):
+        """
+        :param mac: The MAC address, in any of the usual formats or as a 48 bit integer
+        :type mac: str or int
+        :param max_age: Only return sightings from the last max_age seconds.  All sightings by default.
+        :type max_age: float
+
+        :return: The sightings of the MAC (dictionaries of mac, switch, port, vlan, first_seen and last_seen), the most
+            recent first.
+        :rtype: list of dict
+        """
+        since = 0 if max_age is None else time.time() - max_age
+        return self.__sightings("SELECT mac, switch, port, vlan, first_seen, last_seen FROM sightings "
+                                "WHERE mac = ? AND last_seen >= ? ORDER BY last_seen DESC", (mac_value(mac), since))
+
+    def on_port(self, switch, port, max_age=None):
+        """
+        :return: The sightings on a switch port (see find()), the most recent first.
+        :rtype: list of dict
+        """
+        since = 0 if max_age is None else time.time() - max_age
+        return self.__sightings("SELECT mac, switch, port, vlan, first_seen, last_seen FROM sightings "
+                                "WHERE switch = ? AND port = ? AND last_seen >= ? ORDER BY last_seen DESC",
+                                (switch, port, since))
+
+    def prune(self, max_age):
+        """
+        Removes the sightings that haven't been seen for max_age seconds.
+
+        :return: The number of sightings removed
+        :rtype: int
+        """
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM sightings WHERE last_seen < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def record_sightings(switch, rows, filename=None):
+    """
+    Adds a collected MAC table to the sightings database (see SightingStore.record()).  A database that can't be written
+    (for example, locked by another script for too long) is logged and skipped, as the table has already been collected.
+
+    :return: The number of rows written
+    :rtype: int
+    """
+    try:
+        with SightingStore(filename) as store:
+            return store.record(switch, rows)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug("<SIGHTINGS> Couldn't record the MACs seen on {0}: {1}".format(switch, e))
+        return 0
+
+
+def find_sightings(mac, max_age=None, filename=None):
+    """
+    Looks a MAC up in the sightings database (see SightingStore.find()).  A missing or unreadable database is treated
+    as having no sightings.
+
+    :return: The sightings of the MAC, the most recent first
+    :rtype: list of dict
+    """
+    filename = filename or default_database_filename()
+    if not os.path.isfile(filename):
+        return []
+    try:
+        with SightingStore(filename) as store:
+            return store.find(mac, max_age)
+    except sqlite3.Error as e:
+        logger.debug("<SIGHTINGS> Couldn't read {0}: {1}".format(filename, e))
+        return []
@@ -0,0 +1,444 @@
+"""
+This module parses the output of "show mac address-table" for the Cisco platforms the MAC scripts run against:
+
+- IOS-XE (Catalyst 3850, 9300, 9400, 9600):   "  10    0000.0cfb.9916    DYNAMIC     Gi1/0/1"
+- IOS (ISR, Catalyst 4500):                    "  10      0000.0cfb.9916   dynamic ip,ipx,assigned,other Gi3/1"
+- NX-OS:                                       "*   10     0000.0cfb.9916   dynamic  18        F      F    Eth1/1"
+
+The rows are found with a single precompiled multiline regular expression run over the whole output (with finditer(), or
+findall() when all of the rows are wanted at once), instead of stripping, splitting and testing every line in Python, so
+a core switch table with 200,000 entries is parsed in a fraction of a second.  Headers, legends, totals and rows without
+a numeric VLAN (such as the "All ... CPU" rows) don't match the expression and are skipped.
+
+Rows learned on ports that aren't access ports (the CPU, Vlan interfaces, Port-channels, the NX-OS supervisor
+"sup-eth1" and routed "(R)" ports of its gateway MACs...) are dropped with a PortFilter, which compares the whole port
+name (so "Po" only drops Port-channels, and not "TwoPointFiveGigabitEthernet" ports).  Each distinct port name is only
+checked once, as a table has far fewer ports than rows.
+
+Example:
+
+    parser = MacTableParser()
+    for vlan, mac, port in parser.parse(output):
+        ...
+
+    # Keep the Port-channel rows, to follow a MAC towards the uplinks.
+    parser = MacTableParser(PortFilter(names=["CPU", "Switch"], types=[]), types=["dynamic"])
+
+A MacTable holds the rows in compact arrays instead of tuples of strings (a MAC as a 48 bit integer, the VLAN as a 16
+bit integer and the port as an index into a list of port names), so the tables of every switch in a campus can be held
+at once.  A row takes 14 bytes instead of a few hundred.  Removing duplicates keeps the order of the rows, and the
+sorting and de-duplication use NumPy when it is installed.
+
+    table = MacTable(parser.parse(output))
+    table.dedup()
+    table.sort("port")
+    for vlan, mac, port in table:
+        ...
+    rows_in_vlan_10 = table.vlan_index().get(10, [])
+"""
+
+import re
+import logging
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The port names (compared without case) that are dropped by default.
+EXCLUDED_PORT_NAMES = ["CPU", "Switch", "Router", "Drop", "vPC Peer-Link"]
+# The interface types that are dropped by default, whatever their number.  The CLI abbreviations of a type (down to
+# two letters, such as "Po" or "Port" for "Port-channel") are dropped as well.
+EXCLUDED_PORT_TYPES = ["Vlan", "Port-channel"]
+# The ports starting with these (compared without case) are dropped by default: the NX-OS supervisor ports.
+EXCLUDED_PORT_PREFIXES = ["sup-eth"]
+# NX-OS marks the ports of routed MACs (such as its own gateway MAC on an SVI) with "(R)".
+ROUTED_PORT_SUFFIX = "(R)"
+
+# The number of lines joined and parsed at a time, when the output is given as lines.
+BLOCK_LINES = 10000
+
+MAC_TABLE_ROW = re.compile(r"""
+    ^[ \t]*
+    (?:[*+GOCR~][ \t]+)?                                # NX-OS entry flag
+    (?P<vlan>\d{1,4})[ \t]+
+    (?P<mac>[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4})[ \t]+
+    (?P<type>[A-Za-z_]+)[ \t]+
+    (?:[a-z]+(?:,[a-z]+)*[ \t]+                         # IOS protocols column
+      |\S+[ \t]+[TF][ \t]+[TF][ \t]+)?                  # NX-OS age, Secure and NTFY columns
+    (?P<port>\S+(?:[ \t]+\S+)*)                         # A port, or a list of ports
+    [ \t]*\r?$
+    """, re.MULTILINE | re.VERBOSE)
+
+_PORT_NAME = re.compile(r"^([A-Za-z][A-Za-z-]*?)[ \t]*(\d[\d/.:]*)$")
+
+# Python 2 has no 64 bit array type, but a double holds a 48 bit integer exactly.
+try:
+    MAC_TYPECODE = array('Q').typecode
+except ValueError:
+    MAC_TYPECODE = 'd'
+
+# The types an output can be passed as in one piece (unicode is a separate type in Python 2).
+_STRING_TYPES = (str, type(u""))
+
+
+class PortFilter(object):
+    """
+    Decides which ports the rows of a MAC address table are dropped for, by exact name or by interface type.
+    """
+
+    def __init__(self, names=EXCLUDED_PORT_NAMES, types=EXCLUDED_PORT_TYPES, prefixes=EXCLUDED_PORT_PREFIXES,
+                 routed=True):
+        """
+        :param names: The port names to drop (compared without case), such as "CPU".
+        :type names: list of str
+        :param types: The interface types to drop, such as "Vlan".  A port is dropped if it is the type (or one of its
+                      abbreviations, down to two letters) followed by an interface number, such as "Vl10" or "Vlan10".
+        :type types: list of str
+        :param prefixes: Drop the ports whose name starts with one of these (compared without case), such as "sup-eth".
+        :type prefixes: list of str
+        :param routed: Drop the NX-OS routed ports, such as "sup-eth1(R)" or "Eth1/1(R)".
+        :type routed: bool
+        """
+        self.names = set(name.lower() for name in names)
+        self.prefixes = tuple(prefix.lower() for prefix in prefixes)
+        self.routed = routed
+        self.abbreviations = set()
+        for interface_type in types:
+            interface_type = interface_type.lower()
+            for length in range(2, len(interface_type) + 1):
+                self.abbreviations.add(interface_type[:length])
+        self.__decisions = {}
+
+    def excluded(self, port):
+        """
+        :return: True if the rows for this port should be dropped.
+        :rtype: bool
+        """
+        decision = self.__decisions.get(port)
+        if decision is None:
+            lower = port.lower()
+            match = _PORT_NAME.match(lower)
+            decision = (lower in self.names or bool(match and match.group(1) in self.abbreviations) or
+                        bool(self.prefixes and lower.startswith(self.prefixes)) or
+                        (self.routed and port.endswith(ROUTED_PORT_SUFFIX)))
+            self.__decisions[port] = decision
+        return decision
+
+
+class MacTableParser(object):
+    """
+    Parses "show mac address-table" outputs into (vlan, mac, port) rows.
+    """
+
+    def __init__(self, port_filter=None, types=None):
+        """
+        :param port_filter: The ports to drop the rows of.  Defaults to PortFilter(), which keeps the access ports only.
+                            Use PortFilter(names=[], types=[], prefixes=[], routed=False) to keep every row.
+        :type port_filter: PortFilter
+        :param types: Only keep the rows of these entry types (compared without case), such as ["dynamic"].  All types
+                      are kept by default.
+        :type types: list of str
+        """
+        self.port_filter = PortFilter() if port_filter is None else port_filter
+        self.types = set(entry_type.lower() for entry_type in types) if types else None
+
+    def iter_rows(self, output):
+        """
+        :param output: The output of "show mac address-table" as a string, or as lines (such as an
+                       output_reader.OutputCapture), which are parsed a block at a time.
+        :type output: str or iterable of str
+
+        :return: A generator of (vlan, mac, type, port) tuples for the rows that are kept, in the order of the output.
+        :rtype: generator of tuple
+        """
+        excluded = self.port_filter.excluded
+        types = self.types
+        for text in _blocks(output):
+            for match in MAC_TABLE_ROW.finditer(text):
+                vlan, mac, entry_type, port = match.groups()
+                if excluded(port) or (types is not None and entry_type.lower() not in types):
+                    continue
+                yield vlan, mac, entry_type, port
+
+    def parse(self, output):
+        """
+        Parses a whole output at once.  The rows are collected with findall(), and the port filter is applied to the
+        set of distinct ports before the rows are filtered, which is faster than iter_rows() for a large table.
+
+        :param output: The output of "show mac address-table" (see iter_rows())
+        :type output: str or iterable of str
+
+        :return: The (vlan, mac, port) rows that are kept, in the order of the output.
+        :rtype: list of tuple
+        """
+        entries = []
+        types = self.types
+        for text in _blocks(output):
+            rows = MAC_TABLE_ROW.findall(text)
+            dropped = set(port for port in set(row[3] for row in rows) if self.port_filter.excluded(port))
+            if types is None:
+                entries.extend((vlan, mac, port) for vlan, mac, entry_type, port in rows if port not in dropped)
+            else:
+                entries.extend((vlan, mac, port) for vlan, mac, entry_type, port in rows
+                               if port not in dropped and entry_type.lower() in types)
+        return entries
+
+
+def _blocks(output):
+    if isinstance(output, _STRING_TYPES):
+        yield output
+        return
+    block = []
+    for line in output:
+        block.append(line.rstrip("\r\n"))
+        if len(block) >= BLOCK_LINES:
+            yield "\n".join(block)
+            block = []
+    if block:
+        yield "\n".join(block)
+
+
+def parse_mac_table(output, port_filter=None, types=None):
+    """
+    Parses a "show mac address-table" output with a MacTableParser.
+
+    :return: The (vlan, mac, port) rows that are kept, in the order of the output.
+    :rtype: list of tuple
+    """
+    return MacTableParser(port_filter, types).parse(output)
+
+
+def mac_to_int(mac):
+    """
+    :param mac: A MAC address in any of the usual formats (xxxx.xxxx.xxxx, xx:xx:xx:xx:xx:xx, xx-xx-xx-xx-xx-xx)
+    :type mac: str
+
+    :return: The MAC address as a 48 bit integer.
+    :rtype: int
+    """
+    return int(mac.replace(".", "").replace(":", "").replace("-", ""), 16)
+
+
+def mac_value(mac):
+    """
+    :param mac: A MAC address in any of the usual formats (see mac_to_int()), or its integer value
+    :type mac: str or int
+
+    :return: The MAC address as a 48 bit integer.
+    :rtype: int
+    """
+    if isinstance(mac, _STRING_TYPES):
+        return mac_to_int(mac)
+    return int(mac)
+
+
+def int_to_mac(value):
+    """
+    :return: A 48 bit integer as a MAC address in the Cisco xxxx.xxxx.xxxx format.
+    :rtype: str
+    """
+    digits = "{0:012x}".format(int(value))
+    return "{0}.{1}.{2}".format(digits[0:4], digits[4:8], digits[8:12])
+
+
+class MacTable(object):
+    """
+    A MAC address table held in compact arrays.  Iterating over the table returns (vlan, mac, port) tuples of strings,
+    in the same form as MacTableParser.parse().
+    """
+
+    def __init__(self, rows=None):
+        """
+        :param rows: (vlan, mac, port) rows to add, such as the rows from MacTableParser.parse()
+        :type rows: iterable of tuple
+        """
+        self.macs = array(MAC_TYPECODE)
+        self.vlans = array('H')
+        self.ports = array('I')
+        self.port_names = []
+        self.__port_ids = {}
+        self.__indexes = {}
+        if rows:
+            self.extend(rows)
+
+    def __len__(self):
+        return len(self.macs)
+
+    def __iter__(self):
+        names = self.port_names
+        for mac, vlan, port in zip(self.macs, self.vlans, self.ports):
+            yield str(vlan), int_to_mac(mac), names[port]
+
+    def __getitem__(self, index):
+        return str(self.vlans[index]), int_to_mac(self.macs[index]), self.port_names[self.ports[index]]
+
+    def port_id(self, port):
+        """
+        :return: The index of a port name in self.port_names, which is added if it isn't there yet.
+        :rtype: int
+        """
+        port_id = self.__port_ids.get(port)
+        if port_id is None:
+            port_id = self.__port_ids[port] = len(self.port_names)
+            self.port_names.append(port)
+        return port_id
+
+    def append(self, vlan, mac, port):
+        """
+        :param vlan: The VLAN number
+        :type vlan: int or str
+        :param mac: The MAC address (see mac_to_int()) or a 48 bit integer
+        :type mac: str or int
+        :param port: The port name
+        :type port: str
+        """
+        self.macs.append(mac_value(mac))
+        self.vlans.append(int(vlan))
+        self.ports.append(self.port_id(port))
+        self.__indexes = {}
+
+    def extend(self, rows):
+        """
+        :param rows: (vlan, mac, port) rows to add
+        :type rows: iterable of tuple
+        """
+        port_id = self.port_id
+        macs = []
+        vlans = []
+        ports = []
+        for vlan, mac, port in rows:
+            macs.append(mac_to_int(mac))
+            vlans.append(int(vlan))
+            ports.append(port_id(port))
+        self.macs.extend(macs)
+        self.vlans.extend(vlans)
+        self.ports.extend(ports)
+        self.__indexes = {}
+
+    def __take(self, order):
+        """
+        Keeps the rows at the given indexes, in that order.
+        """
+        if numpy is not None:
+            order = numpy.asarray(order, dtype=numpy.intp)
+            for name in ("macs", "vlans", "ports"):
+                values = getattr(self, name)
+                taken = array(values.typecode)
+                # frombytes() is called fromstring() in Python 2.
+                getattr(taken, "frombytes", getattr(taken, "fromstring", None))(_as_numpy(values)[order].tobytes())
+                setattr(self, name, taken)
+        else:
+            self.macs = array(MAC_TYPECODE, [self.macs[i] for i in order])
+            self.vlans = array('H', [self.vlans[i] for i in order])
+            self.ports = array('I', [self.ports[i] for i in order])
+        self.__indexes = {}
+
+    def dedup(self):
+        """
+        Removes the rows that repeat an earlier (vlan, mac, port) row, keeping the first of each.
+
+        :return: The number of rows that were removed.
+        :rtype: int
+        """
+        count = len(self)
+        if numpy is not None and count:
+            # A MAC (48 bits) and a VLAN (16 bits) fit in one 64 bit key.  lexsort() is stable, so the first row of
+            # each run of equal keys is the first occurrence.
+            keys = (_as_numpy(self.macs).astype(numpy.uint64) << numpy.uint64(16)) | _as_numpy(self.vlans)
+            ports = _as_numpy(self.ports)
+            order = numpy.lexsort([ports, keys])
+            keys = keys[order]
+            ports = ports[order]
+            first = numpy.ones(count, dtype=bool)
+            first[1:] = (keys[1:] != keys[:-1]) | (ports[1:] != ports[:-1])
+            keep = numpy.sort(order[first])
+        else:
+            seen = set()
+            keep = []
+            for index, key in enumerate(zip(self.macs, self.vlans, self.ports)):
+                if key not in seen:
+                    seen.add(key)
+                    keep.append(index)
+        if len(keep) < count:
+            self.__take(keep)
+        return count - len(keep)
+
+    def sort(self, by="mac"):
+        """
+        Sorts the rows.  Rows that are equal on the chosen key stay in the same order.
+
+        :param by: "mac" (then VLAN), "vlan" (then MAC) or "port" (by port name, then VLAN and MAC)
+        :type by: str
+        """
+        if by == "mac":
+            columns = [self.macs, self.vlans]
+        elif by == "vlan":
+            columns = [self.vlans, self.macs]
+        elif by == "port":
+            ranks = array('I', [0] * len(self.port_names))
+            for rank, port_id in enumerate(sorted(range(len(self.port_names)), key=self.port_names.__getitem__)):
+                ranks[port_id] = rank
+            if numpy is not None:
+                columns = [_as_numpy(ranks)[_as_numpy(self.ports)], self.vlans, self.macs]
+            else:
+                columns = [array('I', [ranks[port_id] for port_id in self.ports]), self.vlans, self.macs]
+        else:
+            raise ValueError("Can't sort a MAC table by '{0}'".format(by))
+        if numpy is not None:
+            # lexsort() sorts by the last key first.
+            order = numpy.lexsort([numpy.asarray(_as_numpy(column) if isinstance(column, array) else column)
+                                   for column in reversed(columns)])
+        else:
+            order = sorted(range(len(self)), key=lambda i: tuple(column[i] for column in columns))
+        self.__take(order)
+
+    def __index(self, name, keys):
+        if name not in self.__indexes:
+            index = {}
+            for row, key in enumerate(keys):
+                index.setdefault(key, []).append(row)
+            self.__indexes[name] = index
+        return self.__indexes[name]
+
+    def vlan_index(self):
+        """
+        :return: The row numbers of each VLAN, in order (kept until the table is changed).
+        :rtype: dict of int to list of int
+        """
+        return self.__index("vlan", self.vlans)
+
+    def port_index(self):
+        """
+        :return: The row numbers of each port name, in order (kept until the table is changed).
+        :rtype: dict of str to list of int
+        """
+        names = self.port_names
+        return self.__index("port", (names[port] for port in self.ports))
+
+    def mac_index(self):
+        """
+        :return: The row numbers of each MAC address (as a 48 bit integer), in order (kept until the table is changed).
+        :rtype: dict of int to list of int
+        """
+        return self.__index("mac", (int(mac) for mac in self.macs))
+
+    def rows(self, indexes=None):
+        """
+        :param indexes: The row numbers to return, such as a list from vlan_index().  All rows by default.
+        :type indexes: list of int
+
+        :return: The (vlan, mac, port) rows, with the MAC in the xxxx.xxxx.xxxx format.
+        :rtype: list of tuple
+        """
+        if indexes is None:
+            return list(self)
+        return [self[index] for index in indexes]
+
+
+def _as_numpy(values):
+    return numpy.frombuffer(values, dtype=numpy.dtype(values.typecode))
@@ -0,0 +1,389 @@
+"""
+This module looks up the vendor of MAC addresses in the IEEE registry that ships with this repository
+(MAC-resources/vendorsMaccsv.csv).  The registry assigns blocks of three sizes:
+
+- MA-L (and CID): a 24 bit prefix, such as 00:00:0C
+- MA-M: a 28 bit prefix, such as 00:55:DA:0
+- MA-S (and IAB): a 36 bit prefix, such as 00:50:C2:00:0
+
+A smaller block is carved out of a larger one (00:50:C2 is itself an MA-L held by the IEEE), so a MAC belongs to the
+vendor of the longest prefix it matches.  The prefixes are kept in one dictionary per prefix length, and a lookup tries
+the 36, 28 and 24 bit prefixes of the MAC in turn, so it costs at most three dictionary lookups whatever the size of the
+registry.
+
+The size of a block is taken from the number of digits in its prefix, not from the Block Type column, which is empty in
+some rows (the private blocks, which have no vendor name either).
+
+Reading the 55,000 rows of the CSV file takes a noticeable part of a second, which would be paid every time a script
+is launched.  So the registry is compiled once into a binary file in the cache directory (see
+host_cache.default_cache_dir()): for each prefix length, a sorted array of prefixes and an array of vendor numbers, then
+a table of the distinct vendor names.  Scripts memory-map the compiled file and binary search it, with nothing to parse
+at startup.  The compiled file records the modification time and size of the CSV file it was built from, and is rebuilt
+when the CSV file changes.
+
+Example:
+
+    ouis = load_oui_database()
+    print(ouis.vendor("0000.0c07.ac0a"))        # Cisco Systems, Inc
+    vendors = ouis.lookup([mac for vlan, mac, port in entries])
+
+The compiled file can also be built ahead of time:
+
+    python oui_lookup.py [registry.csv] [compiled.db]
+"""
+
+import io
+import os
+import csv
+import sys
+import mmap
+import struct
+import bisect
+import logging
+
+from mac_table import mac_value
+from host_cache import default_cache_dir
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The IEEE registry in the MAC-resources folder of this repository (next to the crt_tools folder).
+DEFAULT_REGISTRY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MAC-resources",
+                                "vendorsMaccsv.csv")
+
+# The prefix lengths (in bits) of the registry blocks, longest first.
+PREFIX_BITS = (36, 28, 24)
+
+# The vendor name given to private blocks, which the registry lists without a name.
+PRIVATE_VENDOR = "(private)"
+
+# The layout of the compiled file, all little endian:
+#   header:   magic, CSV modification time, CSV size, the number of prefixes of each length, the number of vendors
+#   prefixes: for each length in PREFIX_BITS, the sorted prefixes (uint64) and then their vendor numbers (uint32),
+#             padded to a multiple of 8 bytes
+#   vendors:  the offset of each vendor name in the name table (uint32, one more than the number of vendors, padded to
+#             a multiple of 8 bytes), then the UTF-8 vendor names
+COMPILED_MAGIC = b"OUIDB001"
+COMPILED_HEADER = struct.Struct("<8sdq{0}II".format(len(PREFIX_BITS)))
+
+
+def read_registry(filename=DEFAULT_REGISTRY):
+    """
+    Reads the rows of the registry CSV file (after the header).  Vendor names with commas are quoted in the file, and
+    are handled by the csv module.
+
+    :param filename: The path of the registry CSV file
+    :type filename: str
+
+    :return: A generator of the rows, as lists of (unicode) strings.
+    :rtype: generator of list
+    """
+    # Like utilities.open_csv_for_writing(), the csv module needs a binary file in Python 2 and a text file in Python 3.
+    if sys.version_info[0] < 3:
+        with open(filename, 'rb') as registry_file:
+            reader = csv.reader(registry_file)
+            next(reader, None)
+            for row in reader:
+                yield [field.decode('utf-8') for field in row]
+    else:
+        with io.open(filename, 'r', encoding='utf-8', newline='') as registry_file:
+            reader = csv.reader(registry_file)
+            next(reader, None)
+            for row in reader:
+                yield row
+
+
+def parse_prefix(text):
+    """
+    :param text: A registry prefix, such as "00:50:C2:00:0"
+    :type text: str
+
+    :return: The prefix as an integer and its length in bits, or None if it isn't a 24, 28 or 36 bit prefix.
+    :rtype: tuple
+    """
+    digits = text.strip().replace(":", "").replace("-", "")
+    bits = len(digits) * 4
+    if bits not in PREFIX_BITS:
+        return None
+    try:
+        return int(digits, 16), bits
+    except ValueError:
+        return None
+
+
+class OuiDatabase(object):
+    """
+    Finds the vendor of MAC addresses by longest prefix match against the IEEE registry.
+    """
+
+    def __init__(self, filename=DEFAULT_REGISTRY):
+        """
+        :param filename: The path of the registry CSV file (Mac Prefix, Vendor Name, Private, Block Type, Last Update)
+        :type filename: str
+        """
+        self.filename = filename
+        self.vendors = []
+        self.prefixes = dict((bits, {}) for bits in PREFIX_BITS)
+        vendor_ids = {}
+        skipped = 0
+        for row in read_registry(filename):
+            prefix = parse_prefix(row[0]) if row else None
+            if prefix is None or len(row) < 3:
+                skipped += 1
+                continue
+            name = row[1].strip() or (PRIVATE_VENDOR if row[2].strip().lower() == "true" else "")
+            vendor_id = vendor_ids.get(name)
+            if vendor_id is None:
+                vendor_id = vendor_ids[name] = len(self.vendors)
+                self.vendors.append(name)
+            value, bits = prefix
+            self.prefixes[bits][value] = vendor_id
+        if skipped:
+            logger.debug("<OUI> Skipped {0} rows of {1} without a valid prefix".format(skipped, filename))
+
+    def __len__(self):
+        return sum(len(prefixes) for prefixes in self.prefixes.values())
+
+    def close(self):
+        """
+        Does nothing, as the registry is held in memory (see CompiledOuiDatabase.close()).
+        """
+        pass
+
+    def vendor(self, mac):
+        """
+        :param mac: A MAC address in any of the usual formats (see mac_table.mac_to_int()), or a 48 bit integer
+        :type mac: str or int
+
+        :return: The vendor of the longest registry prefix the MAC matches, or an empty string if none does.
+        :rtype: str
+        """
+        value = mac_value(mac)
+        for bits in PREFIX_BITS:
+            vendor_id = self.prefixes[bits].get(value >> (48 - bits))
+            if vendor_id is not None:
+                return self.vendors[vendor_id]
+        return ""
+
+    def lookup(self, macs):
+        """
+        Finds the vendors of many MACs.  Most MACs in a table share a few prefixes, so each 36 bit prefix is only looked
+        up once.
+
+        :param macs: MAC addresses (see vendor())
+        :type macs: iterable of str or int
+
+        :return: The vendor of each MAC, in the same order (an empty string for MACs that aren't in the registry).
+        :rtype: list of str
+        """
+        seen = {}
+        vendors = []
+        for mac in macs:
+            value = mac_value(mac)
+            key = value >> 12
+            vendor = seen.get(key)
+            if vendor is None:
+                vendor = seen[key] = self.vendor(value)
+            vendors.append(vendor)
+        return vendors
+
+
+
+def default_compiled_filename():
+    """
+    :return: The path of the compiled registry in the cache directory.
+    :rtype: str
+    """
+    return os.path.join(default_cache_dir(), "oui.db")
+
+
+def _padding(size):
+    return b"\0" * (-size % 8)
+
+
+def compile_registry(csv_filename=DEFAULT_REGISTRY, compiled_filename=None):
+    """
+    Compiles the registry CSV file into the binary file that CompiledOuiDatabase reads.  The file is written to a
+    temporary name first and then renamed, so that a script never maps a half written file.
+
+    :param csv_filename: The path of the registry CSV file
+    :type csv_filename: str
+    :param compiled_filename: The path of the compiled file.  Defaults to oui.db in the cache directory.
+    :type compiled_filename: str
+
+    :return: The path of the compiled file
+    :rtype: str
+    """
+    compiled_filename = compiled_filename or default_compiled_filename()
+    stat = os.stat(csv_filename)
+    database = OuiDatabase(csv_filename)
+    sections = []
+    for bits in PREFIX_BITS:
+        prefixes = sorted(database.prefixes[bits].items())
+        keys = struct.pack("<{0}Q".format(len(prefixes)), *[key for key, vendor_id in prefixes])
+        ids = struct.pack("<{0}I".format(len(prefixes)), *[vendor_id for key, vendor_id in prefixes])
+        sections.append(keys + ids + _padding(len(keys) + len(ids)))
+    names = [vendor.encode('utf-8') for vendor in database.vendors]
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    offset_table = struct.pack("<{0}I".format(len(offsets)), *offsets)
+    header = COMPILED_HEADER.pack(COMPILED_MAGIC, stat.st_mtime, stat.st_size,
+                                  *([len(database.prefixes[bits]) for bits in PREFIX_BITS] + [len(names)]))
+
+    directory = os.path.dirname(compiled_filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_filename = compiled_filename + ".tmp"
+    with open(temp_filename, 'wb') as compiled_file:
+        compiled_file.write(header)
+        for section in sections:
+            compiled_file.write(section)
+        compiled_file.write(offset_table + _padding(len(offset_table)))
+        compiled_file.write(b"".join(names))
+    # os.rename() won't replace an existing file on Windows (see host_cache.save_json())
+    if os.name == "nt" and os.path.exists(compiled_filename):
+        os.remove(compiled_filename)
+    os.rename(temp_filename, compiled_filename)
+    logger.debug("<OUI> Compiled {0} prefixes from {1} to {2}".format(len(database), csv_filename, compiled_filename))
+    return compiled_filename
+
+
+def is_stale(compiled_filename, csv_filename=DEFAULT_REGISTRY):
+    """
+    :return: True if the compiled file is missing, unreadable, or wasn't built from the current CSV file (its
+        modification time or size has changed).
+    :rtype: bool
+    """
+    try:
+        with open(compiled_filename, 'rb') as compiled_file:
+            header = COMPILED_HEADER.unpack(compiled_file.read(COMPILED_HEADER.size))
+        stat = os.stat(csv_filename)
+    except (IOError, OSError, struct.error):
+        return True
+    return header[0] != COMPILED_MAGIC or header[1] != stat.st_mtime or header[2] != stat.st_size
+
+
+class _MappedArray(object):
+    """
+    A read-only array of numbers in a buffer, for bisect when memoryview.cast() isn't available (Python 2).
+    """
+
+    def __init__(self, buffer, offset, count, code):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.item = struct.Struct("<" + code)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.item.unpack_from(self.buffer, self.offset + index * self.item.size)[0]
+
+
+class CompiledOuiDatabase(OuiDatabase):
+    """
+    Finds the vendor of MAC addresses by binary searching a memory-mapped compiled registry (see compile_registry()).
+    """
+
+    def __init__(self, compiled_filename):
+        """
+        :param compiled_filename: The path of the compiled file
+        :type compiled_filename: str
+        """
+        self.filename = compiled_filename
+        self.__file = open(compiled_filename, 'rb')
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__views = []
+        header = COMPILED_HEADER.unpack_from(self.__map, 0)
+        if header[0] != COMPILED_MAGIC:
+            self.close()
+            raise IOError("{0} isn't a compiled OUI registry".format(compiled_filename))
+        counts = header[3:3 + len(PREFIX_BITS)]
+        vendor_count = header[-1]
+        offset = COMPILED_HEADER.size
+        self.sections = []
+        for bits, count in zip(PREFIX_BITS, counts):
+            keys = self.__array(offset, count, 'Q')
+            ids = self.__array(offset + 8 * count, count, 'I')
+            self.sections.append((bits, keys, ids))
+            offset += 12 * count + len(_padding(12 * count))
+        self.__offsets = self.__array(offset, vendor_count + 1, 'I')
+        self.__names = offset + 4 * (vendor_count + 1) + len(_padding(4 * (vendor_count + 1)))
+        self.__vendors = {}
+
+    def __array(self, offset, count, code):
+        if hasattr(memoryview, "cast"):
+            view = memoryview(self.__map)[offset:offset + count * struct.calcsize(code)].cast(code)
+            self.__views.append(view)
+            return view
+        return _MappedArray(self.__map, offset, count, code)
+
+    def __len__(self):
+        return sum(len(keys) for bits, keys, ids in self.sections)
+
+    def __vendor_name(self, vendor_id):
+        name = self.__vendors.get(vendor_id)
+        if name is None:
+            start = self.__names + self.__offsets[vendor_id]
+            end = self.__names + self.__offsets[vendor_id + 1]
+            name = self.__vendors[vendor_id] = self.__map[start:end].decode('utf-8')
+        return name
+
+    def vendor(self, mac):
+        """
+        :param mac: A MAC address in any of the usual formats (see mac_table.mac_to_int()), or a 48 bit integer
+        :type mac: str or int
+
+        :return: The vendor of the longest registry prefix the MAC matches, or an empty string if none does.
+        :rtype: str
+        """
+        value = mac_value(mac)
+        for bits, keys, ids in self.sections:
+            key = value >> (48 - bits)
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                return self.__vendor_name(ids[index])
+        return ""
+
+    def close(self):
+        """
+        Unmaps the compiled file.
+        """
+        for view in self.__views:
+            view.release()
+        self.__views = []
+        self.sections = []
+        self.__map.close()
+        self.__file.close()
+
+
+def load_oui_database(csv_filename=DEFAULT_REGISTRY, compiled_filename=None):
+    """
+    Opens the compiled registry, compiling it first if it is missing or older than the CSV file.  If it can't be
+    compiled (the cache directory isn't writable, or the compiled file is in use by another script on Windows), the CSV
+    file is read instead.
+
+    :param csv_filename: The path of the registry CSV file
+    :type csv_filename: str
+    :param compiled_filename: The path of the compiled file.  Defaults to oui.db in the cache directory.
+    :type compiled_filename: str
+
+    :return: The registry
+    :rtype: OuiDatabase or CompiledOuiDatabase
+    """
+    compiled_filename = compiled_filename or default_compiled_filename()
+    try:
+        if is_stale(compiled_filename, csv_filename):
+            compile_registry(csv_filename, compiled_filename)
+        return CompiledOuiDatabase(compiled_filename)
+    except (IOError, OSError, ValueError) as e:
+        logger.debug("<OUI> Can't use the compiled registry {0}, reading {1} instead: {2}".format(
+            compiled_filename, csv_filename, e))
+        return OuiDatabase(csv_filename)
+
+
+if __name__ == "__main__":
+    path = compile_registry(*sys.argv[1:3])
+    print("Compiled {0} to {1}".format(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_REGISTRY, path))
@@ -0,0 +1,270 @@
+"""
+This module reads the output of a command up to the device's prompt, for outputs of any size.  Reading up to a single
+character such as ReadString("#") stops at the first "#" anywhere in the output (an interface description, a banner, a
+comment in the running config), which silently cuts the output short.  Instead, the reader waits for the exact prompt
+at the start of a line.
+
+The output is read in chunks: up to the prompt, or up to a "--More--" if paging wasn't turned off (a space is sent to
+get the next page, and the characters the device uses to erase the "--More--" are removed).  The timeout applies to each
+chunk, so with paging turned off ("terminal length 0") it has to cover the whole output.  It can't be an idle timeout
+instead, read in short slices that are restarted whenever data arrives: a ReadString() that times out consumes whatever
+arrived while it waited, and that part of the output would be lost.  Chunks are collected in a list and joined once at
+the end (or passed straight to a parser, a line at a time, without ever being joined), so a
+multi-megabyte "show run" or "show tech" costs the same per byte as a small output, instead of growing quadratically
+with repeated string concatenation.
+
+Example:
+
+    tab.Screen.Send("show running-config\r")
+    output = read_until_prompt(tab.Screen, "SW1#", timeout=60)
+
+    # Or parse the lines as they arrive, without holding the whole output in memory:
+    read_until_prompt(tab.Screen, "SW1#", sink=parser.feed_line)
+
+capture_command() sends a command and captures its output the same way, into an OutputCapture that keeps the output in
+memory unless it grows past a size threshold, when it is moved to a temporary file with a unique name (so scripts
+running in two tabs at once can't overwrite each other's captures).  This replaces turning on the session log around a
+command and reading the log file back, which costs two passes over the disk for every command.
+
+    with capture_command(tab, "show mac address-table", "SW1#") as capture:
+        for line in capture:
+            ...
+"""
+
+import io
+import os
+import re
+import logging
+import tempfile
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Outputs larger than this (in characters) are spilled to a temporary file instead of being kept in memory.
+DEFAULT_SPILL_THRESHOLD = 16 * 1024 * 1024
+
+# The number of seconds capture_command() waits for a whole output (a full MAC table of a large chassis switch can take
+# minutes).
+DEFAULT_CAPTURE_TIMEOUT = 300
+
+# The paging prompts printed by Cisco devices when "terminal length 0" hasn't been set.
+MORE_PROMPTS = ["--More--", "<--- More --->"]
+
+# The backspaces, spaces and escape codes a device sends to erase a "--More--" before the next page.
+_MORE_ERASE = re.compile(r"^(?:[\b ]+|\x1b\[[0-9;]*[A-Za-z])+")
+
+
+class PromptReader(object):
+    """
+    Reads command output from a SecureCRT screen up to a prompt at the start of a line.
+    """
+
+    def __init__(self, screen, prompt, timeout=30, more_prompts=MORE_PROMPTS, max_pages=100000):
+        """
+        :param screen: The Screen object of the SecureCRT tab (with Synchronous set to True)
+        :param prompt: The full prompt of the device, such as "SW1#"
+        :type prompt: str
+        :param timeout: The number of seconds to wait for each chunk: each page if paging is on, otherwise the whole
+                        output.
+        :type timeout: float
+        :param more_prompts: The paging prompts to answer with a space.
+        :type more_prompts: list of str
+        :param max_pages: Stop answering paging prompts after this many pages, in case the output never ends.
+        :type max_pages: int
+        """
+        self.screen = screen
+        self.prompt = prompt
+        self.timeout = timeout
+        self.more_prompts = list(more_prompts)
+        self.max_pages = max_pages
+        # The prompt is only matched at the start of a line, whichever line ending the device uses.
+        self.anchors = ["\r\n" + prompt, "\n" + prompt]
+        self.pages = 0
+        self.timed_out = False
+
+    def chunks(self):
+        """
+        Reads the output one chunk at a time.
+
+        :return: A generator of the chunks of output, in order.  The prompt itself isn't included.  If the prompt isn't
+            seen within the timeout, the generator stops and self.timed_out is set.
+        :rtype: generator of str
+        """
+        strings = self.anchors + self.more_prompts
+        erase_next = False
+        while True:
+            chunk = self.screen.ReadString(strings, self.timeout)
+            index = self.screen.MatchIndex
+            if erase_next:
+                chunk = _MORE_ERASE.sub("", chunk)
+                erase_next = False
+            if chunk:
+                yield chunk
+            if index == 0:
+                self.timed_out = True
+                logger.debug("<READER> Timed out waiting for '{0}' after {1} pages.".format(self.prompt, self.pages))
+                return
+            if index <= len(self.anchors):
+                return
+            self.pages += 1
+            if self.pages > self.max_pages:
+                self.timed_out = True
+                logger.debug("<READER> Stopped after {0} pages.".format(self.pages))
+                return
+            self.screen.Send(" ")
+            erase_next = True
+
+    def lines(self):
+        """
+        Reads the output one line at a time, so that a parser can work on the lines as they arrive.  Line endings are
+        removed.
+
+        :return: A generator of the lines of output.
+        :rtype: generator of str
+        """
+        partial = ""
+        for chunk in self.chunks():
+            lines = (partial + chunk).replace("\r\n", "\n").split("\n")
+            partial = lines.pop()
+            for line in lines:
+                yield line
+        if partial:
+            yield partial
+
+    def read(self):
+        """
+        :return: The whole output, or an empty string if the prompt wasn't seen within the timeout.
+        :rtype: str
+        """
+        chunks = list(self.chunks())
+        if self.timed_out:
+            return ""
+        return "".join(chunks)
+
+
+def read_until_prompt(screen, prompt, timeout=30, sink=None):
+    """
+    Reads the output of a command that was just sent, up to the prompt at the start of a line (see PromptReader).
+
+    :param screen: The Screen object of the SecureCRT tab (with Synchronous set to True)
+    :param prompt: The full prompt of the device, such as "SW1#"
+    :type prompt: str
+    :param timeout: The number of seconds to wait for each chunk of output (the whole output, if paging is off)
+    :type timeout: float
+    :param sink: If given, a function that is called with each line of output (without its line ending) as it
+                 arrives, and the output isn't kept.
+    :type sink: function
+
+    :return: The output (like ReadString(), an empty string on timeout), or the number of lines passed to the sink.
+    :rtype: str or int
+    """
+    reader = PromptReader(screen, prompt, timeout)
+    if sink is None:
+        return reader.read()
+    count = 0
+    for line in reader.lines():
+        sink(line)
+        count += 1
+    return count
+
+
+class OutputCapture(object):
+    """
+    The output of a command, kept in memory or (above a size threshold) in a temporary file.  Iterating over a capture
+    returns its lines without line endings.  close() removes the temporary file, if one was used.
+    """
+
+    def __init__(self, spill_threshold=DEFAULT_SPILL_THRESHOLD, name="capture"):
+        """
+        :param spill_threshold: The number of characters kept in memory before the output is moved to a file.
+        :type spill_threshold: int
+        :param name: A name for the capture, used in the name of the temporary file.
+        :type name: str
+        """
+        self.spill_threshold = spill_threshold
+        self.name = name
+        self.size = 0
+        self.timed_out = False
+        self.filename = None
+        self.__chunks = []
+        self.__file = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.__file is None and self.size > self.spill_threshold:
+            handle, self.filename = tempfile.mkstemp(prefix="securecrt-{0}-".format(self.name), suffix=".txt")
+            # Port descriptions and banners aren't always ASCII, and the locale's encoding can't always write them
+            self.__file = io.open(handle, 'w', encoding='utf-8')
+            self.__file.write("".join(self.__chunks))
+            self.__chunks = []
+            logger.debug("<CAPTURE> {0} is over {1} characters, spilling to {2}".format(
+                self.name, self.spill_threshold, self.filename))
+        if self.__file is not None:
+            self.__file.write(chunk)
+        else:
+            self.__chunks.append(chunk)
+
+    def text(self):
+        """
+        :return: The whole output as one string (read back from the file, if it was spilled).
+        :rtype: str
+        """
+        if self.filename is None:
+            if len(self.__chunks) > 1:
+                self.__chunks = ["".join(self.__chunks)]
+            return self.__chunks[0] if self.__chunks else ""
+        self.__file.flush()
+        with io.open(self.filename, 'r', encoding='utf-8') as spill_file:
+            return spill_file.read()
+
+    def __iter__(self):
+        if self.filename is None:
+            for line in self.text().splitlines():
+                yield line
+            return
+        self.__file.flush()
+        with io.open(self.filename, 'r', encoding='utf-8') as spill_file:
+            for line in spill_file:
+                yield line.rstrip("\r\n")
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+            os.remove(self.filename)
+            self.filename = None
+        self.__chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def capture_command(tab, command, prompt, timeout=DEFAULT_CAPTURE_TIMEOUT, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+    """
+    Sends a command and captures its output up to the prompt (see PromptReader).  The echoed command is the first line
+    of the capture.
+
+    :param tab: The SecureCRT tab (with Screen.Synchronous set to True), at the CLI prompt
+    :param command: The command to send
+    :type command: str
+    :param prompt: The full prompt of the device, such as "SW1#"
+    :type prompt: str
+    :param timeout: The number of seconds to wait for each chunk of output (the whole output, if paging is off)
+    :type timeout: float
+    :param spill_threshold: The number of characters kept in memory before the output is moved to a temporary file.
+    :type spill_threshold: int
+
+    :return: The captured output.  If the prompt wasn't seen in time, it holds what was received and timed_out is set.
+    :rtype: OutputCapture
+    """
+    name = "tab{0}-{1}".format(getattr(tab, "Index", 0), re.sub(r"\W+", "_", command)[:40])
+    capture = OutputCapture(spill_threshold, name)
+    tab.Screen.Send(command + "\r")
+    reader = PromptReader(tab.Screen, prompt, timeout)
+    for chunk in reader.chunks():
+        capture.write(chunk)
+    capture.timed_out = reader.timed_out
+    return capture
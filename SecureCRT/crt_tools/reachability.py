@@ -0,0 +1,167 @@
+"""
+This module checks which devices in a device list are reachable before any SecureCRT connections are made.  A device
+that is down costs a full ConnectInTab() failure and a response timeout for each protocol that is tried, which adds up
+quickly over a large inventory with stale entries.  Instead, the SSH and Telnet ports of every device are probed in
+parallel with asyncio (with a limit on the number of probes in flight and a short timeout), and each device is tagged as
+reachable or unreachable along with the protocol that should be used to connect to it.
+
+This module requires Python 3 (asyncio).
+
+Example:
+
+    results = probe_hosts(["10.1.1.1", "10.1.1.2"])
+    # {"10.1.1.1": {"ssh": True, "telnet": False}, "10.1.1.2": {"ssh": False, "telnet": False}}
+
+    for device in tag_devices(script.import_device_list()):
+        if device['Reachable'] is False:
+            continue
+        script.connect(device['Hostname'], device['Username'], device['Password'], protocol=device['Protocol'])
+"""
+
+import asyncio
+import logging
+import time
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# The TCP port probed for each protocol, in the order the protocols are preferred.
+DEFAULT_PORTS = (("ssh", 22), ("telnet", 23))
+
+
+async def probe_port(host, port, timeout):
+    """
+    Checks if a TCP connection can be opened to a port on a host.
+
+    :param host: The hostname or IP address to probe
+    :type host: str
+    :param port: The TCP port to probe
+    :type port: int
+    :param timeout: The number of seconds to wait for the connection to open
+    :type timeout: float
+
+    :return: True if the port accepted the connection
+    :rtype: bool
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def _probe_host(host, ports, timeout, semaphore):
+    async with semaphore:
+        results = await asyncio.gather(*[probe_port(host, port, timeout) for _, port in ports])
+    return host, dict(zip([protocol for protocol, _ in ports], results))
+
+
+async def _probe_all(hosts, ports, timeout, concurrency):
+    # Each host probes all of its ports at once, so the number of open sockets is up to concurrency * len(ports).
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*[_probe_host(host, ports, timeout, semaphore) for host in hosts])
+    return dict(results)
+
+
+def probe_hosts(hosts, ports=DEFAULT_PORTS, timeout=2.0, concurrency=100):
+    """
+    Probes the SSH and Telnet ports of all of the hosts in parallel.
+
+    :param hosts: The hostnames or IP addresses to probe.  Duplicates are only probed once.
+    :type hosts: list of str
+    :param ports: (protocol, port) pairs to probe for each host
+    :type ports: tuple
+    :param timeout: The number of seconds to wait for each connection to open
+    :type timeout: float
+    :param concurrency: The maximum number of hosts being probed at the same time
+    :type concurrency: int
+
+    :return: A dictionary with an entry for each host, with a dictionary of protocol to True/False for each protocol.
+    :rtype: dict
+    """
+    unique_hosts = list(dict.fromkeys(hosts))
+    if not unique_hosts:
+        return {}
+    start = time.time()
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(_probe_all(unique_hosts, ports, timeout, concurrency))
+    finally:
+        loop.close()
+    logger.debug("<PROBE> Probed {0} hosts in {1:.2f}s, {2} reachable.".format(
+        len(results), time.time() - start, sum(1 for result in results.values() if any(result.values()))))
+    return results
+
+
+def recommended_protocol(result, requested=""):
+    """
+    Picks the protocol to connect with, based on which ports were open.
+
+    :param result: The dictionary of protocol to True/False for a host, from probe_hosts()
+    :type result: dict
+    :param requested: The protocol from the device list (ssh, ssh1, ssh2, telnet, or empty for any)
+    :type requested: str
+
+    :return: The protocol to pass to Script.connect(), or None if the host can't be reached with the requested protocol
+    :rtype: str
+    """
+    requested = (requested or "").lower()
+    if requested:
+        family = "telnet" if requested == "telnet" else "ssh"
+        return requested if result.get(family) else None
+    if result.get("ssh") and result.get("telnet"):
+        # Both are open, so keep the usual order of SSH2, SSH1 and then Telnet.
+        return ""
+    for protocol, is_open in result.items():
+        if is_open:
+            return protocol
+    return None
+
+
+def tag_devices(devices, ports=DEFAULT_PORTS, timeout=2.0, concurrency=100, batch_size=1000):
+    """
+    Probes the devices from Script.import_device_list() (or stream_device_list()) and yields each one with two keys
+    updated:
+
+    - 'Reachable': True or False, or None for devices that connect through a proxy session and weren't probed (only the
+      jumpbox can tell if they are reachable).
+    - 'Protocol': Set to the protocol that should be used, if the device list didn't already pick one.  Devices with no
+      open port keep their original protocol.
+
+    Devices are probed in batches, so a generator of devices can be tagged without loading all of them into memory.
+
+    :param devices: The device entries (dictionaries with at least 'Hostname' and 'Protocol')
+    :type devices: iterable of dict
+    :param batch_size: The number of devices to probe together
+    :type batch_size: int
+
+    :return: A generator of the same device dictionaries, in the same order.
+    :rtype: generator of dict
+    """
+    batch = []
+    for device in devices:
+        batch.append(device)
+        if len(batch) >= batch_size:
+            for tagged in _tag_batch(batch, ports, timeout, concurrency):
+                yield tagged
+            batch = []
+    for tagged in _tag_batch(batch, ports, timeout, concurrency):
+        yield tagged
+
+
+def _tag_batch(batch, ports, timeout, concurrency):
+    direct = [device['Hostname'] for device in batch if not device.get('Proxy Session')]
+    results = probe_hosts(direct, ports, timeout, concurrency)
+    for device in batch:
+        if device.get('Proxy Session'):
+            device['Reachable'] = None
+            yield device
+            continue
+        protocol = recommended_protocol(results[device['Hostname']], device.get('Protocol'))
+        device['Reachable'] = protocol is not None
+        if protocol is None:
+            logger.debug("<PROBE> {0} is not reachable.".format(device['Hostname']))
+        elif not device.get('Protocol'):
+            device['Protocol'] = protocol
+        yield device
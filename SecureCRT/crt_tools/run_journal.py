@@ -0,0 +1,242 @@
+"""
+This module keeps a journal of a script run over a device list, so that a run that dies part of the way through (a
+SecureCRT crash, a dropped VPN) can be picked up where it stopped instead of starting over.  The journal records the
+status of every device along with the output files written for it and whether its output was parsed.
+
+Each device that finishes is appended to a log next to the journal as one JSON line, so recording a device costs the
+same in a 10,000 device run as in a 10 device one.  When the journal is opened (and when the run is closed) the log is
+replayed into the journal, which is written atomically (see host_cache.save_json()), and the log is removed.  A line
+left half written by a crash is ignored, and that device is simply tried again.
+
+The journal is named after the script and the device list, so launching the same script against the same device list
+finds it again.  Devices that completed are skipped, and devices that failed or were never finished are tried again.
+Once every device in a run has completed, the journal is marked complete and the next launch starts a fresh run.
+
+Example:
+
+    devices = script.import_device_list()
+    journal = script.open_run_journal()
+    for device in journal.pending(devices):
+        journal.start(device)
+        try:
+            script.connect(device['Hostname'], device['Username'], device['Password'])
+            ...
+            journal.finish(device, output_files=[output_filename], parse_status="ok")
+        except ConnectError as e:
+            journal.fail(device, str(e))
+    journal.close()
+"""
+
+import os
+import json
+import time
+import logging
+
+from host_cache import save_json
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+# Device statuses.  A device that is "running" when a journal is loaded was interrupted, and is tried again.
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def device_key(device):
+    """
+    :param device: A device entry from Script.import_device_list() or stream_device_list()
+    :type device: dict
+
+    :return: The key that identifies the device in the journal.  The proxy session is included, as the same hostname
+        can be a different device behind different jumpboxes.
+    :rtype: str
+    """
+    if device.get('Proxy Session'):
+        return "{0}@{1}".format(device['Hostname'], device['Proxy Session'])
+    return device['Hostname']
+
+
+class RunJournal(object):
+    """
+    The status of each device in a run over a device list, logged to a file as the run goes.
+    """
+
+    def __init__(self, filename, device_list_filename=None):
+        """
+        :param filename: The path of the journal file.  An unfinished journal found there is resumed.
+        :type filename: str
+        :param device_list_filename: The device list the run is over, recorded in the journal for reference.
+        :type device_list_filename: str
+        """
+        self.filename = filename
+        self.log_filename = filename + ".log"
+        self.resumed = False
+        self.skipped = 0
+        self.retried = 0
+        self.seen = set()
+        self.data = None
+        if os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as journal_file:
+                    self.data = json.load(journal_file)
+            except (IOError, ValueError) as e:
+                logger.debug("<JOURNAL> Ignoring unreadable journal {0}: {1}".format(filename, e))
+        if self.data:
+            self.__replay()
+        if self.data and not self.data.get("complete"):
+            self.resumed = True
+            self.data["runs"] += 1
+            logger.debug("<JOURNAL> Resuming run from {0} ({1} devices recorded)".format(filename,
+                                                                                       len(self.data["devices"])))
+        else:
+            self.data = {"device_list": device_list_filename, "started": time.time(), "runs": 1, "complete": False,
+                         "devices": {}}
+        self.data["device_list"] = device_list_filename or self.data.get("device_list")
+        self.save()
+
+    def __replay(self):
+        # Apply the devices logged since the journal was last saved
+        if not os.path.isfile(self.log_filename):
+            return
+        count = 0
+        with open(self.log_filename, 'r') as log_file:
+            for line in log_file:
+                try:
+                    key, entry = json.loads(line)
+                except ValueError:
+                    # Half written when the run died
+                    continue
+                self.data["devices"][key] = entry
+                count += 1
+        logger.debug("<JOURNAL> Replayed {0} devices from {1}".format(count, self.log_filename))
+
+    def save(self):
+        """
+        Writes the whole journal, and removes the log of devices it now includes.
+        """
+        save_json(self.filename, self.data)
+        if os.path.isfile(self.log_filename):
+            os.remove(self.log_filename)
+
+    def __log(self, device):
+        key = device_key(device)
+        with open(self.log_filename, 'a') as log_file:
+            log_file.write(json.dumps([key, self.data["devices"][key]]) + "\n")
+
+    def status(self, device):
+        """
+        :return: The status of the device in the journal, or PENDING if it hasn't been recorded.
+        :rtype: str
+        """
+        return self.data["devices"].get(device_key(device), {}).get("status", PENDING)
+
+    def pending(self, devices):
+        """
+        Filters a device list down to the devices that still need to be worked on.  Devices that completed in an earlier
+        attempt at this run are skipped (and counted in self.skipped), and every other device is returned.
+
+        :param devices: The device entries from Script.import_device_list() or stream_device_list()
+        :type devices: iterable of dict
+
+        :return: A generator of the device entries that haven't completed yet.
+        :rtype: generator of dict
+        """
+        for device in devices:
+            self.seen.add(device_key(device))
+            status = self.status(device)
+            if status == DONE:
+                self.skipped += 1
+                continue
+            if status in (FAILED, RUNNING):
+                self.retried += 1
+            self.__entry(device).setdefault("status", PENDING)
+            yield device
+
+    def __entry(self, device):
+        return self.data["devices"].setdefault(device_key(device), {"hostname": device['Hostname'], "attempts": 0})
+
+    def start(self, device):
+        """
+        Marks a device as being worked on.  This isn't saved on its own: if the run dies before the device finishes,
+        the device is simply tried again.
+        """
+        entry = self.__entry(device)
+        entry["status"] = RUNNING
+        entry["attempts"] += 1
+        entry["started"] = time.time()
+
+    def finish(self, device, output_files=None, parse_status=None):
+        """
+        Marks a device as completed, and logs it.
+
+        :param device: The device entry
+        :type device: dict
+        :param output_files: The files written with the output from the device.
+        :type output_files: list of str
+        :param parse_status: How the output was handled, such as "ok", "unparsed" or an error message.
+        :type parse_status: str
+        """
+        entry = self.__entry(device)
+        entry.update({"status": DONE, "finished": time.time(), "output_files": output_files or [],
+                      "parse_status": parse_status, "error": None})
+        self.__log(device)
+
+    def fail(self, device, error, output_files=None):
+        """
+        Marks a device as failed (so it is tried again when the run is resumed), and logs it.
+
+        :param device: The device entry
+        :type device: dict
+        :param error: Why the device failed
+        :type error: str
+        :param output_files: Any files that were written before the failure.
+        :type output_files: list of str
+        """
+        entry = self.__entry(device)
+        entry.update({"status": FAILED, "finished": time.time(), "output_files": output_files or [], "error": error})
+        self.__log(device)
+
+    def counts(self, keys=None):
+        """
+        :param keys: Only count these devices (see device_key()).  All devices in the journal are counted by default.
+        :type keys: set
+
+        :return: The number of devices with each status.
+        :rtype: dict
+        """
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for key, entry in self.data["devices"].items():
+            if keys is None or key in keys:
+                counts[entry["status"]] += 1
+        return counts
+
+    def resume_summary(self):
+        """
+        :return: A description of what was carried over from the earlier attempt, or None if this is a new run.
+        :rtype: str
+        """
+        if not self.resumed:
+            return None
+        counts = self.counts()
+        return ("Resuming run {0} over {1}.\n\n{2} devices already completed and will be skipped.\n"
+                "{3} devices failed and will be tried again, along with any devices that weren't finished."
+                .format(self.data["runs"], self.data["device_list"], counts[DONE], counts[FAILED]))
+
+    def close(self):
+        """
+        Saves the journal.  If every device in the device list completed, the journal is marked complete so the next
+        launch starts a new run.  Devices that were removed from the device list since an earlier attempt don't hold the
+        run open.
+
+        :return: The number of devices in the device list with each status (see counts()).
+        :rtype: dict
+        """
+        counts = self.counts(self.seen)
+        self.data["complete"] = counts[DONE] == len(self.seen)
+        self.save()
+        logger.debug("<JOURNAL> Run {0}: {1} done ({2} skipped from earlier attempts), {3} failed, {4} not finished."
+                     .format("complete" if self.data["complete"] else "incomplete", counts[DONE], self.skipped,
+                             counts[FAILED], counts[PENDING] + counts[RUNNING]))
+        return counts
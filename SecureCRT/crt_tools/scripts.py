@@ -7,13 +7,20 @@ remote devices.
 
 import os
 import sys
+import time
 import logging
 import datetime
 import csv
+import json
 import getpass
 from abc import ABCMeta, abstractmethod
 import sessions
 from settings import SettingsImporter
+from host_cache import HostCache
+from latency_model import LatencyModel
+from jumpbox import JumpboxManager, JumpboxError
+from auth_limiter import AuthRateLimiter, AuthLimitError, is_auth_failure
+from run_journal import RunJournal
 from message_box_const import *
 
 
@@ -33,6 +40,60 @@ class ConnectError(Exception):
     pass
 
 
+# How long (in seconds) the protocol that last worked for a host is trusted before all protocols are tried again.
+PROTOCOL_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+# ################################################  IMPORT  REPORTS  ###################################################
+
+
+class DeviceImportReport(object):
+    """
+    A JSON report of the lines skipped when importing a device list.  Skipped lines are written to the file as they are
+    found (instead of being kept in memory), and the totals are added when the report is closed.  The finished file
+    looks like:
+
+        {"device_list": "devices.csv", "start_line": 0,
+         "skipped_lines": [{"line": 7, "hostname": "", "reason": "no_hostname"}, ...],
+         "summary": {"valid": 4998, "skipped": 2, "resumed": 0, "reasons": {"no_hostname": 1, ...}}}
+    """
+
+    def __init__(self, filename, device_list_filename, start_line=0):
+        self.filename = filename
+        self.valid = 0
+        self.resumed = 0
+        self.skipped = 0
+        self.reasons = {}
+        self.__report_file = open(filename, 'w')
+        self.__report_file.write('{{"device_list": {0}, "start_line": {1}, "skipped_lines": ['
+                                 .format(json.dumps(device_list_filename), start_line))
+
+    def skip(self, line, entry, reason):
+        """
+        Records a skipped line from the device list.
+
+        :param line: The line number in the CSV file (not counting the header)
+        :type line: int
+        :param entry: The line from the CSV file
+        :type entry: dict
+        :param reason: A short code for why the line was skipped, such as "no_hostname"
+        :type reason: str
+        """
+        if self.skipped:
+            self.__report_file.write(", ")
+        self.__report_file.write(json.dumps({"line": line, "hostname": entry.get('Hostname') or "", "reason": reason},
+                                            sort_keys=True))
+        self.skipped += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def close(self):
+        if self.__report_file.closed:
+            return
+        summary = {"valid": self.valid, "skipped": self.skipped, "resumed": self.resumed, "reasons": self.reasons}
+        self.__report_file.write('], "summary": {0}}}\n'.format(json.dumps(summary, sort_keys=True)))
+        self.__report_file.close()
+
+
 # ################################################    APP  CLASSES    ##################################################
 
 class Script:
@@ -110,6 +171,15 @@ class Script:
             self.output_dir = os.path.realpath(full_path)
         self.validate_dir(self.output_dir)
 
+        # Facts learned about devices on earlier runs (such as their exact prompts) are kept under the output directory.
+        self.host_cache = HostCache(os.path.join(self.output_dir, "cache", "hosts.json"))
+        # How long devices took to respond on earlier runs, used to pick timeouts instead of a single fixed value.
+        self.latency = LatencyModel(os.path.join(self.output_dir, "cache", "latency.json"))
+        # Meters logins per credential and AAA domain, so large runs stay under the limits of the AAA servers.
+        self.auth_limiter = AuthRateLimiter(os.path.join(self.output_dir, "cache", "auth_limiter.json"))
+        # The last device list imported, which open_run_journal() names the journal after.
+        self.device_list_filename = None
+
         # Check if Debug Mode is enabled.
         if self.settings.getboolean("Global", "debug_mode"):
             self.debug_dir = os.path.join(self.output_dir, "debugs")
@@ -207,118 +277,108 @@ class Script:
         - If the enable password is missing, the method will ask the user if they want to set a default enable to use
         - If the IP is included then the device will be reached through the jumpbox, otherwise connect directly.
 
+        An optional 'AAA Domain' column names the group of devices that authenticate against the same AAA servers, which
+        is used to meter logins (see auth_limiter.py and self.auth_limiter.schedule()).  When it is empty, the proxy
+        session is used, or "default" for devices that are connected to directly.
+
+        This loads the whole device list into memory.  For large inventories use stream_device_list() instead, which
+        this method is built on.
+
         :return: A list where each entry is a dictionary representing a device and the associated login information.
         :rtype: list of dict
         """
-        # Get the filename of the device list CSV file.
-        self.logger.debug("<IMPORT_DEVICES> Prompting for input CSV file.")
-        device_list_filename = ""
-        device_list_filename = self.file_open_dialog("Please select a device list CSV file.", "Open",
-                                                     device_list_filename, "CSV Files (*.csv)|*.csv||")
-        if device_list_filename == "":
-            self.logger.debug("<IMPORT_DEVICES> No filename received from dialog window.  Exiting.")
+        devices = self.stream_device_list()
+        if devices is None:
             return
+        return list(devices)
 
-        self.logger.debug("<IMPORT_DEVICES> Starting processing of device CSV file.")
-        # Track how many lines of the CSV are skipped.
-        skipped_lines = 0
-
-        # The username that will be used when one isn't given in the CSV.  This will be prompted for when an empty
-        # username field is found.
-        device_list = []
-        default_username = None
-        default_enable = None
-        prompt_enable = True
-        credentials = {}
-        required_header = {'Hostname', 'Protocol', 'Username'}
-
-        # Extract the list of devices into a data structure we can use (and fill in any gaps needed).
-        with open(device_list_filename, 'r') as device_file:
-            device_csv = csv.DictReader(device_file)
-
-            # Get a list of all the header values found in the CSV in lowercase.
-            header = set(device_csv.fieldnames)
-            if required_header.difference(header):
-                raise ScriptError("CSV file does not have a valid header row.\n"
-                                  "Please see the documentation or the templates/sample_device_list.csv file for an "
-                                  "example")
-
-            line = 0
-            for entry in device_csv:
-                line += 1
-
-                if not entry['Hostname']:
-                    self.logger.debug("<IMPORT_DEVICES> Skipping CSV line {0} because no hostname exists.".format(line))
-                    skipped_lines += 1
+    def stream_device_list(self, device_list_filename=None, report_filename=None, start_line=0):
+        """
+        The streaming version of import_device_list(), for very large device lists.  The CSV format and the handling of
+        missing fields are the same as import_device_list().
+
+        The CSV file is read once up front to validate every line and to find out which credentials are missing.  All of
+        the questions for missing credentials (default username, passwords for each username, default enable password)
+        are then asked together, before any device is returned, so that a long run isn't stopped half way through by a
+        password prompt.  The devices are returned through a generator that reads the CSV file again as the devices are
+        used, so memory use doesn't grow with the size of the device list.
+
+        Every skipped line is written, with the reason it was skipped, to a JSON report file in the output directory.
+
+        :param device_list_filename: The CSV file to import.  If not given, the user is prompted to select a file.
+        :type device_list_filename: str
+        :param report_filename: Where to write the report of skipped lines.  Defaults to a file in the output directory.
+        :type report_filename: str
+        :param start_line: Resume a previous run by skipping all CSV lines up to and including this line number (the
+            header is line 0).  Each device entry has its line number under the 'Line' key.
+        :type start_line: int
+
+        :return: A generator of dictionaries, one for each device and the associated login information, or None if the
+            user cancelled.
+        :rtype: generator of dict
+        """
+        if not device_list_filename:
+            self.logger.debug("<IMPORT_DEVICES> Prompting for input CSV file.")
+            device_list_filename = self.file_open_dialog("Please select a device list CSV file.", "Open", "",
+                                                         "CSV Files (*.csv)|*.csv||")
+            if device_list_filename == "":
+                self.logger.debug("<IMPORT_DEVICES> No filename received from dialog window.  Exiting.")
+                return
+
+        if not report_filename:
+            base_name = os.path.splitext(os.path.basename(device_list_filename))[0]
+            report_filename = os.path.join(self.output_dir, "{0}-{1}-import_report.json".format(base_name,
+                                                                                              self.datetime))
+
+        self.device_list_filename = device_list_filename
+
+        # First pass: validate every line and find out which credentials need to be asked for.
+        self.logger.debug("<IMPORT_DEVICES> Validating device CSV file {0}.".format(device_list_filename))
+        report = DeviceImportReport(report_filename, device_list_filename, start_line)
+        missing_passwords = {}
+        missing_username = 0
+        missing_enable = 0
+        try:
+            for line, entry in self.__read_device_csv(device_list_filename):
+                if line <= start_line:
+                    report.resumed += 1
                     continue
-
-                if entry['Protocol'].lower() not in ['', 'ssh', 'ssh1', 'ssh2', 'telnet']:
-                    self.logger.debug("<IMPORT_DEVICES> Skipping CSV line {0} because no valid protocol.".format(line))
-                    skipped_lines += 1
+                reason = self.__validate_device_entry(entry)
+                if reason:
+                    report.skip(line, entry, reason)
                     continue
-
+                report.valid += 1
                 if not entry['Username']:
-                    if default_username:
-                        entry['Username'] = default_username
-                        self.logger.debug("<IMPORT_DEVICES> Using default username '{0}', for host {1}."
-                                          .format(default_username, entry['Hostname']))
-                    else:
-                        self.logger.debug(
-                            "<IMPORT_DEVICES> Didn't find username for host '{0}'.  Prompting for DEFAULT."
-                            .format(entry['Hostname']))
-                        default_username = self.prompt_window("Enter the DEFAULT USERNAME to use.")
-                        if not default_username:
-                            self.logger.debug("<IMPORT_DEVICES> Default username not provided.  Stopping".format(line))
-                            error = "Found hosts without usernames and no default username provided."
-                            raise ScriptError(error)
-                        else:
-                            self.logger.debug("<IMPORT_DEVICES> Using default username '{0}', for host {1}."
-                                              .format(default_username, entry['Hostname']))
-                            entry['Username'] = default_username
-
-                if "Password" not in header:
-                    entry['Password'] = ""
+                    missing_username += 1
                 if not entry['Password']:
-                    try:
-                        entry['Password'] = credentials[entry['Username']]
-                    except KeyError:
-                        self.logger.debug("<IMPORT_DEVICES> Prompting for password for username '{0}'"
-                                          .format(entry['Username']))
-                        password = self.prompt_window("Enter the password for USER: {0}".format(entry['Username']),
-                                                      hide_input=True)
-                        if password:
-                            credentials[entry['Username']] = password
-                            entry['Password'] = password
-                        else:
-                            self.logger.debug("<IMPORT_DEVICES> Skipping {0}.  No password for user.".format(line[0]))
-                            skipped_lines += 1
-                            continue
-
-                if "Enable" not in header:
-                    entry['Enable'] = ""
-                if not entry["Enable"]:
-                    if default_enable:
-                        entry["Enable"] = default_enable
-                    elif prompt_enable:
-                        self.logger.debug(
-                            "<IMPORT_DEVICES> Devices without enable passwords found.  Prompting for password.")
-                        enable_msg = "Devices were found without enable passwords listed.  Do you want to enter a " \
-                                     "default enable password?"
-                        result = self.message_box(enable_msg, "No Enable PW", BUTTON_YESNO | ICON_QUESTION)
-                        if result == IDYES:
-                            default_enable = self.prompt_window("Enter default ENABLE password", "Enter Enable",
-                                                                hide_input=True)
-                            entry["Enable"] = default_enable
-                        else:
-                            prompt_enable = False
-
-                device_list.append(entry)
+                    missing_passwords[entry['Username']] = missing_passwords.get(entry['Username'], 0) + 1
+                if not entry['Enable']:
+                    missing_enable += 1
+
+            # Ask all of the credential questions at once.
+            credentials = self.__prompt_missing_credentials(missing_username, missing_passwords, missing_enable)
+            default_username, passwords, default_enable = credentials
+
+            # Lines for usernames that the user didn't give a password for are skipped.  Only re-read the file for
+            # those lines if there are any.
+            declined = [user for user in missing_passwords if not passwords.get(user or default_username)]
+            if declined:
+                for line, entry in self.__read_device_csv(device_list_filename):
+                    if line > start_line and not self.__validate_device_entry(entry) and not entry['Password'] \
+                            and entry['Username'] in declined:
+                        report.skip(line, entry, "no_password")
+                        report.valid -= 1
+        finally:
+            report.close()
 
         # Give stats on how many devices were found and prompt user before going forward with connections.
         validate_message = "{0} devices found in CSV.\n" \
-                           "{1} lines in CSV skipped.\n" \
-                           "\n" \
-                           "Do you want to proceed?".format(len(device_list), skipped_lines)
+                           "{1} lines in CSV skipped.\n".format(report.valid, report.skipped)
+        if report.resumed:
+            validate_message += "{0} lines already done in a previous run.\n".format(report.resumed)
+        if report.skipped:
+            validate_message += "Skipped lines are listed in {0}\n".format(report_filename)
+        validate_message += "\nDo you want to proceed?"
         message_box_design = ICON_QUESTION | BUTTON_CANCEL | DEFBUTTON2
         self.logger.debug("<IMPORT_DEVICES> Prompting the user to continue with updates.")
         result = self.message_box(validate_message, "Ready to Start?", message_box_design)
@@ -328,7 +388,176 @@ class Script:
             self.logger.debug("<IMPORT_DEVICES> User chose to cancel the script.")
             return
 
-        return device_list
+        return self.__generate_devices(device_list_filename, start_line, default_username, passwords, default_enable)
+
+    def probe_device_list(self, devices, timeout=2.0, concurrency=100):
+        """
+        Checks which devices from import_device_list() or stream_device_list() are reachable, by probing their SSH and
+        Telnet ports in parallel before any connections are made.  Each device is returned with 'Reachable' set to
+        True, False or None (devices behind a proxy session aren't probed) and, if the device list didn't specify a
+        protocol, 'Protocol' set to the one that should be passed to connect().  See reachability.py for details.
+
+        The probes require Python 3.  Under Python 2 the devices are returned unchanged.
+
+        :param devices: The device entries from import_device_list() or stream_device_list()
+        :type devices: iterable of dict
+        :param timeout: The number of seconds to wait for each port to answer
+        :type timeout: float
+        :param concurrency: The maximum number of devices probed at the same time
+        :type concurrency: int
+
+        :return: A generator of the device entries, in the same order.
+        :rtype: generator of dict
+        """
+        try:
+            import reachability
+        except (ImportError, SyntaxError):
+            self.logger.debug("<PROBE> Reachability probes are not supported by this Python version.  Skipping.")
+            return iter(devices)
+        return reachability.tag_devices(devices, timeout=timeout, concurrency=concurrency)
+
+    def open_run_journal(self, device_list_filename=None):
+        """
+        Opens the journal for a run of this script over a device list, so that a run that is stopped part of the way
+        through can be resumed (see run_journal.py).  The journal is kept in the "journals" folder of the output
+        directory and is named after the script and the device list, so launching the same script against the same
+        device list resumes the earlier run.  If there is an unfinished run to resume, a summary of it is shown.
+
+        :param device_list_filename: The device list the run is over.  Defaults to the last device list imported with
+                                     import_device_list() or stream_device_list().
+        :type device_list_filename: str
+
+        :return: The journal to record the status of each device in.
+        :rtype: RunJournal
+        """
+        device_list_filename = device_list_filename or self.device_list_filename
+        if not device_list_filename:
+            raise ScriptError("A device list must be imported before a run journal can be opened.")
+        journal_filename = os.path.join(self.output_dir, "journals", "{0}-{1}.json".format(
+            os.path.splitext(self.script_name)[0], os.path.splitext(os.path.basename(device_list_filename))[0]))
+        journal = RunJournal(journal_filename, os.path.realpath(device_list_filename))
+        summary = journal.resume_summary()
+        if summary:
+            self.logger.debug("<JOURNAL> {0}".format(summary.replace("\n", " ")))
+            self.message_box(summary, "Resuming Run", ICON_INFO)
+        return journal
+
+    def __read_device_csv(self, device_list_filename):
+        """
+        Reads the device list CSV one line at a time.  Missing optional columns are filled in with empty strings.
+
+        :return: A generator of (line number, entry) tuples.  The first line after the header is line 1.
+        :rtype: generator of (int, dict)
+        """
+        required_header = {'Hostname', 'Protocol', 'Username'}
+        with open(device_list_filename, 'r') as device_file:
+            device_csv = csv.DictReader(device_file)
+            if required_header.difference(device_csv.fieldnames or []):
+                raise ScriptError("CSV file does not have a valid header row.\n"
+                                  "Please see the documentation or the templates/sample_device_list.csv file for an "
+                                  "example")
+
+            line = 0
+            for entry in device_csv:
+                line += 1
+                for field in ('Hostname', 'Protocol', 'Username', 'Password', 'Enable'):
+                    if not entry.get(field):
+                        entry[field] = ""
+                yield line, entry
+
+    def __validate_device_entry(self, entry):
+        """
+        :return: The reason a device list entry must be skipped, or None if it is valid.
+        :rtype: str
+        """
+        if not entry['Hostname']:
+            return "no_hostname"
+        if entry['Protocol'].lower() not in ['', 'ssh', 'ssh1', 'ssh2', 'telnet']:
+            return "invalid_protocol"
+        return None
+
+    def __prompt_missing_credentials(self, missing_username, missing_passwords, missing_enable):
+        """
+        Asks the user for all of the credentials missing from the device list, after first showing a single summary of
+        everything that will be asked for.
+
+        :param missing_username: The number of devices without a username.
+        :type missing_username: int
+        :param missing_passwords: The number of devices without a password, for each username ('' for no username).
+        :type missing_passwords: dict
+        :param missing_enable: The number of devices without an enable password.
+        :type missing_enable: int
+
+        :return: A tuple of (default username, dictionary of passwords by username, default enable password).
+        :rtype: (str, dict, str)
+        """
+        default_username = None
+        passwords = {}
+        default_enable = None
+
+        questions = []
+        if missing_username:
+            questions.append("- A DEFAULT USERNAME for {0} devices without one".format(missing_username))
+        for username in sorted(user for user in missing_passwords if user):
+            questions.append("- The password for USER: {0} ({1} devices)".format(username, missing_passwords[username]))
+        if "" in missing_passwords:
+            questions.append("- The password for the default username ({0} devices)".format(missing_passwords[""]))
+        if missing_enable:
+            questions.append("- Optionally, a default ENABLE password for {0} devices without one"
+                             .format(missing_enable))
+        if not questions:
+            return default_username, passwords, default_enable
+
+        self.logger.debug("<IMPORT_DEVICES> Prompting for {0} missing credentials.".format(len(questions)))
+        self.message_box("The device list is missing some credentials.  You will now be asked for:\n\n{0}"
+                         .format("\n".join(questions)), "Missing Credentials", ICON_INFO)
+
+        if missing_username:
+            default_username = self.prompt_window("Enter the DEFAULT USERNAME to use.")
+            if not default_username:
+                self.logger.debug("<IMPORT_DEVICES> Default username not provided.  Stopping")
+                error = "Found hosts without usernames and no default username provided."
+                raise ScriptError(error)
+
+        for username in sorted(missing_passwords):
+            username = username or default_username
+            if username in passwords:
+                continue
+            self.logger.debug("<IMPORT_DEVICES> Prompting for password for username '{0}'".format(username))
+            passwords[username] = self.prompt_window("Enter the password for USER: {0}".format(username),
+                                                     hide_input=True)
+            if not passwords[username]:
+                self.logger.debug("<IMPORT_DEVICES> No password for user {0}.  Skipping its devices.".format(username))
+
+        if missing_enable:
+            self.logger.debug("<IMPORT_DEVICES> Devices without enable passwords found.  Prompting for password.")
+            enable_msg = "Devices were found without enable passwords listed.  Do you want to enter a " \
+                         "default enable password?"
+            result = self.message_box(enable_msg, "No Enable PW", BUTTON_YESNO | ICON_QUESTION)
+            if result == IDYES:
+                default_enable = self.prompt_window("Enter default ENABLE password", "Enter Enable", hide_input=True)
+
+        return default_username, passwords, default_enable
+
+    def __generate_devices(self, device_list_filename, start_line, default_username, passwords, default_enable):
+        """
+        Reads the device list CSV again and yields each valid device with the missing credentials filled in.
+        """
+        for line, entry in self.__read_device_csv(device_list_filename):
+            if line <= start_line or self.__validate_device_entry(entry):
+                continue
+            if not entry['Username']:
+                entry['Username'] = default_username
+            if not entry['Password']:
+                entry['Password'] = passwords.get(entry['Username'])
+                if not entry['Password']:
+                    continue
+            if not entry['Enable'] and default_enable:
+                entry['Enable'] = default_enable
+            if not entry.get('AAA Domain'):
+                entry['AAA Domain'] = entry.get('Proxy Session') or "default"
+            entry['Line'] = line
+            yield entry
 
     @abstractmethod
     def connect_ssh(self, host, username, password, version=None, proxy=None, prompt_endings=("#", ">")):
@@ -381,7 +610,8 @@ class Script:
         pass
 
     @abstractmethod
-    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">")):
+    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">"),
+                aaa_domain=None):
         """
         Attempts to connect to a device by any available protocol, starting with SSH2, then SSH1, then telnet
 
@@ -403,6 +633,9 @@ class Script:
                                Cisco devices (">" and "#"), but may need to be changed if connecting to another
                                type of device (for example "$" for some linux hosts).
         :type prompt_endings: list
+        :param aaa_domain: The group of devices that authenticate against the same AAA servers, used to meter logins
+                           (see auth_limiter.py).  Defaults to the proxy session, or "default" without one.
+        :type aaa_domain: str
         """
         pass
 
@@ -517,27 +750,124 @@ class CRTScript(Script):
         # Set up SecureCRT tab for interaction with the scripts
         self.main_session = sessions.CRTSession(self, self.crt.GetScriptTab())
 
-    def __post_connect_check(self, endings):
+        # One tab logged into each jumpbox, reused for every device reached through that jumpbox.  The script works
+        # with one device at a time, so a second tab to the same jumpbox would never be used.
+        self.jumpboxes = JumpboxManager(self.crt, default_cap=1)
+        self.__jumpbox_channel = None
+
+    def __post_connect_check(self, endings, host=None, connect_start=None):
         """
         Validates that we've gotten to the prompt after a connection is made.
 
+        The first time we connect to a host, we wait for one of the prompt endings and then send a test string (followed
+        by backspaces) to make sure the device echoes it, since a prompt ending could also be part of a login banner.
+        The prompt line is then saved in the host cache.  On later connections to the same host, the prompt is
+        confirmed by matching the whole line the cursor is on against the cached prompt, which avoids the extra round
+        trip of the test string.  If the cached prompt isn't seen, this falls back to the test string and learns the
+        prompt again.
+
         :param endings: A list of strings, where each string is a possible character that would be found at the end
                         of the CLI prompt for the remote device.
         :type endings: list
+        :param host: The host we connected to, used to look up and save the prompt in the host cache.
+        :type host: str
+        :param connect_start: The time.time() when the connection was started, used to log how long each phase took.
+        :type connect_start: float
         """
         self.logger.debug("<CONN_CHECK> Started looking for following prompt endings: {0}".format(endings))
+        screen = self.main_session.screen
+        timeout = self.main_session.response_timeout
+        if host:
+            timeout = self.latency.timeout(host, "connect prompt", timeout)
+        check_start = time.time()
+        cached_prompt = self.host_cache.get(host, "prompt") if host else None
+        prompt_chars = tuple(ending.strip() for ending in endings if ending.strip())
+
+        probe_time = 0.0
         at_prompt = False
         while not at_prompt:
-            found = self.main_session.screen.WaitForStrings(endings, self.main_session.response_timeout)
+            wait_start = time.time()
+            found = screen.WaitForStrings(endings, timeout)
             if not found:
-                raise sessions.InteractionError("Timeout reached looking for prompt endings: {0}".format(endings))
-            else:
-                test_string = "!@&^"
-                self.main_session.screen.Send(test_string + "\b" * len(test_string))
-                result = self.main_session.screen.WaitForStrings(test_string, self.main_session.response_timeout)
-                if result:
-                    self.logger.debug("<CONN_CHECK> At prompt.  Continuing".format(result))
+                if host:
+                    self.latency.timed_out(host, "connect prompt", timeout, time.time() - wait_start)
+                    self.latency.save()
+                if cached_prompt:
+                    # The prompt might have changed since it was cached (or be the only output), so try the test string.
+                    self.logger.debug("<CONN_CHECK> Cached prompt '{0}' not found.  Probing.".format(cached_prompt))
+                    self.host_cache.invalidate(host, "prompt")
+                    cached_prompt = None
+                else:
+                    raise sessions.InteractionError("Timeout reached looking for prompt endings: {0}".format(endings))
+
+            line = self.__get_cursor_line(screen)
+            if cached_prompt:
+                if line == cached_prompt:
+                    self.logger.debug("<CONN_CHECK> Matched cached prompt '{0}'.  Continuing".format(line))
                     at_prompt = True
+                continue
+
+            probe_start = time.time()
+            test_string = "!@&^"
+            screen.Send(test_string + "\b" * len(test_string))
+            result = screen.WaitForStrings(test_string, timeout)
+            probe_time += time.time() - probe_start
+            if result:
+                self.logger.debug("<CONN_CHECK> At prompt.  Continuing".format(result))
+                at_prompt = True
+                # The test string is echoed right after the real prompt (a prompt ending in a banner isn't cached).
+                line = self.__get_cursor_line(screen)
+                if line.endswith(test_string):
+                    line = line[:-len(test_string)].strip()
+
+        end = time.time()
+        if host:
+            self.latency.record(host, "connect prompt", end - check_start - probe_time)
+            self.latency.save()
+
+        # Save (or refresh) the prompt for the next connection to this host.
+        if host and line.endswith(prompt_chars):
+            self.host_cache.set(host, "prompt", line)
+            self.host_cache.save()
+
+        self.logger.debug("<CONN_TIMING> {0}: connect {1:.2f}s, prompt wait {2:.2f}s, echo probe {3:.2f}s, total {4:.2f}s"
+                          .format(host, check_start - (connect_start or check_start), end - check_start - probe_time,
+                                  probe_time, end - (connect_start or check_start)))
+
+    def __get_cursor_line(self, screen):
+        """
+        :return: The text on the cursor's row, up to the cursor, with surrounding whitespace removed.
+        :rtype: str
+        """
+        row, column = screen.CurrentRow, screen.CurrentColumn
+        if column <= 1:
+            return ""
+        return screen.Get(row, 1, row, column - 1).strip()
+
+    def __get_cached_protocol(self, host, proxy):
+        """
+        :return: The protocol ("ssh2", "ssh1" or "telnet") that last worked for this host through the same proxy, if
+            it worked recently enough to still be trusted.
+        :rtype: str
+        """
+        cached = self.host_cache.get(host, "protocol", max_age=PROTOCOL_CACHE_TTL)
+        if cached and cached["proxy"] == (proxy or ""):
+            return cached["protocol"]
+        return None
+
+    def __remember_protocol(self, host, protocol, proxy):
+        self.host_cache.set(host, "protocol", {"protocol": protocol, "proxy": proxy or ""})
+        self.host_cache.save()
+
+    def __forget_protocol(self, host, protocol):
+        """
+        Removes the cached protocol for a host if it is the protocol that just failed.
+        """
+        cached = self.host_cache.get(host, "protocol")
+        if cached and cached["protocol"] == protocol:
+            self.logger.debug("<CONNECT> Removing cached protocol {0} for {1}".format(protocol, host))
+            self.host_cache.invalidate(host, "protocol")
+            self.host_cache.save()
 
     def __connect_ssh_2(self, host, username, password, proxy=None, prompt_endings=("#", "# ", ">")):
         if not prompt_endings:
@@ -561,6 +891,7 @@ class CRTScript(Script):
             raise ConnectError("Tab is already connected to another device.")
         else:
             try:
+                connect_start = time.time()
                 self.logger.debug("<CONNECT_SSH2> Attempting Connection to: {0}@{1} via SSH2".format(username, host))
                 tab = self.main_session.session.ConnectInTab(ssh2_string)
                 tab_index = tab.Index
@@ -576,7 +907,7 @@ class CRTScript(Script):
         self.logger.debug("<CONNECT_SSH2> Set Synchronous and IgnoreEscape")
 
         # Make sure banners have printed and we've reached our expected prompt.
-        self.__post_connect_check(expanded_endings)
+        self.__post_connect_check(expanded_endings, host, connect_start)
 
     def __connect_ssh_1(self, host, username, password, proxy=None, prompt_endings=("#", "# ", ">")):
         if not prompt_endings:
@@ -599,6 +930,7 @@ class CRTScript(Script):
             raise ConnectError("Tab is already connected to another device.")
         else:
             try:
+                connect_start = time.time()
                 self.logger.debug("<CONNECT_SSH1> Attempting Connection to: {0}@{1} via SSH1".format(username, host))
                 tab = self.main_session.session.ConnectInTab(ssh1_string)
                 tab_index = tab.Index
@@ -613,7 +945,7 @@ class CRTScript(Script):
         self.logger.debug("<CONNECT_SSH1> Set Synchronous and IgnoreEscape")
 
         # Make sure banners have printed and we've reached our expected prompt.
-        self.__post_connect_check(expanded_endings)
+        self.__post_connect_check(expanded_endings, host, connect_start)
 
     def connect_ssh(self, host, username, password, version=None, proxy=None, prompt_endings=("#", ">")):
         """
@@ -644,23 +976,32 @@ class CRTScript(Script):
         if not prompt_endings:
             raise ConnectError("Cannot connect without knowing what character ends the CLI prompt.")
 
-        if version == 2:
-            self.__connect_ssh_2(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
-        elif version == 1:
-            self.__connect_ssh_1(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
+        if version in (1, 2):
+            versions = [version]
+        elif self.__get_cached_protocol(host, proxy) == "ssh1":
+            # This host only worked with SSH1 last time, so don't wait for SSH2 to fail first.
+            versions = [1, 2]
         else:
+            versions = [2, 1]
+
+        errors = []
+        for attempt in versions:
             try:
-                self.__connect_ssh_2(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
-            except ConnectError as e:
-                self.logger.debug("<CONNECT_SSH> Failure trying SSH2: {0}".format(e.message))
-                ssh2_error = e.message
-                try:
+                if attempt == 2:
+                    self.__connect_ssh_2(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
+                else:
                     self.__connect_ssh_1(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
-                except ConnectError as e:
-                    ssh1_error = e.message
-                    self.logger.debug("<CONNECT_SSH> Failure trying SSH1: {0}".format(e.message))
-                    error = "SSH2 and SSH1 failed.\nSSH2 Failure:{0}\nSSH1 Failure:{1}".format(ssh2_error, ssh1_error)
-                    raise ConnectError(error)
+            except ConnectError as e:
+                self.logger.debug("<CONNECT_SSH> Failure trying SSH{0}: {1}".format(attempt, e))
+                errors.append("SSH{0} Failure:{1}".format(attempt, e))
+                self.__forget_protocol(host, "ssh{0}".format(attempt))
+            else:
+                self.__remember_protocol(host, "ssh{0}".format(attempt), proxy)
+                return
+
+        if len(errors) == 1:
+            raise ConnectError(errors[0])
+        raise ConnectError("SSH2 and SSH1 failed.\n{0}".format("\n".join(sorted(errors, reverse=True))))
 
     def connect_telnet(self, host, username, password, proxy=None, prompt_endings=("#", ">")):
         """
@@ -696,12 +1037,14 @@ class CRTScript(Script):
             raise ConnectError("Tab is already connected to another device.")
         else:
             try:
+                connect_start = time.time()
                 self.logger.debug("<CONNECT_TELNET> Attempting Connection to: {0} via TELNET".format(host))
                 tab = self.main_session.session.ConnectInTab(telnet_string)
                 tab_index = tab.Index
                 self.main_session = sessions.CRTSession(self, self.crt.GetTab(tab_index), prompt_endings=prompt_endings)
             except:
                 error = self.crt.GetLastErrorMessage()
+                self.__forget_protocol(host, "telnet")
                 raise ConnectError(error)
 
         # Set Tab parameters to allow correct sending/receiving of data via SecureCRT
@@ -713,9 +1056,11 @@ class CRTScript(Script):
         self.main_session.telnet_login(username, password)
 
         # Make sure banners have printed and we've reached our expected prompt.
-        self.__post_connect_check(prompt_endings)
+        self.__post_connect_check(prompt_endings, host, connect_start)
+        self.__remember_protocol(host, "telnet", proxy)
 
-    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">")):
+    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">"),
+                aaa_domain=None):
         """
         Attempts to connect to a device by any available protocol, starting with SSH2, then SSH1, then telnet
 
@@ -726,7 +1071,8 @@ class CRTScript(Script):
         :param password: The password that goes with the provided username.  If a password is not specified, the
                          user will be prompted for one.
         :type password: str
-        :param protocol: A string with the desired protocol (telnet, ssh1, ssh2, ssh). If left blank it will try all
+        :param protocol: A string with the desired protocol (telnet, ssh1, ssh2, ssh). If left blank it will first try
+                         the protocol that last worked for this host (from the host cache), and then all of them
                          starting with SSH2, then SSH1 then Telnet.  "ssh" means SSH2 then SSH1.
         :type protocol: str
         :param proxy: The name of a SecureCRT session object that can be used as a jumpbox to proxy the SSH connection
@@ -737,18 +1083,82 @@ class CRTScript(Script):
                                Cisco devices (">" and "#"), but may need to be changed if connecting to another
                                type of device (for example "$" for some linux hosts).
         :type prompt_endings: list
+        :param aaa_domain: The group of devices that authenticate against the same AAA servers, used to meter logins
+                           (see auth_limiter.py).  Defaults to the proxy session, or "default" without one.
+        :type aaa_domain: str
         """
         if not prompt_endings:
             raise ConnectError("Cannot connect without knowing what character ends the CLI prompt.")
 
+        domain = aaa_domain or proxy or "default"
+        self.__acquire_login(username, domain)
+        try:
+            self.__connect(host, username, password, protocol, proxy, prompt_endings)
+        except ConnectError as e:
+            self.__report_login(username, domain, str(e))
+            raise
+        self.__report_login(username, domain)
+
+    def __acquire_login(self, username, domain):
+        """
+        Waits until the AAA rate limits allow another login with the username (see auth_limiter.py).
+        """
+        try:
+            waited = self.auth_limiter.acquire(username, domain)
+        except AuthLimitError as e:
+            raise ConnectError(str(e))
+        if waited:
+            self.logger.debug("<AUTH_LIMIT> Waited {0:.2f}s to log in as {1} ({2})".format(waited, username, domain))
+
+    def __report_login(self, username, domain, error=None):
+        """
+        Reports the result of a login to the rate limiter.  Errors that aren't authentication failures (such as a
+        device that can't be reached) don't count against the credential.
+        """
+        if error is None:
+            self.auth_limiter.report(username, domain, success=True)
+        elif is_auth_failure(error):
+            self.auth_limiter.report(username, domain, success=False)
+        else:
+            return
+        self.auth_limiter.save()
+
+    def __connect(self, host, username, password, protocol, proxy, prompt_endings):
+        """
+        Tries the protocols for connect(), after the login has been allowed by the rate limiter.
+        """
         if not protocol:
+            cached_protocol = self.__get_cached_protocol(host, proxy)
+            cached_error = None
+            if cached_protocol:
+                self.logger.debug("<CONNECT> Trying cached protocol {0} for {1}".format(cached_protocol, host))
+                try:
+                    self.__connect(host, username, password, cached_protocol, proxy, prompt_endings)
+                    return
+                except ConnectError as e:
+                    # The failed protocol was removed from the cache, so fall back to the other protocols.
+                    self.logger.debug("<CONNECT> Cached protocol failed: {0}".format(e))
+                    cached_error = e
+
+            # Don't try the cached protocol a second time: only the other SSH version if it was one of them, and no
+            # telnet if it was telnet.
+            version = {"ssh2": 1, "ssh1": 2}.get(cached_protocol)
             try:
-                self.connect_ssh(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
-            except ConnectError:
+                self.connect_ssh(host, username, password, version=version, proxy=proxy, prompt_endings=prompt_endings)
+                return
+            except ConnectError as e:
+                ssh_error = e if version is None else "{0}\n{1}".format(cached_error, e)
+            if cached_protocol == "telnet":
+                telnet_error = cached_error
+            else:
                 try:
-                    self.connect_telnet(host, username, password, prompt_endings=prompt_endings)
-                except ConnectError:
-                    raise ConnectError("Unable to make a connection with either SSH or Telnet")
+                    self.connect_telnet(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
+                    return
+                except ConnectError as e:
+                    telnet_error = e
+            # Keep both errors, so that an authentication failure can be recognized by the rate limiter.
+            raise ConnectError("Unable to make a connection with either SSH or Telnet\n{0}\n{1}".format(
+                ssh_error, telnet_error))
         elif protocol.lower() == "ssh":
             self.connect_ssh(host, username, password, proxy=proxy, prompt_endings=prompt_endings)
         elif protocol.lower() == "ssh2":
@@ -760,14 +1170,96 @@ class CRTScript(Script):
         else:
             raise ConnectError("Unknown protocol specified.")
 
+    def connect_via_jumpbox(self, host, username, password, proxy, protocol=None, prompt_endings=("#", ">"),
+                            aaa_domain=None):
+        """
+        Connects to a device by logging into it from the command line of a jumpbox, instead of having SecureCRT open a
+        new connection through the jumpbox (the /FIREWALL option used by connect()) for every device.  One tab is kept
+        logged into each jumpbox and is reused for the next device behind it (see jumpbox.py), until close_jumpboxes()
+        is called.  Only one device can be connected at a time, so disconnect() has to be called before connecting to
+        the next one.
+
+        self.jumpboxes.schedule(devices) can be used to order a device list so that a jumpbox that keeps failing doesn't
+        hold up the devices behind the others.  It doesn't reorder around jumpboxes that are only slow.
+
+        :param host: The IP address of DNS name for the device to connect
+        :type host: str
+        :param username: The username to login to the device with
+        :type username: str
+        :param password: The password that goes with the provided username.
+        :type password: str
+        :param proxy: The name of the SecureCRT session for the jumpbox
+        :type proxy: str
+        :param protocol: "telnet" to telnet to the device from the jumpbox, otherwise SSH is used.
+        :type protocol: str
+        :param prompt_endings: A list of strings that are possible prompt endings to watch for.
+        :type prompt_endings: list
+        :param aaa_domain: The group of devices that authenticate against the same AAA servers, used to meter logins
+                           (see auth_limiter.py).  Defaults to the jumpbox session name.
+        :type aaa_domain: str
+        """
+        if self.__jumpbox_channel:
+            raise ConnectError("Already connected to {0} through a jumpbox.".format(self.__jumpbox_channel.device))
+        pool = self.jumpboxes.pool(proxy)
+        try:
+            channel = pool.acquire()
+        except JumpboxError as e:
+            self.jumpboxes.report(proxy, success=False)
+            raise ConnectError(str(e))
+
+        domain = aaa_domain or proxy
+        try:
+            self.__acquire_login(username, domain)
+        except ConnectError:
+            pool.release(channel)
+            raise
+        connect_start = time.time()
+        timeout = self.latency.timeout(host, "jumpbox login", self.main_session.response_timeout)
+        try:
+            channel.connect_device(host, username, password, protocol=protocol, prompt_endings=prompt_endings,
+                                   timeout=timeout)
+        except JumpboxError as e:
+            pool.release(channel)
+            self.__report_login(username, domain, str(e))
+            # A rejected login is a problem with the device or credential, not the jumpbox.
+            self.jumpboxes.report(proxy, success=is_auth_failure(str(e)))
+            raise ConnectError(str(e))
+        self.latency.record(host, "jumpbox login", time.time() - connect_start)
+        self.latency.save()
+        self.__report_login(username, domain)
+        self.jumpboxes.report(proxy, success=True)
+
+        self.__jumpbox_channel = channel
+        self.main_session = sessions.CRTSession(self, channel.tab, prompt_endings=prompt_endings)
+        self.logger.debug("<CONNECT_JUMPBOX> Connected to {0} through {1} in {2:.2f}s".format(
+            host, proxy, time.time() - connect_start))
+
+    def close_jumpboxes(self):
+        """
+        Logs out of all of the jumpbox tabs opened by connect_via_jumpbox().
+        """
+        self.jumpboxes.close()
+
     def disconnect(self, command="exit"):
         """
-        Disconnects the main session used by the script by calling the disconnect method on the session object.
+        Disconnects the main session used by the script by calling the disconnect method on the session object.  If
+        the device was reached with connect_via_jumpbox(), this logs out of the device and returns the tab to the
+        jumpbox pool instead.
 
         :param command: The command to be issued to the remote device to disconnect.  The default is 'exit'
         :type command: str
         """
-        self.main_session.disconnect(command=command)
+        if self.__jumpbox_channel:
+            channel, self.__jumpbox_channel = self.__jumpbox_channel, None
+            try:
+                channel.disconnect_device(command)
+            except JumpboxError as e:
+                self.logger.debug("<DISCONNECT> {0}".format(e))
+            finally:
+                self.jumpboxes.pool(channel.session_name).release(channel)
+            self.main_session = sessions.CRTSession(self, self.crt.GetScriptTab())
+        else:
+            self.main_session.disconnect(command=command)
 
     def message_box(self, message, title="", options=0):
         """
@@ -944,7 +1436,8 @@ class DebugScript(Script):
         self.main_session.prompt = host + "#"
         self.main_session._connected = True
 
-    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">")):
+    def connect(self, host, username, password, protocol=None, proxy=None, prompt_endings=("#", ">"),
+                aaa_domain=None):
         """
         Pretends to connect to a device.  Simply marks the state of the session as connected.  Never fails.
 
@@ -966,6 +1459,9 @@ class DebugScript(Script):
                                Cisco devices (">" and "#"), but may need to be changed if connecting to another
                                type of device (for example "$" for some linux hosts).
         :type prompt_endings: list
+        :param aaa_domain: The group of devices that authenticate against the same AAA servers, used to meter logins
+                           (see auth_limiter.py).  Defaults to the proxy session, or "default" without one.
+        :type aaa_domain: str
         """
         if proxy:
             print "Using session '{}' as a proxy."
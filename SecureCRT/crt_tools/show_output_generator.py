@@ -0,0 +1,631 @@
+"""
+This module generates synthetic (but syntactically faithful) Cisco IOS-XE, IOS (Catalyst 4500) and NX-OS show command
+outputs at any scale, so that the parsers used by our scripts can be benchmarked against realistic inputs without
+needing access to a large production switch.
+
+All outputs for one switch are generated from the same underlying data, so that the outputs agree with each other
+(the ports in the MAC table exist in "show interfaces description", the uplinks in the MAC table have CDP/LLDP
+neighbors and port-channel members, the ARP table uses the same MACs, etc).  The same seed always produces the same
+output.
+
+The supported commands are:
+
+- show mac address-table
+- show interfaces description
+- show cdp neighbors detail
+- show lldp neighbors detail
+- show etherchannel summary (IOS) / show port-channel summary (NX-OS)
+- show ip arp
+
+Example:
+
+    python show_output_generator.py corpus/ --rows 200000 --os iosxe --seed 7
+    python show_output_generator.py corpus/ --rows 50000 --run ../tools-macs/get_mac_csv.py
+"""
+
+import os
+import sys
+import random
+import argparse
+import logging
+
+# Get logger instance, if enabled when main script was launched.
+logger = logging.getLogger("securecrt")
+
+OS_TYPES = ("iosxe", "ios", "nxos")
+
+# A handful of real OUIs, so that vendor lookups against the generated MACs return realistic results.
+VENDOR_OUIS = (0x00000C, 0x0050F2, 0x001B21, 0x3C0754, 0x00155D, 0xF4CE46, 0x001A2B, 0x7CAD74, 0xB8AC6F, 0x00E04C)
+
+# Odd multiplier used to spread a counter over the 24-bit NIC portion of a MAC.  Multiplying by an odd number is a
+# bijection modulo 2^24, so every counter value produces a unique NIC value.
+_NIC_SPREAD = 0x9E3779
+
+_VERSIONS = {
+    "iosxe": "Cisco IOS Software [Amsterdam], Catalyst L3 Switch Software (CAT9K_IOSXE), Version 17.3.4, "
+             "RELEASE SOFTWARE (fc3)",
+    "ios": "Cisco IOS Software, IOS-XE Software, Catalyst 4500 L3 Switch  Software (cat4500es8-UNIVERSALK9-M), "
+           "Version 03.11.03a.E RELEASE SOFTWARE (fc3)",
+    "nxos": "Cisco Nexus Operating System (NX-OS) Software, Version 9.3(8)",
+}
+
+_ACCESS_DESCRIPTIONS = ("Workstation", "Printer", "AP", "Phone", "Camera", "Badge Reader", "Conference Room", "")
+
+
+def format_mac(value):
+    """
+    Formats a 48-bit integer as a Cisco dotted MAC address (xxxx.xxxx.xxxx).
+
+    :param value: The MAC address as an integer.
+    :type value: int
+    :return: The MAC address in Cisco format.
+    :rtype: str
+    """
+    text = "{0:012x}".format(value)
+    return "{0}.{1}.{2}".format(text[0:4], text[4:8], text[8:12])
+
+
+class SwitchCorpus(object):
+    """
+    Synthetic data for a single switch, and methods that render that data as the output of each supported command.
+    """
+
+    def __init__(self, hostname="SW1", os_type="iosxe", rows=1000, seed=0, neighbors=4, port_channels=2,
+                 arp_rows=None, vlans=20):
+        """
+        :param hostname: The hostname of the generated switch.
+        :type hostname: str
+        :param os_type: The OS to generate output for ("iosxe", "ios" for a Catalyst 4500 or "nxos").
+        :type os_type: str
+        :param rows: The number of dynamic entries in the MAC address table.
+        :type rows: int
+        :param seed: The random seed.  The same seed always generates the same outputs.
+        :type seed: int
+        :param neighbors: The number of CDP/LLDP neighbors (uplinks and downstream switches).
+        :type neighbors: int
+        :param port_channels: The number of neighbors that are connected with a 2 member port-channel.
+        :type port_channels: int
+        :param arp_rows: The number of ARP entries (defaults to the number of MAC entries).
+        :type arp_rows: int
+        :param vlans: The number of access VLANs.
+        :type vlans: int
+        """
+        if os_type not in OS_TYPES:
+            raise ValueError("Unknown OS type '{0}'.  Must be one of {1}".format(os_type, OS_TYPES))
+        self.hostname = hostname
+        self.os_type = os_type
+        self.rows = rows
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.vlans = [10 * (i + 1) for i in range(vlans)]
+        self.arp_rows = rows if arp_rows is None else arp_rows
+
+        self.access_ports = self._build_access_ports(max(48, min(rows // 8, 50000)))
+        self.descriptions = dict((port, self.random.choice(_ACCESS_DESCRIPTIONS)) for port in self.access_ports)
+        self.neighbors = self._build_neighbors(neighbors, min(port_channels, neighbors))
+        self.macs = self._build_macs()
+        self._mac_index = None
+
+    # ---- Data generation ----
+
+    def _build_access_ports(self, count):
+        ports = []
+        for index in range(count):
+            member, port = divmod(index, 48)
+            if self.os_type == "nxos":
+                ports.append("Eth{0}/{1}".format(member + 1, port + 1))
+            elif self.os_type == "ios":
+                ports.append("Gi{0}/{1}".format(member + 3, port + 1))
+            else:
+                ports.append("Gi{0}/0/{1}".format(member + 1, port + 1))
+        return ports
+
+    def long_name(self, port):
+        """
+        :param port: A short port name generated by this class (e.g. Gi1/0/1)
+        :type port: str
+        :return: The full port name (e.g. GigabitEthernet1/0/1)
+        :rtype: str
+        """
+        for short, full in (("Gi", "GigabitEthernet"), ("Te", "TenGigabitEthernet"), ("Eth", "Ethernet"),
+                            ("Po", "Port-channel")):
+            if port.startswith(short) and not port.startswith(full):
+                return full + port[len(short):]
+        return port
+
+    def _build_neighbors(self, count, port_channels):
+        neighbors = []
+        for index in range(count):
+            if self.os_type == "nxos":
+                members = ["Eth1/{0}".format(49 + 2 * index), "Eth1/{0}".format(50 + 2 * index)]
+            elif self.os_type == "ios":
+                members = ["Te1/{0}".format(1 + 2 * index), "Te1/{0}".format(2 + 2 * index)]
+            else:
+                members = ["Te1/1/{0}".format(1 + index), "Te2/1/{0}".format(1 + index)]
+            is_channel = index < port_channels
+            if not is_channel:
+                members = members[:1]
+            name = "{0}-NBR{1}".format(self.hostname, index + 1)
+            neighbors.append({
+                "hostname": name,
+                "domain": "example.com",
+                "ip": "10.{0}.{1}.{2}".format(self.seed % 200, index // 250, index % 250 + 2),
+                "platform": self.random.choice(("C9500-48Y4C", "C9300-48P", "N9K-C93180YC-EX", "WS-C3850-48P")),
+                "local_ports": members,
+                "remote_ports": ["Te1/0/{0}".format(1 + i) for i in range(len(members))],
+                "channel": "Po{0}".format(index + 1) if is_channel else None,
+            })
+        return neighbors
+
+    def _build_macs(self):
+        """
+        Builds the list of (vlan, mac, port) entries for the MAC table.  About 10% of MACs are learned on uplinks.
+        """
+        uplinks = [n["channel"] or n["local_ports"][0] for n in self.neighbors]
+        oui_count = len(VENDOR_OUIS)
+        offset = self.random.randrange(1 << 24)
+        entries = []
+        for index in range(self.rows):
+            oui = VENDOR_OUIS[index % oui_count]
+            nic = ((index // oui_count + offset) * _NIC_SPREAD) & 0xFFFFFF
+            if uplinks and self.random.random() < 0.1:
+                port = self.random.choice(uplinks)
+            else:
+                port = self.access_ports[index % len(self.access_ports)]
+            vlan = self.vlans[index % len(self.vlans)]
+            entries.append((vlan, (oui << 24) | nic, port))
+        return entries
+
+    # ---- Command outputs ----
+
+    def show_mac_address_table(self, mac=None):
+        """
+        :param mac: If set, only the entry for this MAC (in xxxx.xxxx.xxxx format) is included, like the output of
+                    "show mac address-table address <mac>".
+        :type mac: str
+        :return: The output of "show mac address-table"
+        :rtype: str
+        """
+        entries = self.macs
+        if mac is not None:
+            if self._mac_index is None:
+                self._mac_index = {}
+                for entry in self.macs:
+                    self._mac_index.setdefault(format_mac(entry[1]), []).append(entry)
+            entries = self._mac_index.get(mac, [])
+        out = []
+        if self.os_type == "nxos":
+            out.append("Legend: \n"
+                       "        * - primary entry, G - Gateway MAC, (R) - Routed MAC, O - Overlay MAC\n"
+                       "        age - seconds since last seen,+ - primary entry using vPC Peer-Link,\n"
+                       "        (T) - True, (F) - False, C - ControlPlane MAC, ~ - vsan\n"
+                       "   VLAN     MAC Address      Type      age     Secure NTFY Ports\n"
+                       "---------+-----------------+--------+---------+------+----+------------------")
+            if mac is None:
+                out.append("G    -     00fe.c8e4.3a1b   static   -         F      F    sup-eth1(R)")
+                out.append("G    {0:<6} 5254.0012.3456   static   -         F      F    sup-eth1(R)".format(
+                    self.vlans[0]))
+            for vlan, value, port in entries:
+                out.append("*   {0:<6} {1}   dynamic  {2:<9} F      F    {3}".format(
+                    vlan, format_mac(value), value % 900, port))
+            return "\n".join(out) + "\n"
+
+        if self.os_type == "ios":
+            out.append("Unicast Entries\n"
+                       " vlan     mac address     type        protocols               port\n"
+                       "---------+---------------+--------+---------------------+-------------------------")
+            if mac is None:
+                out.append("   1      0011.2233.0000   static ip,ipx,assigned,other Switch")
+            for vlan, value, port in entries:
+                out.append("{0:>4}      {1}   dynamic ip,ipx,assigned,other {2}".format(
+                    vlan, format_mac(value), self.long_name(port)))
+            if mac is None:
+                out.append("\nMulticast Entries\n"
+                           " vlan     mac address     type    ports\n"
+                           "---------+---------------+-------+--------------------------------------------\n"
+                           "   1      ffff.ffff.ffff   system Switch")
+            return "\n".join(out) + "\n"
+
+        out.append("          Mac Address Table\n"
+                   "-------------------------------------------\n"
+                   "\n"
+                   "Vlan    Mac Address       Type        Ports\n"
+                   "----    -----------       --------    -----")
+        if mac is None:
+            for cpu_mac in ("0100.0ccc.cccc", "0100.0ccc.cccd", "0180.c200.0000", "0180.c200.0002"):
+                out.append(" All    {0}    STATIC      CPU".format(cpu_mac))
+        for vlan, value, port in entries:
+            out.append("{0:>4}    {1}    DYNAMIC     {2}".format(vlan, format_mac(value), port))
+        out.append("Total Mac Addresses for this criterion: {0}".format(len(entries) + (0 if mac else 4)))
+        return "\n".join(out) + "\n"
+
+    def show_interfaces_description(self):
+        """
+        :return: The output of "show interfaces description"
+        :rtype: str
+        """
+        uplinks = []
+        for neighbor in self.neighbors:
+            for port in neighbor["local_ports"]:
+                uplinks.append((port, "Uplink to {0}".format(neighbor["hostname"])))
+            if neighbor["channel"]:
+                uplinks.append((neighbor["channel"], "Uplink to {0}".format(neighbor["hostname"])))
+        ports = [(port, self.descriptions[port]) for port in self.access_ports] + uplinks
+
+        out = []
+        if self.os_type == "nxos":
+            out.append("-------------------------------------------------------------------------------\n"
+                       "Port          Type   Speed   Description\n"
+                       "-------------------------------------------------------------------------------")
+            for port, desc in ports:
+                out.append("{0:<13} eth    1000    {1}".format(port, desc or "--"))
+            for vlan in self.vlans:
+                out.append("Vlan{0:<9} --     --      User VLAN {0}".format(vlan))
+            return "\n".join(out) + "\n"
+
+        out.append("Interface                      Status         Protocol Description")
+        for vlan in self.vlans:
+            out.append("{0:<30} {1:<14} {2:<8} User VLAN {3}".format("Vl{0}".format(vlan), "up", "up", vlan))
+        for index, (port, desc) in enumerate(ports):
+            if desc == "" and index % 3 == 0:
+                status, protocol = "admin down", "down"
+            elif index % 5 == 0:
+                status, protocol = "down", "down"
+            else:
+                status, protocol = "up", "up"
+            out.append("{0:<30} {1:<14} {2:<8} {3}".format(port, status, protocol, desc).rstrip())
+        return "\n".join(out) + "\n"
+
+    def show_cdp_neighbors_detail(self, port=None):
+        """
+        :param port: If set, only neighbors on this (short or long) local port are included, like the output of
+                     "show cdp neighbors <port> detail".
+        :type port: str
+        :return: The output of "show cdp neighbors detail"
+        :rtype: str
+        """
+        out = []
+        count = 0
+        for neighbor in self.neighbors:
+            for local, remote in zip(neighbor["local_ports"], neighbor["remote_ports"]):
+                if port is not None and port not in (local, self.long_name(local)):
+                    continue
+                count += 1
+                if self.os_type == "nxos":
+                    out.append(
+                        "----------------------------------------\n"
+                        "Device ID:{0}(FOX{1:08d})\n"
+                        "System Name: {0}\n"
+                        "\n"
+                        "Interface address(es):\n"
+                        "    IPv4 Address: {2}\n"
+                        "Platform: {3}, Capabilities: Router Switch IGMP Filtering Supports-STP-Dispute\n"
+                        "Interface: {4}, Port ID (outgoing port): {5}\n"
+                        "Holdtime: 160 sec\n"
+                        "\n"
+                        "Version:\n"
+                        "{6}\n"
+                        "\n"
+                        "Advertisement Version: 2\n"
+                        "\n"
+                        "Native VLAN: 1\n"
+                        "Duplex: full\n"
+                        "\n"
+                        "MTU: 1500\n"
+                        "Mgmt address(es):\n"
+                        "    IPv4 Address: {2}\n".format(
+                            neighbor["hostname"], count, neighbor["ip"], neighbor["platform"], self.long_name(local),
+                            self.long_name(remote), _VERSIONS["nxos"]))
+                else:
+                    out.append(
+                        "-------------------------\n"
+                        "Device ID: {0}.{1}\n"
+                        "Entry address(es): \n"
+                        "  IP address: {2}\n"
+                        "Platform: cisco {3},  Capabilities: Router Switch IGMP \n"
+                        "Interface: {4},  Port ID (outgoing port): {5}\n"
+                        "Holdtime : 150 sec\n"
+                        "\n"
+                        "Version :\n"
+                        "{6}\n"
+                        "Technical Support: http://www.cisco.com/techsupport\n"
+                        "Copyright (c) 1986-2021 by Cisco Systems, Inc.\n"
+                        "Compiled Fri 20-Aug-21 04:07 by mcpre\n"
+                        "\n"
+                        "advertisement version: 2\n"
+                        "VTP Management Domain: ''\n"
+                        "Native VLAN: 1\n"
+                        "Duplex: full\n"
+                        "Management address(es): \n"
+                        "  IP address: {2}\n".format(
+                            neighbor["hostname"], neighbor["domain"], neighbor["ip"], neighbor["platform"],
+                            self.long_name(local), self.long_name(remote), _VERSIONS["iosxe"]))
+        if self.os_type != "nxos":
+            out.append("\nTotal cdp entries displayed : {0}".format(count))
+        return "\n".join(out) + "\n"
+
+    def show_lldp_neighbors_detail(self, port=None):
+        """
+        :param port: If set, only neighbors on this (short or long) local port are included, like the output of
+                     "show lldp neighbors <port> detail".
+        :type port: str
+        :return: The output of "show lldp neighbors detail"
+        :rtype: str
+        """
+        out = []
+        count = 0
+        for neighbor in self.neighbors:
+            for local, remote in zip(neighbor["local_ports"], neighbor["remote_ports"]):
+                if port is not None and port not in (local, self.long_name(local)):
+                    continue
+                count += 1
+                chassis = format_mac((VENDOR_OUIS[0] << 24) | (count * _NIC_SPREAD & 0xFFFFFF))
+                if self.os_type == "nxos":
+                    out.append(
+                        "Chassis id: {0}\n"
+                        "Port id: {1}\n"
+                        "Local Port id: {2}\n"
+                        "Port Description: {3}\n"
+                        "System Name: {4}\n"
+                        "System Description: {5}\n"
+                        "Time remaining: 101 seconds\n"
+                        "System Capabilities: B, R\n"
+                        "Enabled Capabilities: B, R\n"
+                        "Management Address: {6}\n"
+                        "Management Address IPV6: not advertised\n"
+                        "Vlan ID: 1\n".format(chassis, self.long_name(remote), local, self.long_name(remote),
+                                              neighbor["hostname"], _VERSIONS["nxos"], neighbor["ip"]))
+                else:
+                    out.append(
+                        "------------------------------------------------\n"
+                        "Local Intf: {0}\n"
+                        "Chassis id: {1}\n"
+                        "Port id: {2}\n"
+                        "Port Description: {3}\n"
+                        "System Name: {4}.{5}\n"
+                        "\n"
+                        "System Description: \n"
+                        "{6}\n"
+                        "\n"
+                        "Time remaining: 101 seconds\n"
+                        "System Capabilities: B,R\n"
+                        "Enabled Capabilities: B,R\n"
+                        "Management Addresses:\n"
+                        "    IP: {7}\n"
+                        "Auto Negotiation - not supported\n"
+                        "Physical media capabilities - not advertised\n"
+                        "Media Attachment Unit type - not advertised\n"
+                        "Vlan ID: - not advertised\n".format(
+                            local, chassis, remote, self.long_name(remote), neighbor["hostname"],
+                            neighbor["domain"], _VERSIONS["iosxe"], neighbor["ip"]))
+        out.append("\nTotal entries displayed: {0}".format(count))
+        return "\n".join(out) + "\n"
+
+    def show_etherchannel_summary(self, group=None):
+        """
+        Returns "show etherchannel summary" for IOS/IOS-XE, or "show port-channel summary" for NX-OS.
+
+        :param group: If set, only this port-channel number is included (e.g. "show etherchannel 1 summary")
+        :type group: int
+        :return: The output of the etherchannel summary command
+        :rtype: str
+        """
+        channels = [n for n in self.neighbors if n["channel"]]
+        if group is not None:
+            channels = [n for n in channels if n["channel"] == "Po{0}".format(group)]
+        out = []
+        if self.os_type == "nxos":
+            out.append("Flags:  D - Down        P - Up in port-channel (members)\n"
+                       "        I - Individual  H - Hot-standby (LACP only)\n"
+                       "        s - Suspended   r - Module-removed\n"
+                       "        b - BFD Session Wait\n"
+                       "        S - Switched    R - Routed\n"
+                       "        U - Up (port-channel)\n"
+                       "        p - Up in delay-lacp mode (member)\n"
+                       "        M - Not in use. Min-links not met\n"
+                       "--------------------------------------------------------------------------------\n"
+                       "Group Port-       Type     Protocol  Member Ports\n"
+                       "      Channel\n"
+                       "--------------------------------------------------------------------------------")
+            for neighbor in channels:
+                number = neighbor["channel"][2:]
+                out.append("{0:<5} {1:<11} Eth      LACP      {2}".format(
+                    number, neighbor["channel"] + "(SU)", "   ".join(p + "(P)" for p in neighbor["local_ports"])))
+            return "\n".join(out) + "\n"
+
+        out.append("Flags:  D - down        P - bundled in port-channel\n"
+                   "        I - stand-alone s - suspended\n"
+                   "        H - Hot-standby (LACP only)\n"
+                   "        R - Layer3      S - Layer2\n"
+                   "        U - in use      f - failed to allocate aggregator\n"
+                   "\n"
+                   "        M - not in use, minimum links not met\n"
+                   "        u - unsuitable for bundling\n"
+                   "        w - waiting to be aggregated\n"
+                   "        d - default port\n"
+                   "\n"
+                   "        A - formed by Auto LAG\n"
+                   "\n"
+                   "\n"
+                   "Number of channel-groups in use: {0}\n"
+                   "Number of aggregators:           {0}\n"
+                   "\n"
+                   "Group  Port-channel  Protocol    Ports\n"
+                   "------+-------------+-----------+-----------------------------------------------"
+                   .format(len(channels)))
+        for neighbor in channels:
+            number = neighbor["channel"][2:]
+            out.append("{0:<6} {1:<15} LACP      {2}".format(
+                number, neighbor["channel"] + "(SU)", "  ".join(p + "(P)" for p in neighbor["local_ports"])))
+        return "\n".join(out) + "\n"
+
+    def show_ip_arp(self):
+        """
+        :return: The output of "show ip arp", built from the (non-uplink) MAC table entries.
+        :rtype: str
+        """
+        out = []
+        if self.os_type == "nxos":
+            out.append("\n"
+                       "Flags: * - Adjacencies learnt on non-active FHRP router\n"
+                       "       + - Adjacencies synced via CFSoE\n"
+                       "       # - Adjacencies Throttled for Glean\n"
+                       "       CP - Added via L2RIB, Control plane Adjacencies\n"
+                       "       PS - Added via L2RIB, Peer Sync\n"
+                       "       RO - Re-Originated Peer Sync Entry\n"
+                       "       D - Static Adjacencies attached to down interface\n"
+                       "\n"
+                       "IP ARP Table for context default\n"
+                       "Total number of entries: {0}\n"
+                       "Address         Age       MAC Address     Interface       Flags".format(self.arp_rows))
+        else:
+            out.append("Protocol  Address          Age (min)  Hardware Addr   Type   Interface")
+        entries = self.macs
+        for index in range(self.arp_rows):
+            vlan, value, _ = entries[index % len(entries)] if entries else (self.vlans[0], index, None)
+            ip = "10.{0}.{1}.{2}".format(100 + index // 65024, index // 254 % 256, index % 254 + 1)
+            if self.os_type == "nxos":
+                age = "{0:02d}:{1:02d}:{2:02d}".format(index % 24, index % 60, (index * 7) % 60)
+                out.append("{0:<15} {1}  {2}  Vlan{3}".format(ip, age, format_mac(value), vlan))
+            else:
+                age = str(index % 240) if index % 50 else "-"
+                out.append("Internet  {0:<16} {1:>6}   {2}  ARPA   Vlan{3}".format(ip, age, format_mac(value), vlan))
+        return "\n".join(out) + "\n"
+
+    def show_running_config(self):
+        """
+        :return: A minimal "show running-config" with the hostname, VLANs and the interfaces of this switch.
+        :rtype: str
+        """
+        out = ["Building configuration...", "", "Current configuration : 0 bytes", "!",
+               "hostname {0}".format(self.hostname), "!"]
+        for vlan in self.vlans:
+            out.extend(["interface Vlan{0}".format(vlan), " description User VLAN {0}".format(vlan),
+                        " ip helper-address 172.16.1.1", "!"])
+        for port in self.access_ports:
+            out.extend(["interface {0}".format(self.long_name(port)), " switchport mode access", "!"])
+        out.append("end")
+        return "\n".join(out) + "\n"
+
+    # ---- Integration ----
+
+    def commands(self):
+        """
+        :return: A dictionary mapping each supported command to its full output.
+        :rtype: dict
+        """
+        etherchannel = "show port-channel summary" if self.os_type == "nxos" else "show etherchannel summary"
+        return {
+            "show mac address-table": self.show_mac_address_table(),
+            "show interfaces description": self.show_interfaces_description(),
+            "show cdp neighbors detail": self.show_cdp_neighbors_detail(),
+            "show lldp neighbors detail": self.show_lldp_neighbors_detail(),
+            etherchannel: self.show_etherchannel_summary(),
+            "show ip arp": self.show_ip_arp(),
+            "show running-config": self.show_running_config(),
+        }
+
+    def build_device(self, **kwargs):
+        """
+        Builds a crt_emulator.FakeDevice that returns this corpus, including the per-MAC, per-port and per-channel
+        variants of the commands that get_mac_tracker.py uses.
+
+        :param kwargs: Any extra arguments for the FakeDevice (latency, bandwidth, username, etc)
+        :return: The emulated device.
+        :rtype: crt_emulator.FakeDevice
+        """
+        from crt_emulator import FakeDevice
+
+        device = FakeDevice(self.hostname, self.commands(), **kwargs)
+        device.add_pattern(r"^show mac address-table address (\S+)$",
+                           lambda m: self.show_mac_address_table(mac=m.group(1)))
+        device.add_pattern(r"^show cdp neighbors (\S+) detail$",
+                           lambda m: self.show_cdp_neighbors_detail(port=self._match_port(m.group(1))))
+        device.add_pattern(r"^show lldp neighbors (\S+) detail$",
+                           lambda m: self.show_lldp_neighbors_detail(port=self._match_port(m.group(1))))
+        device.add_pattern(r"^show etherchannel (\d+) summary$",
+                           lambda m: self.show_etherchannel_summary(group=int(m.group(1))))
+        device.add_pattern(r"^show port-channel summary interface port-channel ?(\d+)$",
+                           lambda m: self.show_etherchannel_summary(group=int(m.group(1))))
+        return device
+
+    def _match_port(self, port):
+        # Commands are normalized to lowercase by the fake device, so map the port back to our spelling.
+        for neighbor in self.neighbors:
+            for local in neighbor["local_ports"]:
+                if port in (local.lower(), self.long_name(local).lower()):
+                    return local
+        return port
+
+    def transcript(self):
+        """
+        :return: A session transcript (prompt, command and output for every supported command) in the same format as
+                 a SecureCRT session log, which can be replayed with crt_emulator.FakeDevice.from_transcript().
+        :rtype: str
+        """
+        out = []
+        prompt = self.hostname + "#"
+        for command, output in self.commands().items():
+            out.append(prompt + command)
+            out.append(output.rstrip("\n"))
+        out.append(prompt)
+        return "\n".join(out) + "\n"
+
+
+def write_corpus(output_dir, corpus):
+    """
+    Writes one file per command (plus a full transcript) for the corpus into the output directory.
+
+    :param output_dir: The directory where the files are written (created if it doesn't exist).
+    :type output_dir: str
+    :param corpus: The generated switch data.
+    :type corpus: SwitchCorpus
+    :return: The list of files written.
+    :rtype: list of str
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    written = []
+    for command, output in corpus.commands().items():
+        filename = "{0}-{1}.txt".format(corpus.hostname, command.replace(" ", "_"))
+        path = os.path.join(output_dir, filename)
+        with open(path, "w") as output_file:
+            output_file.write(output)
+        written.append(path)
+    path = os.path.join(output_dir, "{0}-transcript.log".format(corpus.hostname))
+    with open(path, "w") as output_file:
+        output_file.write(corpus.transcript())
+    written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic Cisco show command outputs.")
+    parser.add_argument("output_dir", help="Directory where the generated outputs are written")
+    parser.add_argument("--rows", type=int, default=1000, help="Number of MAC table entries (default 1000)")
+    parser.add_argument("--arp-rows", type=int, help="Number of ARP entries (default: same as --rows)")
+    parser.add_argument("--neighbors", type=int, default=4, help="Number of CDP/LLDP neighbors")
+    parser.add_argument("--os", dest="os_type", choices=OS_TYPES, default="iosxe")
+    parser.add_argument("--hostname", default="SW1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run", metavar="SCRIPT", help="Run a SecureCRT script against the generated device with the "
+                                                        "crt emulator and print the timing summary")
+    args = parser.parse_args(argv)
+
+    corpus = SwitchCorpus(args.hostname, args.os_type, args.rows, seed=args.seed, neighbors=args.neighbors,
+                          arp_rows=args.arp_rows)
+    for path in write_corpus(args.output_dir, corpus):
+        print("Wrote {0}".format(path))
+
+    if args.run:
+        from crt_emulator import CrtEmulator, run_script
+
+        crt = CrtEmulator(corpus.build_device(), work_dir=args.output_dir)
+        result = run_script(args.run, crt)
+        print(result.summary())
+        return 1 if result.error else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -858,10 +858,11 @@ class TextFSM(object):
 
     lines = []
     if text:
-      if isinstance(text, file):
-        lines = text
-      else:
+      if hasattr(text, 'splitlines'):
         lines = text.splitlines()
+      else:
+        # A file handle (or other iterable of lines)
+        lines = text
 
     for line in lines:
       self._CheckLine(line)
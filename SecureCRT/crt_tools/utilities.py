@@ -85,6 +85,19 @@ def textfsm_parse_to_dict(input_data, template_filename):
     return output
 
 
+def open_csv_for_writing(filename):
+    """
+    Opens a file for use with a csv writer.  Python 2 requires binary mode ('wb') and Python 3 requires text mode with
+    newline='' to prevent Windows from adding linefeeds after each line.
+
+    :param filename: The path to the CSV file that will be written.
+    :return: The open file object
+    """
+    if sys.version_info[0] < 3:
+        return open(filename, 'wb')
+    return open(filename, 'w', newline='')
+
+
 def list_of_lists_to_csv(data, filename):
     """
     Takes a list of lists and writes it to a csv file.
@@ -102,13 +115,15 @@ def list_of_lists_to_csv(data, filename):
     """
     # Validate path before creating file.
     logger.debug("Opening file {0} for writing".format(filename))
-    with open(filename, 'wb') as output_csv:
-        # Binary mode required ('wb') to prevent Windows from adding linefeeds after each line.
+    with open_csv_for_writing(filename) as output_csv:
         csv_out = csv.writer(output_csv)
         for line in data:
             logger.debug("Writing row: '{0}'".format(line))
-            # Convert every string on the list to utf-8, skipping attempt if value is None
-            encoded_line = [str(x).encode('utf-8', 'ignore') if x else None for x in line]
+            # Convert every string on the list to utf-8 (Python 2 only), skipping attempt if value is None
+            if sys.version_info[0] < 3:
+                encoded_line = [str(x).encode('utf-8', 'ignore') if x else None for x in line]
+            else:
+                encoded_line = [str(x) if x else None for x in line]
             csv_out.writerow(encoded_line)
     logger.debug("Completed writing to file {0}".format(filename))
 
@@ -123,7 +138,7 @@ def list_of_dicts_to_csv(data, filename, header, add_header=True):
     """
     # Validate path before creating file.
     logger.debug("Opening file {0} for writing".format(filename))
-    with open(filename, 'wb') as output_csv:
+    with open_csv_for_writing(filename) as output_csv:
         csv_writer = csv.DictWriter(output_csv, fieldnames=header)
         if add_header:
             csv_writer.writeheader()
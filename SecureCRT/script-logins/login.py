@@ -1,11 +1,69 @@
 # $language = "Python3"
 # $interface = "1.0"
 import os
+import sys
 import csv
+import time
 
 crt.Screen.Synchronous = True
 
-def Login(username, password, enable_pwd, timeout_sec):
+def load_login_latency_model():
+    # Learned login timings per device (see crt_tools/latency_model.py), if crt_tools is next to this script's folder
+    tools_dir = os.path.join(os.path.dirname(os.path.dirname(crt.ScriptFullName)), "crt_tools")
+    if tools_dir not in sys.path:
+        sys.path.insert(0, tools_dir)
+    try:
+        from latency_model import LatencyModel, log_timeouts
+        from host_cache import default_cache_dir
+    except ImportError:
+        return None
+    # This script has no log of its own, so keep the timeouts where they can be found
+    log_timeouts(os.path.join(default_cache_dir(), "timeouts.log"))
+    return LatencyModel(os.path.join(default_cache_dir(), "latency.json"))
+
+LOGIN_LATENCY = load_login_latency_model()
+
+def load_login_auth_limiter():
+    # Meters logins per credential and AAA domain (see crt_tools/auth_limiter.py), shared by every run of this script
+    try:
+        from auth_limiter import AuthRateLimiter
+        from host_cache import default_cache_dir
+    except ImportError:
+        return None
+    return AuthRateLimiter(os.path.join(default_cache_dir(), "auth_limiter.json"),
+                           sleep=lambda seconds: crt.Sleep(int(seconds * 1000)))
+
+LOGIN_AUTH_LIMITER = load_login_auth_limiter()
+LOGIN_AAA_DOMAIN = "default"
+
+def login_aaa_domain(key):
+    # The AAA domain the account's logins are metered in (see crt_tools/auth_limiter.py), only used with the limiter
+    if not LOGIN_AUTH_LIMITER:
+        return "default"
+    from auth_limiter import aaa_domain
+    return aaa_domain(key, getattr(crt.Session, "RemoteAddress", "") or "local")
+
+def wait_for_login_prompt(prompts, step, timeout_sec):
+    # WaitForStrings() with a timeout learned from earlier logins to this device, with timeout_sec as the default
+    host = getattr(crt.Session, "RemoteAddress", "")
+    if LOGIN_LATENCY and host:
+        timeout_sec = LOGIN_LATENCY.timeout(host, "login " + step, timeout_sec)
+    start = time.time()
+    result = crt.Screen.WaitForStrings(prompts, timeout_sec)
+    if LOGIN_LATENCY and host:
+        if result:
+            LOGIN_LATENCY.record(host, "login " + step, time.time() - start)
+        else:
+            LOGIN_LATENCY.timed_out(host, "login " + step, timeout_sec, time.time() - start)
+    return result
+
+def Login(username, password, enable_pwd, timeout_sec, aaa_domain="default"):
+    if LOGIN_AUTH_LIMITER:
+        try:
+            LOGIN_AUTH_LIMITER.acquire(username, aaa_domain)
+        except Exception as e:
+            crt.Dialog.MessageBox("Login skipped: " + str(e))
+            return
     try:
         # Retroactive check: Get the current prompt where the cursor is
         current_row = crt.Screen.CurrentRow
@@ -34,7 +92,7 @@ def Login(username, password, enable_pwd, timeout_sec):
         if sent_username and not sent_password:
             password_prompts = ["Password:", "password:", "Passcode:", "passcode:", "Passwd:", "passwd:", "Secret:", "secret:", 
                                 "Enable password:", "enable password:", "Enable secret:", "enable secret:", "PIN:", "pin:", "Code:", "code:"]
-            if crt.Screen.WaitForStrings(password_prompts, timeout_sec) == 0:
+            if wait_for_login_prompt(password_prompts, "password", timeout_sec) == 0:
                 crt.Dialog.MessageBox("Timeout: No password prompt after retroactive username send.")
                 return
             crt.Screen.Send(password + "\r")
@@ -48,7 +106,7 @@ def Login(username, password, enable_pwd, timeout_sec):
                                 "Enable password:", "enable password:", "Enable secret:", "enable secret:", "PIN:", "pin:", "Code:", "code:"]
             initial_prompts = username_prompts + password_prompts
             
-            result = crt.Screen.WaitForStrings(initial_prompts, timeout_sec)
+            result = wait_for_login_prompt(initial_prompts, "initial", timeout_sec)
             if result == 0:
                 crt.Dialog.MessageBox("Timeout: No username or password prompt found.")
                 return
@@ -56,7 +114,7 @@ def Login(username, password, enable_pwd, timeout_sec):
             num_username = len(username_prompts)
             if result <= num_username:  # Username-like prompt detected
                 crt.Screen.Send(username + "\r")
-                if crt.Screen.WaitForStrings(password_prompts, timeout_sec) == 0:
+                if wait_for_login_prompt(password_prompts, "password", timeout_sec) == 0:
                     crt.Dialog.MessageBox("Timeout: No password prompt after username.")
                     return
                 crt.Screen.Send(password + "\r")
@@ -67,11 +125,14 @@ def Login(username, password, enable_pwd, timeout_sec):
         shell_prompts = ["#", ">", "% Access denied", "Access denied", "% Authentication failed", "Authentication failed", 
                          "% Login invalid", "Login invalid", "% Bad passwords", "Bad passwords", "% Bad secrets", "Bad secrets", 
                          "incorrect", "authentication failure"]
-        result = crt.Screen.WaitForStrings(shell_prompts, timeout_sec)
+        result = wait_for_login_prompt(shell_prompts, "shell", timeout_sec)
         if result == 0:
             crt.Dialog.MessageBox("Timeout: No response after credentials.")
             return
-        elif result >= 3:  # Error strings detected (indices 3+)
+        if LOGIN_AUTH_LIMITER:
+            LOGIN_AUTH_LIMITER.report(username, aaa_domain, success=result < 3)
+            LOGIN_AUTH_LIMITER.save()
+        if result >= 3:  # Error strings detected (indices 3+)
             crt.Dialog.MessageBox("Login failed: Authentication error detected.")
             return
         elif result == 1:  # Already at privileged mode (#)
@@ -81,19 +142,26 @@ def Login(username, password, enable_pwd, timeout_sec):
             # Wait for enable password prompt
             enable_prompts = ["Password:", "password:", "Passcode:", "passcode:", "Passwd:", "passwd:", "Secret:", "secret:", 
                               "Enable password:", "enable password:", "Enable secret:", "enable secret:"]
-            if crt.Screen.WaitForStrings(enable_prompts, timeout_sec) == 0:
+            if wait_for_login_prompt(enable_prompts, "enable password", timeout_sec) == 0:
                 crt.Dialog.MessageBox("Timeout: No enable password prompt.")
                 return
             crt.Screen.Send(enable_pwd + "\r")
-            if not crt.Screen.WaitForString("#", timeout_sec):
+            if not wait_for_login_prompt(["#"], "enable", timeout_sec):
                 crt.Dialog.MessageBox("Timeout: Failed to reach privileged mode.")
                 return
         return  # Exit script, session remains
     except Exception as e:
         crt.Dialog.MessageBox("Script error: " + str(e))
 
-def Main():
-    timeout_sec = 10  # General timeout for waits
+# The account chosen with select_credentials()
+username = None
+password = None
+enable_pass = None
+
+def select_credentials():
+    # Choose an account from the credentials CSV.  Sets username, password, enable_pass and LOGIN_AAA_DOMAIN, and returns
+    # False if no account was chosen.  get_mac_tracker.py loads this script for this function, to log in to its hops.
+    global username, password, enable_pass, LOGIN_AAA_DOMAIN
     
     # Locate the CSV file (fixed path initially)
     csv_path = r"C:\Users\dan\OneDrive - Cleveland Clinic\Documents\Network\SecureCRT\credentials.csv"
@@ -101,7 +169,7 @@ def Main():
         csv_path = crt.Dialog.Prompt("Enter the path to the credentials CSV file:", "File Not Found", "")
         if not csv_path or not os.path.exists(csv_path):
             crt.Dialog.MessageBox("CSV file not found. Exiting.")
-            return
+            return False
     
     # Read the CSV into a dictionary
     creds = {}
@@ -119,7 +187,7 @@ def Main():
                 creds[key]['enable_password'] = enable_pwd if enable_pwd else row['password'].strip()
     except Exception as e:
         crt.Dialog.MessageBox("Error reading CSV: " + str(e))
-        return
+        return False
     
     # Prompt for credential selection
     menu_choice = crt.Dialog.Prompt("[1] AD Account\n\n[2] TAC NetEng\n\n[3] TAC DNAC\n\n[4] Local NetEng\n" , "LOGON MENU", "")
@@ -134,16 +202,34 @@ def Main():
             key = "local_NetEng"
         case _:
             crt.Dialog.MessageBox("Exiting..", "Menu options")
-            return
+            return False
     
     if key not in creds:
         crt.Dialog.MessageBox("Credentials not found for " + key)
-        return
+        return False
     
     username = creds[key]['username']
     password = creds[key]['password']
-    enable_pwd = creds[key]['enable_password']
+    enable_pass = creds[key]['enable_password']
+    LOGIN_AAA_DOMAIN = login_aaa_domain(key)
+    return True
+
+def Main():
+    timeout_sec = 10  # Timeout for waits until the latency model has learned this device's login times
     
-    Login(username, password, enable_pwd, timeout_sec)
+    if not select_credentials():
+        return
+    # Credentials chosen from the menu start without the failures of earlier runs
+    if LOGIN_AUTH_LIMITER:
+        LOGIN_AUTH_LIMITER.reset(username, LOGIN_AAA_DOMAIN)
+        LOGIN_AUTH_LIMITER.save()
+    Login(username, password, enable_pass, timeout_sec, LOGIN_AAA_DOMAIN)
 
-Main()
\ No newline at end of file
+# Scripts that load this one for select_credentials() set LOGIN_CREDENTIALS_ONLY first, so nothing is logged in to
+if not globals().get("LOGIN_CREDENTIALS_ONLY"):
+    try:
+        Main()
+    finally:
+        # The learned timings are written once, at the end of the run
+        if LOGIN_LATENCY:
+            LOGIN_LATENCY.save()
\ No newline at end of file
@@ -5,7 +5,18 @@
 import os
 import csv
 import re
-import tempfile
+import sys
+
+# Shared modules from the crt_tools folder of this repository (next to the tools-macs folder)
+CRT_TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(crt.ScriptFullName)), "crt_tools")
+if CRT_TOOLS_DIR not in sys.path:
+    sys.path.insert(0, CRT_TOOLS_DIR)
+
+from mac_table import MacTableParser
+from filter_planner import Query, plan, OS_PROBE_COMMAND, os_type_from_probe
+from output_reader import capture_command
+from mac_harvest import access_port_rows
+from mac_sightings import record_sightings
 
 # Get the script tab and screen
 tab = crt.GetScriptTab()
@@ -21,34 +32,34 @@ scr.Send("show running-config | include hostname\r")
 scr.WaitForString("show running-config | include hostname\r\n")
 scr.WaitForString("hostname ")
 hostname = scr.ReadString("\r\n").strip()
-scr.WaitForString(hostname + "#")
-
-# Create temporary log files
-temp_dir = tempfile.gettempdir()
-mac_log = os.path.join(temp_dir, "mac_table.txt")
-desc_log = os.path.join(temp_dir, "interfaces_desc.txt")
-
-# Log MAC address table
-tab.Session.LogFileName = mac_log
-tab.Session.Log(True)
-scr.Send("show mac address-table\r")
-scr.WaitForString(hostname + "#")
-tab.Session.Log(False)
-
-# Log interfaces descriptions
-tab.Session.LogFileName = desc_log
-tab.Session.Log(True)
-scr.Send("show interfaces description\r")
-scr.WaitForString(hostname + "#")
-tab.Session.Log(False)
-
-# Read MAC output
-with open(mac_log, 'r') as f:
-    mac_lines = f.readlines()
-
-# Read descriptions output
-with open(desc_log, 'r') as f:
-    desc_lines = f.readlines()
+prompt = hostname + "#"
+scr.WaitForString(prompt)
+
+# Capture command output in memory (very large outputs spill to a temporary file with a unique name)
+def run_command(command):
+    return capture_command(tab, command, prompt)
+
+# Have the switch drop the CPU, Vlan and Port-channel rows (skipped when parsing below) instead of sending them, in the
+# syntax of its OS (NX-OS needs the alternatives of the filter quoted)
+probe = capture_command(tab, OS_PROBE_COMMAND, prompt, timeout=10)
+os_type = os_type_from_probe(probe.text())
+probe.close()
+mac_command = plan(Query("show mac address-table", exclude=["CPU|Switch|Po[0-9]|Vl[0-9]"]), os_type).command
+
+# Capture the MAC address table, interface descriptions and CDP neighbors (to find the uplinks)
+mac_lines = run_command(mac_command)
+desc_lines = run_command("show interfaces description")
+cdp_lines = run_command("show cdp neighbors detail")
+
+# An output that didn't end at the prompt in time is cut short, so don't save a partial table (or record its sightings)
+timed_out = [command for command, captured in ((mac_command, mac_lines), ("show interfaces description", desc_lines),
+                                               ("show cdp neighbors detail", cdp_lines)) if captured.timed_out]
+if timed_out:
+    for captured in (mac_lines, desc_lines, cdp_lines):
+        captured.close()
+    scr.Synchronous = False
+    crt.Dialog.MessageBox("Timed out waiting for the output of:\n" + "\n".join(timed_out) + "\n\nNothing was saved.")
+    sys.exit()
 
 # Parse descriptions into dict (port -> desc)
 port_desc = {}
@@ -84,26 +95,12 @@ def abbreviate_port(port):
             return abbrev + port[len(full):]
     return port
 
-# Parse MAC table
-entries = []
-mac_pattern = re.compile(r'^[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}$')
-for line in mac_lines:
-    line = line.strip()
-    if not line or line.startswith('Vlan') or line.startswith('----') or line.startswith('Unicast') or line.startswith('vlan'):
-        continue
-    parts = re.split(r'\s+', line)
-    if len(parts) >= 4 and mac_pattern.match(parts[1]):
-        vlan = parts[0]
-        mac = parts[1]
-        typ = parts[2]
-        port_index = 3 if len(parts) == 4 else 4
-        port = ' '.join(parts[port_index:]) if port_index + 1 < len(parts) else parts[port_index]
-        if not vlan.isdigit():
-            continue
-        port_lower = port.lower()
-        if any(keyword in port_lower for keyword in ["cpu", "switch", "vl", "vlan", "po", "port-channel"]):
-            continue
-        entries.append((vlan, mac, port))
+# Parse MAC table (the CPU, Vlan and Port-channel rows are dropped)
+entries = MacTableParser().parse(mac_lines)
+
+# Remember where each MAC was seen, so get_mac_tracker.py can answer without tracing it live.  Only the access ports are
+# recorded, as a MAC learned on an uplink (a port with a switch or router CDP neighbor) is connected to another switch.
+record_sightings(hostname, access_port_rows(entries, "\n".join(cdp_lines)))
 
 # Prompt for CSV save location and name
 default_filename = hostname + "_mac_table.csv"
@@ -119,9 +116,10 @@ else:
             desc = port_desc.get(abbrev_port, port_desc.get(port, ""))
             writer.writerow([hostname, mac, port, vlan, desc])
 
-# Clean up temp files
-os.remove(mac_log)
-os.remove(desc_log)
+# Remove any spill files
+for captured in (mac_lines, desc_lines, cdp_lines):
+    if hasattr(captured, "close"):
+        captured.close()
 
 # Reset synchronous
 scr.Synchronous = False
\ No newline at end of file
@@ -5,9 +5,21 @@
 import os
 import csv
 import re
-import tempfile
+import sys
 from collections import defaultdict
 
+# Shared modules from the crt_tools folder of this repository (next to the tools-macs folder)
+CRT_TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(crt.ScriptFullName)), "crt_tools")
+if CRT_TOOLS_DIR not in sys.path:
+    sys.path.insert(0, CRT_TOOLS_DIR)
+
+from mac_table import MacTable, MacTableParser
+from filter_planner import Query, plan, OS_PROBE_COMMAND, os_type_from_probe
+from output_reader import capture_command
+from mac_harvest import access_port_rows
+from mac_sightings import record_sightings
+from oui_lookup import load_oui_database
+
 # Get the script tab and screen
 tab = crt.GetScriptTab()
 scr = tab.Screen
@@ -22,44 +34,31 @@ hostname = prompt[:-1].strip()
 scr.Send("terminal length 0\r")
 scr.WaitForString(prompt)
 
-# Create temporary log files
-temp_dir = tempfile.gettempdir()
-mac_log = os.path.join(temp_dir, "mac_table.txt")
-desc_log = os.path.join(temp_dir, "interfaces_desc.txt")
-cdp_log = os.path.join(temp_dir, "cdp_neighbors.txt")
-
-# Log MAC address table
-tab.Session.LogFileName = mac_log
-tab.Session.Log(True)
-scr.Send("show mac address-table\r")
-scr.WaitForString(prompt)
-tab.Session.Log(False)
-
-# Log interfaces descriptions
-tab.Session.LogFileName = desc_log
-tab.Session.Log(True)
-scr.Send("show interfaces description\r")
-scr.WaitForString(prompt)
-tab.Session.Log(False)
-
-# Log CDP neighbors detail
-tab.Session.LogFileName = cdp_log
-tab.Session.Log(True)
-scr.Send("show cdp neighbors detail\r")
-scr.WaitForString(prompt)
-tab.Session.Log(False)
-
-# Read MAC output
-with open(mac_log, 'r') as f:
-    mac_lines = f.readlines()
-
-# Read descriptions output
-with open(desc_log, 'r') as f:
-    desc_lines = f.readlines()
-
-# Read CDP output
-with open(cdp_log, 'r') as f:
-    cdp_lines = f.readlines()
+# Capture command output in memory (very large outputs spill to a temporary file with a unique name)
+def run_command(command):
+    return capture_command(tab, command, prompt)
+
+# Have the switch drop the CPU, Vlan and Port-channel rows (skipped when parsing below) instead of sending them, in the
+# syntax of its OS (NX-OS needs the alternatives of the filter quoted)
+probe = capture_command(tab, OS_PROBE_COMMAND, prompt, timeout=10)
+os_type = os_type_from_probe(probe.text())
+probe.close()
+mac_command = plan(Query("show mac address-table", exclude=["CPU|Switch|Po[0-9]|Vl[0-9]"]), os_type).command
+
+# Capture the MAC address table, interface descriptions and CDP neighbors
+mac_lines = run_command(mac_command)
+desc_lines = run_command("show interfaces description")
+cdp_lines = run_command("show cdp neighbors detail")
+
+# An output that didn't end at the prompt in time is cut short, so don't save a partial table (or record its sightings)
+timed_out = [command for command, captured in ((mac_command, mac_lines), ("show interfaces description", desc_lines),
+                                               ("show cdp neighbors detail", cdp_lines)) if captured.timed_out]
+if timed_out:
+    for captured in (mac_lines, desc_lines, cdp_lines):
+        captured.close()
+    scr.Synchronous = False
+    crt.Dialog.MessageBox("Timed out waiting for the output of:\n" + "\n".join(timed_out) + "\n\nNothing was saved.")
+    sys.exit()
 
 # Function to normalize port names
 def normalize_port(port):
@@ -155,38 +154,23 @@ def process_cdp_block(block, neighbor_dict):
 # Parse CDP
 cdp_dict = parse_cdp_detail(cdp_lines)
 
-# Parse MAC table
-entries = []
-mac_pattern = re.compile(r'^[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}$')
-for line in mac_lines:
-    line = line.strip()
-    if not line or line.startswith('Vlan') or line.startswith('----') or line.startswith('Unicast') or line.startswith('vlan'):
-        continue
-    parts = re.split(r'\s+', line)
-    if len(parts) >= 4 and mac_pattern.match(parts[1]):
-        vlan = parts[0]
-        mac = parts[1]
-        typ = parts[2]
-        port_index = 3 if len(parts) == 4 else 4
-        port = ' '.join(parts[port_index:]) if port_index + 1 < len(parts) else parts[port_index]
-        if not vlan.isdigit():
-            continue
-        port_lower = port.lower()
-        if any(keyword in port_lower for keyword in ["cpu", "switch", "vl", "vlan", "po", "port-channel"]):
-            continue
-        entries.append((vlan, mac, port))
-
-# Deduplicate entries by MAC and port
-entries = list(set(entries))
-
-# Add debug output
-debug_log = os.path.join(temp_dir, "debug.txt")
-with open(debug_log, 'w') as f:
-    f.write(f"Hostname: {hostname}\n")
-    f.write(f"Port Descriptions (dict): {port_desc}\n\n")
-    f.write(f"CDP Neighbors (dict): {cdp_dict}\n\n")
-    f.write(f"MAC Entries (list length): {len(entries)}\n")
-    f.write(f"Sample MAC Entry: {entries[0] if entries else 'None'}\n")
+# Parse MAC table (the CPU, Vlan and Port-channel rows are dropped)
+entries = MacTable(MacTableParser().parse(mac_lines))
+
+# Deduplicate entries by VLAN, MAC and port, keeping the order of the table
+entries.dedup()
+
+# Remember where each MAC was seen, so get_mac_tracker.py can answer without tracing it live.  Only the access ports are
+# recorded, as a MAC learned on an uplink (a port with a switch or router CDP neighbor) is connected to another switch.
+record_sightings(hostname, access_port_rows(entries, "\n".join(cdp_lines)))
+
+# Look up the vendor of each MAC in the IEEE registry (MAC-resources/vendorsMaccsv.csv, compiled on first use)
+try:
+    ouis = load_oui_database()
+    vendors = ouis.lookup(entries.macs)
+    ouis.close()
+except IOError:
+    vendors = [""] * len(entries)
 
 # Prompt for CSV save location and name
 default_filename = hostname + "_mac_table.csv"
@@ -194,18 +178,22 @@ save_path = crt.Dialog.FileOpenDialog("Save MAC Table CSV", "Save", default_file
 if not save_path:
     crt.Dialog.MessageBox("Save canceled.")
 else:
-    with open(save_path, 'w', newline='') as csvfile:
+    # Vendor names aren't all ASCII
+    with open(save_path, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(["Switch Name", "MAC", "Port", "VLAN", "Port Description", "Device ID", "Platform"])
-        for vlan, mac, port in entries:
+        writer.writerow(["Switch Name", "MAC", "Port", "VLAN", "Port Description", "Device ID", "Platform", "Vendor"])
+        for (vlan, mac, port), vendor in zip(entries, vendors):
             norm_port = normalize_port(port)
             desc = port_desc.get(norm_port, "")
             cdp_neighbors = cdp_dict.get(norm_port, [])
             device_id = ', '.join(d['device'] for d in cdp_neighbors) if cdp_neighbors else ""
             platform = ', '.join(d['platform'] for d in cdp_neighbors if d['platform']) if cdp_neighbors else ""
-            writer.writerow([hostname, mac, port, vlan, desc, device_id, platform])
+            writer.writerow([hostname, mac, port, vlan, desc, device_id, platform, vendor])
 
-# Log files are preserved for debugging - no os.remove() calls
+# Remove any spill files
+for captured in (mac_lines, desc_lines, cdp_lines):
+    if hasattr(captured, "close"):
+        captured.close()
 
 # Reset synchronous
 scr.Synchronous = False
\ No newline at end of file
@@ -2,30 +2,62 @@
 # $interface = "1.0"
 import re
 import os
+import sys
 import csv
+import time
 import urllib.request
 
+# Shared modules from the crt_tools folder of this repository (next to the tools-macs folder)
+CRT_TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(crt.ScriptFullName)), "crt_tools")
+if CRT_TOOLS_DIR not in sys.path:
+    sys.path.insert(0, CRT_TOOLS_DIR)
+
 def main():
     tab = crt.GetScriptTab()
     tab.Screen.Synchronous = True
     # Get clipboard content
     clip_mac = crt.Clipboard.Text.strip()
     # Prompt for MAC with clipboard default
-    mac_input = crt.Dialog.Prompt("Enter MAC address:", "MAC", clip_mac)
+    mac_input = crt.Dialog.Prompt("Enter MAC address (several MACs, or the path of a file of MACs, for a batch trace):",
+                                  "MAC", clip_mac)
     if not mac_input:
         return
+    # Several MACs (or a file of them) are traced together, and written to a CSV report
+    batch_macs = read_mac_list(mac_input)
+    if len(batch_macs) > 1 or os.path.isfile(mac_input.strip()):
+        if not batch_macs:
+            crt.Dialog.MessageBox("No MAC addresses found in the file.")
+            return
+        sessions = [[tab, 0]]
+        try:
+            results = batch_trace(batch_macs, sessions)
+        finally:
+            close_sessions(sessions)
+        if results:
+            save_batch_report(batch_macs, results)
+        return
     # Normalize MAC
     mac = normalize_mac(mac_input)
     if not mac:
         crt.Dialog.MessageBox("Invalid MAC address format.")
         return
-    # No credentials selected yet
+    # Answer from the MAC tables collected by get_mac.py and get_mac_csv.py, if the MAC was seen there recently
+    sightings = find_recent_sightings(mac)
+    if sightings:
+        crt.Dialog.MessageBox(format_sightings(mac, sightings))
+        return
+    # The tab of each switch the trace is on (the script tab first) and how many nested SSH sessions it holds
+    sessions = [[tab, 0]]
+    try:
+        trace(mac, sessions)
+    finally:
+        close_sessions(sessions)
+
+def trace(mac, sessions):
+    # No credentials selected yet (select_credentials() from login.py sets username, password and enable_pass)
     creds_selected = False
-    username = None
-    password = None
-    enable_pass = None
     # Start with local tab
-    current_tab = tab
+    current_tab = sessions[0][0]
     is_core = False
     # Assume already in enable mode for current session
     current_tab.Screen.Send("\n")
@@ -41,7 +73,7 @@ def main():
         path.append(current_device)
         # Check MAC address table
         cmd = f"show mac address-table address {mac}"
-        output = send_command(current_tab, cmd, timeout=30)
+        output = send_command(current_tab, cmd, timeout=30, host=current_device)
         entries = parse_mac_table(output, mac)
         if len(entries) == 0:
             # Check for explicit "no entries" message
@@ -49,7 +81,7 @@ def main():
                 if is_core:
                     # Check ARP on core/L3
                     cmd_arp = f"show ip arp | include {mac}"
-                    output_arp = send_command(current_tab, cmd_arp, timeout=30)
+                    output_arp = send_command(current_tab, cmd_arp, timeout=30, host=current_device)
                     arp_entries = parse_arp(output_arp)
                     if arp_entries:
                         result_str = "MAC found in ARP but not in MAC table (may be inactive):\n"
@@ -62,50 +94,36 @@ def main():
                         crt.Dialog.MessageBox("MAC not found anywhere.")
                         return
                 else:
-                    # Prompt for core IP
-                    core_ip = crt.Dialog.Prompt("MAC not found locally. Enter core switch IP (or cancel to exit):", "Core IP", "")
-                    if not core_ip:
-                        crt.Dialog.MessageBox("MAC not found.")
-                        return
-                    # Load and select credentials if not already
-                    if not creds_selected:
-                        if not load_credentials_code():
-                            return
-                        if not select_credentials():
+                    current_tab = None
+                    # Ask all of the configured aggregation switches at once, and continue from the one that has it
+                    candidates = load_aggregation_switches()
+                    if candidates:
+                        if not creds_selected:
+                            if not load_credentials_code():
+                                return
+                            if not select_credentials():
+                                return
+                            creds_selected = True
+                        current_tab = search_aggregation_switches(sessions, mac, candidates)
+                    if not current_tab:
+                        # Prompt for core IP
+                        where = "locally or on the aggregation switches" if candidates else "locally"
+                        core_ip = crt.Dialog.Prompt(f"MAC not found {where}. Enter core switch IP (or cancel to exit):",
+                                                    "Core IP", "")
+                        if not core_ip:
+                            crt.Dialog.MessageBox("MAC not found.")
                             return
-                        creds_selected = True
-                    # Hop to core via SSH from current device
-                    success = False
-                    while not success:
-                        current_tab.Screen.Send(f"ssh -l {username} {core_ip}\n")
-                        # Handle possible host key verification
-                        if current_tab.Screen.WaitForString("continue connecting (yes/no", 10):
-                            current_tab.Screen.Send("yes\n")
-                        # Handle password prompt
-                        if current_tab.Screen.WaitForString("Password:", 10):
-                            current_tab.Screen.Send(password + "\n")
-                        # Check if login succeeded
-                        prompt_idx = current_tab.Screen.WaitForStrings(["#", ">", "% Access denied", "Access denied", "% Authentication failed", "Authentication failed",
-                         "% Login invalid", "Login invalid", "% Bad passwords", "Bad passwords", "% Bad secrets", "Bad secrets",
-                         "incorrect", "authentication failure"], 30)
-                        if prompt_idx == 1 or prompt_idx == 2: # # or >
-                            success = True
-                            if prompt_idx == 2: # >
-                                current_tab.Screen.Send("enable\n")
-                                if current_tab.Screen.WaitForString("Password:", 5):
-                                    current_tab.Screen.Send(enable_pass + "\n")
-                                if not current_tab.Screen.WaitForString("#", 10):
-                                    crt.Dialog.MessageBox("Enable failed.")
-                                    return
-                        else:
-                            crt.Dialog.MessageBox("Login failed. Re-select credentials.")
+                        # Load and select credentials if not already
+                        if not creds_selected:
                             if not load_credentials_code():
                                 return
                             if not select_credentials():
                                 return
-                    # Set terminal length 0 after login
-                    current_tab.Screen.Send("terminal length 0\n")
-                    current_tab.Screen.WaitForString("#", 10)
+                            creds_selected = True
+                        # Hop to core (in a new tab, or via SSH from the current device)
+                        current_tab = hop(sessions, core_ip)
+                        if not current_tab:
+                            return
                     is_core = True
                     continue # Retry MAC lookup on core
         elif len(entries) > 1:
@@ -116,39 +134,17 @@ def main():
             entry = entries[0]
             port = entry['port']
             path.append(f" -> {port}")
-            # Handle port-channel
-            neigh_port = port
-            if port.lower().startswith('po') or port.lower().startswith('port-channel'):
-                po_num = re.search(r'\d+', port).group(0)
-                os_type = get_os_type(current_tab)
-                if os_type == "unknown":
-                    crt.Dialog.MessageBox("Unknown OS type. Assuming IOS XE for port-channel command.")
-                    os_type = "iosxe"
-                if os_type == "iosxe":
-                    cmd_ec = f"show etherchannel {po_num} summary"
-                elif os_type == "nxos":
-                    cmd_ec = f"show port-channel summary interface port-channel {po_num}"
-               
-                output_ec = send_command(current_tab, cmd_ec, timeout=30)
-                members = parse_etherchannel(output_ec)
-                if not members:
-                    crt.Dialog.MessageBox("No bundled members found for port-channel.")
-                    return
-                neigh_port = members[0]
-            neigh_port = normalize_port(neigh_port)
-            # Check for neighbor (uplink/trunk)
-            cmd_cdp = f"show cdp neighbors {neigh_port} detail"
-            output_cdp = send_command(current_tab, cmd_cdp, timeout=30)
-            neighbor = parse_cdp(output_cdp)
-            if not neighbor:
-                # Try LLDP if CDP fails
-                cmd_lldp = f"show lldp neighbors {neigh_port} detail"
-                output_lldp = send_command(current_tab, cmd_lldp, timeout=30)
-                neighbor = parse_lldp(output_lldp)
+            # Find the neighbor on the port (through a port-channel's members).  An access port has an empty neighbor.
+            neighbor = port_neighbor(current_tab, current_device, port)
+            if neighbor is None:
+                crt.Dialog.MessageBox(f"Couldn't find the neighbor on {port} of {current_device} (no bundled "
+                                      "port-channel members, or the neighbor lookup timed out).")
+                return
             if not neighbor:
                 # No neighbor, assume access port
                 path.append(" (access port)")
                 found = True
+                record_sighting(current_device, entry)
             else:
                 # Has neighbor, add to path and connect
                 neigh_ip = neighbor['ip']
@@ -161,43 +157,415 @@ def main():
                     if not select_credentials():
                         return
                     creds_selected = True
-                # Hop to neighbor via SSH from current device
-                success = False
-                while not success:
-                    current_tab.Screen.Send(f"ssh -l {username} {neigh_ip}\n")
-                    # Handle possible host key verification
-                    if current_tab.Screen.WaitForString("continue connecting (yes/no", 10):
-                        current_tab.Screen.Send("yes\n")
-                    # Handle password prompt
-                    if current_tab.Screen.WaitForString("Password:", 10):
-                        current_tab.Screen.Send(password + "\n")
-                    # Check if login succeeded
-                    prompt_idx = current_tab.Screen.WaitForStrings(["#", ">", "% Access denied", "Access denied", "% Authentication failed", "Authentication failed",
-                         "% Login invalid", "Login invalid", "% Bad passwords", "Bad passwords", "% Bad secrets", "Bad secrets",
-                         "incorrect", "authentication failure"], 30)
-                    if prompt_idx == 1 or prompt_idx == 2: # # or >
-                        success = True
-                        if prompt_idx == 2: # >
-                            current_tab.Screen.Send("enable\n")
-                            if current_tab.Screen.WaitForString("Password:", 5):
-                                current_tab.Screen.Send(enable_pass + "\n")
-                            if not current_tab.Screen.WaitForString("#", 10):
-                                crt.Dialog.MessageBox("Enable failed.")
-                                return
-                    else:
-                        crt.Dialog.MessageBox("Login failed. Re-select credentials.")
-                        if not load_credentials_code():
-                            return
-                        if not select_credentials():
-                            return
-                # Set terminal length 0 after login
-                current_tab.Screen.Send("terminal length 0\n")
-                current_tab.Screen.WaitForString("#", 10)
+                # Hop to neighbor (in a new tab, or via SSH from the current device)
+                current_tab = hop(sessions, neigh_ip)
+                if not current_tab:
+                    return
                 is_core = False # Neighbors are likely not core
     # Output the path
     full_path = f"Path for MAC {mac}:\n" + "".join(path)
     crt.Dialog.MessageBox(full_path)
 
+# Anything that looks like a MAC address in a batch trace's input: xxxx.xxxx.xxxx, xx:xx:xx:xx:xx:xx, xx-xx-xx-xx-xx-xx
+# or bare hex
+MAC_PATTERN = re.compile(r'\b(?:[0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4}'
+                         r'|[0-9a-f]{2}(?:[:-][0-9a-f]{2}){5}|[0-9a-f]{12})\b', re.I)
+
+def read_mac_list(mac_input):
+    # The distinct MACs in the input (or in the file it names), normalized and in order
+    text = mac_input.strip()
+    if os.path.isfile(text):
+        with open(text, 'r', errors='replace') as mac_file:
+            text = mac_file.read()
+    macs = []
+    for match in MAC_PATTERN.findall(text):
+        mac = normalize_mac(match)
+        if mac and mac not in macs:
+            macs.append(mac)
+    return macs
+
+def parse_mac_rows(output):
+    # The (vlan, mac, port) of every dynamic entry in a whole MAC table, Port-channels included
+    try:
+        from mac_table import MacTableParser, PortFilter, EXCLUDED_PORT_NAMES
+    except ImportError:
+        return [(entry['vlan'], entry['mac'], entry['port']) for entry in parse_mac_table(output, "")]
+    return MacTableParser(PortFilter(names=EXCLUDED_PORT_NAMES, types=["Vlan"]), types=["dynamic"]).parse(output)
+
+def batch_trace(macs, sessions):
+    # Trace several MACs at once.  Each switch's MAC table is read once and all of the MACs that reached it are looked
+    # up there; the MACs are then passed on to the neighbor their port leads to, so each distinct uplink is followed
+    # once.  Returns the result of each MAC (status, switch, port, vlan and path), or None if the trace was canceled.
+    results = {}
+    paths = dict((mac, []) for mac in macs)
+    pending = []
+    for mac in macs:
+        # Answer from the MAC tables collected by get_mac.py and get_mac_csv.py, if the MAC was seen there recently
+        sightings = find_recent_sightings(mac)
+        if sightings:
+            results[mac] = {'status': "seen in collected tables", 'switch': sightings[0]['switch'],
+                            'port': sightings[0]['port'], 'vlan': sightings[0]['vlan']}
+        else:
+            pending.append(mac)
+    creds_selected = False
+    current_tab = sessions[0][0]
+    current_tab.Screen.Send("\n")
+    current_tab.Screen.WaitForString("#", 10)
+    current_tab.Screen.Send("terminal length 0\n")
+    current_tab.Screen.WaitForString("#")
+    # The switches still to visit: (ip, whether it is a core switch, MACs to look up there).  None is the script tab.
+    queue = [(None, False, pending)] if pending else []
+    # The MAC table of each switch already read (a MAC's path out of the access layer and the path from the core often
+    # meet at the same distribution switch), and the switches each MAC has reached
+    tables = {}
+    visited = dict((mac, set()) for mac in macs)
+    while queue:
+        ip, is_core, batch = queue.pop(0)
+        if ip is not None:
+            # Load and select credentials if not already
+            if not creds_selected:
+                if not load_credentials_code() or not select_credentials():
+                    return None
+                creds_selected = True
+            # Every hop starts from the script tab's switch, so a chain of SSH sessions never gets deeper than one
+            close_sessions(sessions)
+            current_tab = hop(sessions, ip)
+            if not current_tab:
+                for mac in batch:
+                    results[mac] = {'status': f"login to {ip} failed"}
+                continue
+        current_device = get_device_name(current_tab)
+        looped = [mac for mac in batch if current_device in visited[mac]]
+        for mac in looped:
+            results[mac] = {'status': f"loop back to {current_device}"}
+        batch = [mac for mac in batch if mac not in looped]
+        if not batch:
+            continue
+        if current_device not in tables:
+            # Read the whole MAC table once, for all of the MACs that reach this switch
+            table = {}
+            output = send_command(current_tab, "show mac address-table", timeout=120, host=current_device)
+            for vlan, entry_mac, port in parse_mac_rows(output):
+                table.setdefault(normalize_mac(entry_mac), []).append({'vlan': vlan, 'mac': entry_mac, 'port': port})
+            tables[current_device] = table
+        table = tables[current_device]
+        next_hops = {}
+        missing = []
+        for mac in batch:
+            visited[mac].add(current_device)
+            entries = table.get(mac, [])
+            if not entries:
+                paths[mac].append(current_device)
+                missing.append(mac)
+                continue
+            if len(entries) > 1:
+                results[mac] = {'status': "multiple matches", 'switch': current_device}
+                continue
+            entry = entries[0]
+            paths[mac].append(f"{current_device} {entry['port']}")
+            neighbor = port_neighbor(current_tab, current_device, entry['port'])
+            if neighbor is None:
+                results[mac] = {'status': "neighbor lookup failed", 'switch': current_device,
+                                'port': entry['port'], 'vlan': entry['vlan']}
+            elif not neighbor:
+                # No neighbor, assume access port
+                results[mac] = {'status': "found", 'switch': current_device, 'port': entry['port'],
+                                'vlan': entry['vlan']}
+                record_sighting(current_device, entry)
+            else:
+                next_hops.setdefault(neighbor['ip'], []).append(mac)
+        for neigh_ip, neigh_macs in next_hops.items():
+            queue.append((neigh_ip, False, neigh_macs))
+        if not missing:
+            continue
+        if is_core:
+            # Check ARP on core/L3
+            arp_lines = {}
+            for line in send_command(current_tab, "show ip arp", timeout=60, host=current_device).splitlines():
+                parts = line.split()
+                if len(parts) >= 4 and normalize_mac(parts[3]):
+                    arp_lines.setdefault(normalize_mac(parts[3]), []).append(line)
+            for mac in missing:
+                arp_entries = parse_arp("\n".join(arp_lines.get(mac, [])))
+                if arp_entries:
+                    results[mac] = {'status': f"in ARP only (IP {arp_entries[0]['ip']}, may be inactive)",
+                                    'switch': current_device, 'port': arp_entries[0]['interface']}
+                else:
+                    results[mac] = {'status': "not found", 'switch': current_device}
+        elif ip is None:
+            # Prompt for core IP
+            core_ip = crt.Dialog.Prompt(f"{len(missing)} MACs not found locally. Enter core switch IP (or cancel to "
+                                        "skip them):", "Core IP", "")
+            if core_ip:
+                queue.append((core_ip, True, missing))
+            else:
+                for mac in missing:
+                    results[mac] = {'status': "not found", 'switch': current_device}
+        else:
+            # Aged out of this switch's table since the upstream switch learned it
+            for mac in missing:
+                results[mac] = {'status': "not found", 'switch': current_device}
+    for mac in macs:
+        results.setdefault(mac, {'status': "not traced"})
+        results[mac]['path'] = " -> ".join(paths[mac])
+    return results
+
+def save_batch_report(macs, results):
+    # Prompt for CSV save location and name
+    save_path = crt.Dialog.FileOpenDialog("Save MAC Trace Report", "Save", "mac_trace_report.csv",
+                                          "CSV Files (*.csv)|*.csv||")
+    if not save_path:
+        crt.Dialog.MessageBox("Save canceled.")
+        return
+    with open(save_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["MAC", "Status", "Switch Name", "Port", "VLAN", "Path"])
+        for mac in macs:
+            result = results[mac]
+            writer.writerow([mac, result['status'], result.get('switch', ""), result.get('port', ""),
+                             result.get('vlan', ""), result['path']])
+    found = sum(1 for mac in macs if results[mac]['status'] in ("found", "seen in collected tables"))
+    crt.Dialog.MessageBox(f"Traced {len(macs)} MACs, {found} found.\nReport saved to {save_path}")
+
+# Credentials for the hops, set by select_credentials() from login.py
+username = None
+password = None
+enable_pass = None
+# Loading login.py (see load_credentials_code()) only defines select_credentials(), without logging in to anything
+LOGIN_CREDENTIALS_ONLY = True
+
+# How the tracker reaches the next switch: "direct" opens it in a new tab from this workstation (going through the
+# current switch if it can't be reached directly), "chain" runs ssh from the CLI of the current switch
+HOP_MODE = "direct"
+
+LOGIN_RESULTS = ["#", ">", "% Access denied", "Access denied", "% Authentication failed", "Authentication failed",
+                 "% Login invalid", "Login invalid", "% Bad passwords", "Bad passwords", "% Bad secrets", "Bad secrets",
+                 "incorrect", "authentication failure"]
+
+try:
+    from connect_arguments import ssh2_arguments
+except ImportError:
+    ssh2_arguments = None
+
+def login_direct(ip):
+    # Open the next switch in a new tab.  Returns the tab (None if it couldn't be opened) and the index of the
+    # LOGIN_RESULTS string seen, 0 if the switch couldn't be reached
+    if not ssh2_arguments:
+        # Without crt_tools the password can't be quoted for the command line, so it is typed in from the current switch
+        return None, 0
+    try:
+        new_tab = crt.Session.ConnectInTab(ssh2_arguments(username, password, ip))
+    except Exception:
+        return None, connect_error_index()
+    new_tab.Screen.Synchronous = True
+    # Wait for the prompt after login (asking for another one would leave an extra prompt to be read later)
+    prompt_idx = new_tab.Screen.WaitForStrings(LOGIN_RESULTS[:2], 5)
+    if not prompt_idx:
+        new_tab.Screen.Send("\n")
+        prompt_idx = new_tab.Screen.WaitForStrings(LOGIN_RESULTS[:2], 10)
+    if not prompt_idx:
+        new_tab.Session.Disconnect()
+        new_tab.Close()
+        return None, 0
+    return new_tab, prompt_idx
+
+def connect_error_index():
+    # The index of the LOGIN_RESULTS authentication error in the last connection error, 0 if it isn't one
+    error = crt.GetLastErrorMessage()
+    failures = [i + 1 for i, text in enumerate(LOGIN_RESULTS) if i >= 2 and text in error]
+    return failures[0] if failures else 0
+
+def login_ssh(tab, ip):
+    # Log in to the next switch with ssh from the CLI of the current one.  Returns the index of the LOGIN_RESULTS
+    # string seen (0 on timeout)
+    tab.Screen.Send(f"ssh -l {username} {ip}\n")
+    # Handle possible host key verification, without missing the password prompt if there is none
+    answer = tab.Screen.WaitForStrings(["continue connecting (yes/no", "Password:"], 10)
+    if answer == 1:
+        tab.Screen.Send("yes\n")
+        answer = 2 if tab.Screen.WaitForString("Password:", 10) else 0
+    if answer == 2:
+        tab.Screen.Send(password + "\n")
+    return tab.Screen.WaitForStrings(LOGIN_RESULTS, 30)
+
+def hop(sessions, ip):
+    # Log in to the next switch and get it to the enable prompt.  Returns its tab, or None to stop the trace.
+    current_tab = sessions[-1][0]
+    while True:
+        if not acquire_login(username):
+            return None
+        new_tab = None
+        prompt_idx = 0
+        if HOP_MODE == "direct":
+            new_tab, prompt_idx = login_direct(ip)
+        if not new_tab and not prompt_idx:
+            # Not reachable from this workstation, so go through the current switch
+            prompt_idx = login_ssh(current_tab, ip)
+        report_login(username, prompt_idx)
+        if prompt_idx == 1 or prompt_idx == 2: # # or >
+            break
+        crt.Dialog.MessageBox("Login failed. Re-select credentials.")
+        if not load_credentials_code():
+            return None
+        if not select_credentials():
+            return None
+        reset_login(username)
+    next_tab = new_tab or current_tab
+    if new_tab:
+        # The previous switch is done with, so close its tab (or leave its nested sessions, if it is the script tab)
+        close_sessions(sessions)
+        sessions.append([new_tab, 0])
+    else:
+        sessions[-1][1] += 1
+    if not prepare_session(next_tab, prompt_idx):
+        crt.Dialog.MessageBox("Enable failed.")
+        return None
+    return next_tab
+
+def prepare_session(tab, prompt_idx):
+    # Get a freshly logged in switch to the enable prompt, with paging off.  False if enable failed.
+    if prompt_idx == 2: # >
+        tab.Screen.Send("enable\n")
+        if tab.Screen.WaitForString("Password:", 5):
+            tab.Screen.Send(enable_pass + "\n")
+        if not tab.Screen.WaitForString("#", 10):
+            return False
+    # Set terminal length 0 after login
+    tab.Screen.Send("terminal length 0\n")
+    tab.Screen.WaitForString("#", 10)
+    return True
+
+def leave_session(session, is_script_tab):
+    tab, depth = session
+    if is_script_tab:
+        # Exit the nested SSH sessions, back to the switch the script was started on
+        for _ in range(depth):
+            tab.Screen.Send("exit\n")
+            tab.Screen.WaitForString("#", 10)
+        session[1] = 0
+    else:
+        tab.Session.Disconnect()
+        tab.Close()
+
+def close_sessions(sessions):
+    # Close the tabs opened for hops, and leave the nested SSH sessions of the script tab (the first one)
+    while len(sessions) > 1:
+        leave_session(sessions.pop(), False)
+    leave_session(sessions[0], True)
+
+# Core and distribution switches to search all at once when a MAC isn't found locally, one hostname or IP address per
+# line (the first column of a CSV works too).  Without this file, the tracker asks for a single core switch IP.
+AGGREGATION_SWITCHES_FILE = os.path.join(os.path.dirname(crt.ScriptFullName), "aggregation_switches.txt")
+
+def load_aggregation_switches():
+    # The search opens each switch with its password on the command line, which needs crt_tools to be quoted
+    if not ssh2_arguments or not os.path.isfile(AGGREGATION_SWITCHES_FILE):
+        return []
+    hosts = []
+    with open(AGGREGATION_SWITCHES_FILE, 'r', newline='') as hosts_file:
+        for row in csv.reader(hosts_file):
+            if not row or not row[0].strip() or row[0].strip().startswith('#'):
+                continue
+            host = row[0].strip()
+            if host not in hosts:
+                hosts.append(host)
+    return hosts
+
+# While searching the aggregation switches, each tab is waited on for this many seconds before moving to the next one
+SEARCH_POLL = 0.25
+# The longest the search waits for a candidate to connect, and for all of them to answer, in seconds
+SEARCH_CONNECT_TIMEOUT = 15
+SEARCH_TIMEOUT = 60
+
+def search_aggregation_switches(sessions, mac, candidates):
+    # Look the MAC up on all of the candidates at the same time.  Each one is opened in its own tab without waiting for
+    # the connection, and the tabs are then polled in turn with short waits, so each candidate is logged in and sent
+    # both lookups (in one write) as soon as it answers.  The lookups of every candidate run at the same time, and their
+    # outputs are read up to the prompt, fastest candidate first (by the timings of earlier runs, otherwise in the order
+    # they logged in).  The first switch with the MAC in its MAC table wins, and the other tabs are closed, which
+    # cancels their logins and lookups.  A switch that only has the MAC in its ARP table is used if no MAC table has it.
+    # Returns the tab of the switch to continue the trace from (added to sessions), or None if none of them had it.
+    lookups = [f"show mac address-table address {mac}", f"show ip arp | include {mac}"]
+    searches = []
+    for ip in candidates:
+        if not acquire_login(username):
+            break
+        # Without waiting for the connection this never fails here: a failed connection is a tab that doesn't connect
+        candidate_tab = crt.Session.ConnectInTab(ssh2_arguments(username, password, ip), False)
+        candidate_tab.Screen.Synchronous = True
+        searches.append({'tab': candidate_tab, 'state': "connect", 'host': None, 'waited': 0})
+    # The candidates whose lookups have been sent, in the order they logged in
+    sent = []
+    found_tab = None
+    arp_tab = None
+    deadline = time.time() + SEARCH_TIMEOUT
+    while (searches or sent) and not found_tab and time.time() < deadline:
+        for search in list(searches):
+            candidate_tab = search['tab']
+            screen = candidate_tab.Screen
+            if search['state'] == "connect":
+                if not candidate_tab.Session.WaitForConnected(SEARCH_POLL):
+                    # Still connecting, until it has been waited on for too long (or the connection failed)
+                    search['waited'] += SEARCH_POLL
+                    if search['waited'] >= SEARCH_CONNECT_TIMEOUT:
+                        searches.remove(search)
+                        report_login(username, connect_error_index())
+                        leave_session([candidate_tab, 0], False)
+                    continue
+                search['state'] = "login"
+            if not candidate_tab.Session.Connected:
+                searches.remove(search)
+                leave_session([candidate_tab, 0], False)
+                continue
+            if search['state'] == "login":
+                prompt_idx = screen.WaitForStrings(LOGIN_RESULTS, SEARCH_POLL)
+                if not prompt_idx:
+                    continue
+                report_login(username, prompt_idx)
+                if prompt_idx >= 3:
+                    searches.remove(search)
+                    leave_session([candidate_tab, 0], False)
+                    continue
+                if prompt_idx == 2: # >
+                    screen.Send("enable\n")
+                    search['state'] = "enable"
+                    continue
+            else:
+                enable_idx = screen.WaitForStrings(["Password:", "#"], SEARCH_POLL)
+                if enable_idx == 1:
+                    screen.Send(enable_pass + "\n")
+                if enable_idx != 2:
+                    continue
+            # At the enable prompt: turn paging off and send both lookups
+            search['host'] = get_device_name(candidate_tab, new_prompt=False)
+            screen.Send("terminal length 0\n" + "\n".join(lookups) + "\n")
+            searches.remove(search)
+            sent.append(search)
+        if not sent:
+            continue
+        # Read the outputs of the candidate expected to answer first (the others' lookups keep running on their
+        # switches): the fastest on earlier runs, otherwise the first to log in
+        search = min(sent, key=lambda search: expected_duration(search['host'], lookups[0]))
+        sent.remove(search)
+        candidate_tab = search['tab']
+        outputs = [read_output(candidate_tab, 30, search['host']) for _ in range(1 + len(lookups))]
+        if parse_mac_table(outputs[1], mac):
+            found_tab = candidate_tab
+        elif parse_arp(outputs[2]) and not arp_tab:
+            arp_tab = candidate_tab
+        else:
+            leave_session([candidate_tab, 0], False)
+    # Cancel the logins and lookups that are still running
+    for search in searches + sent:
+        leave_session([search['tab'], 0], False)
+    if found_tab and arp_tab:
+        leave_session([arp_tab, 0], False)
+    found_tab = found_tab or arp_tab
+    if found_tab:
+        close_sessions(sessions)
+        sessions.append([found_tab, 0])
+    return found_tab
+
 def load_credentials_code():
     try:
         github_url = "https://raw.githubusercontent.com/onkings-mfl/MFL-Scripts/main/SecureCRT/script-logins/login.py"
@@ -256,19 +624,119 @@ def normalize_port(port):
         return mappings[prefix] + rest
     return port
 
-def get_device_name(tab):
-    tab.Screen.Send("\n")
-    tab.Screen.WaitForString("#")
+def get_device_name(tab, new_prompt=True):
+    # Read the hostname from the prompt (the one already on the screen if new_prompt is False)
+    if new_prompt:
+        tab.Screen.Send("\n")
+        tab.Screen.WaitForString("#")
     row = tab.Screen.CurrentRow
     col = tab.Screen.CurrentColumn
     prompt = tab.Screen.Get(row, 1, row, col - 1).strip()
     return prompt.rstrip('#> ')
 
-def send_command(tab, cmd, timeout=30):
+try:
+    from output_reader import read_until_prompt
+except ImportError:
+    read_until_prompt = None
+
+def load_latency_model():
+    # Learned per-device command timings (see crt_tools/latency_model.py), if crt_tools is available
+    try:
+        from latency_model import LatencyModel, log_timeouts
+        from host_cache import default_cache_dir
+    except ImportError:
+        return None
+    # This script has no log of its own, so keep the timeouts where they can be found
+    log_timeouts(os.path.join(default_cache_dir(), "timeouts.log"))
+    return LatencyModel(os.path.join(default_cache_dir(), "latency.json"))
+
+def load_auth_limiter():
+    # Meters logins per credential and AAA domain (see crt_tools/auth_limiter.py), if crt_tools is available
+    try:
+        from auth_limiter import AuthRateLimiter
+        from host_cache import default_cache_dir
+    except ImportError:
+        return None
+    return AuthRateLimiter(os.path.join(default_cache_dir(), "auth_limiter.json"),
+                           sleep=lambda seconds: crt.Sleep(int(seconds * 1000)))
+
+def acquire_login(username):
+    # Wait until the AAA servers can take another login with this username.  False if it has failed too often to retry.
+    if not AUTH_LIMITER:
+        return True
+    try:
+        AUTH_LIMITER.acquire(username, globals().get("LOGIN_AAA_DOMAIN", "default"))
+    except Exception as e:
+        crt.Dialog.MessageBox(f"Login skipped: {str(e)}")
+        return False
+    return True
+
+def report_login(username, prompt_idx):
+    # Index 1 and 2 are the prompts, 3+ are the authentication errors (0 is a timeout, which isn't an AAA answer)
+    if AUTH_LIMITER and prompt_idx:
+        AUTH_LIMITER.report(username, globals().get("LOGIN_AAA_DOMAIN", "default"), success=prompt_idx < 3)
+        AUTH_LIMITER.save()
+
+def reset_login(username):
+    # Newly selected credentials start without the failures of the ones they replace
+    if AUTH_LIMITER:
+        AUTH_LIMITER.reset(username, globals().get("LOGIN_AAA_DOMAIN", "default"))
+        AUTH_LIMITER.save()
+
+# Sightings from collected MAC tables that are newer than this (in seconds) are trusted without a live trace
+SIGHTING_MAX_AGE = 60 * 60
+
+def find_recent_sightings(mac):
+    # Where the MAC was seen in collected MAC tables (see crt_tools/mac_sightings.py), if crt_tools is available
+    try:
+        from mac_sightings import find_sightings
+    except ImportError:
+        return []
+    return find_sightings(mac, max_age=SIGHTING_MAX_AGE)
+
+def format_sightings(mac, sightings):
+    age = int(time.time() - sightings[0]['last_seen']) // 60
+    lines = [f"MAC {mac} was seen {age} minutes ago (from collected MAC tables):"]
+    for sighting in sightings:
+        lines.append(f"{sighting['switch']} -> {sighting['port']} (VLAN {sighting['vlan']})")
+    return "\n".join(lines)
+
+def record_sighting(device, entry):
+    # Remember where a live trace ended, so the next lookup of this MAC is answered right away
+    if not entry['vlan'].isdigit():
+        return
+    try:
+        from mac_sightings import record_sightings
+    except ImportError:
+        return
+    record_sightings(device, [(entry['vlan'], entry['mac'], entry['port'])])
+
+def send_command(tab, cmd, timeout=30, host=None):
+    # Use a timeout learned from earlier runs of this command on this device, with the given timeout as the default
+    if LATENCY and host:
+        timeout = LATENCY.timeout(host, cmd, timeout)
+    start = time.time()
     tab.Screen.Send(cmd + "\n")
-    output = tab.Screen.ReadString("#", timeout)
+    output = read_output(tab, timeout, host)
+    if LATENCY and host:
+        if output:
+            LATENCY.record(host, cmd, time.time() - start, len(output))
+        else:
+            LATENCY.timed_out(host, cmd, timeout, time.time() - start)
     return output.strip()
 
+def expected_duration(host, cmd):
+    # How long the command usually takes on this device (learned on earlier runs), infinity if it isn't known yet
+    duration = LATENCY.expected(host, cmd) if LATENCY else None
+    return duration if duration is not None else float("inf")
+
+def read_output(tab, timeout=30, host=None):
+    # Read the output of the next command sent to the tab
+    if read_until_prompt and host:
+        # Stop at the device's own prompt at the start of a line, not at the first "#" in the output
+        return read_until_prompt(tab.Screen, host + "#", timeout)
+    return tab.Screen.ReadString("#", timeout)
+
 def parse_mac_table(output, mac):
     entries = []
     lines = output.splitlines()
@@ -312,14 +780,52 @@ def parse_lldp(output):
         return {'hostname': match_host.group(1), 'ip': match_ip.group(1)}
     return None
 
+def port_neighbor(tab, host, port):
+    # The neighbor (hostname and ip) on a port, {} for an access port, or None if it couldn't be found (a port-channel
+    # without members, or a lookup that timed out).  Port-channels are followed through their first bundled member.
+    neigh_port = port
+    if port.lower().startswith('po') or port.lower().startswith('port-channel'):
+        po_num = re.search(r'\d+', port).group(0)
+        os_type = cached_fact(host, "os_type", lambda: get_os_type(tab, host))
+        if os_type == "nxos":
+            cmd_ec = f"show port-channel summary interface port-channel {po_num}"
+        else:
+            cmd_ec = f"show etherchannel {po_num} summary"
+        # An empty member list isn't cached, so it is looked up again next time
+        members = cached_fact(host, f"port_channel:{po_num}",
+                              lambda: parse_etherchannel(send_command(tab, cmd_ec, timeout=30, host=host)) or None)
+        if not members:
+            return None
+        neigh_port = members[0]
+    neigh_port = normalize_port(neigh_port)
+    # An access port is cached as an empty neighbor (a lookup that timed out isn't cached)
+    return cached_fact(host, f"neighbor:{neigh_port}", lambda: find_neighbor(tab, neigh_port, host))
+
+def find_neighbor(tab, port, host):
+    # The neighbor on a port, {} if both CDP and LLDP answered without one, or None if either of them timed out (the
+    # output includes the echoed command, so it is only empty on a timeout)
+    cmd_cdp = f"show cdp neighbors {port} detail"
+    output = send_command(tab, cmd_cdp, timeout=30, host=host)
+    if not output:
+        return None
+    neighbor = parse_cdp(output)
+    if not neighbor:
+        # Try LLDP if CDP fails
+        cmd_lldp = f"show lldp neighbors {port} detail"
+        output = send_command(tab, cmd_lldp, timeout=30, host=host)
+        if not output:
+            return None
+        neighbor = parse_lldp(output)
+    return neighbor or {}
+
 def parse_etherchannel(output):
     # Find bundled ports like Twe1/5/0/6(P) or Eth1/1(P)
     matches = re.findall(r'([A-Za-z0-9/-]+)\(P\)', output)
     return matches
 
-def get_os_type(tab):
+def get_os_type(tab, host=None):
     cmd = "show etherchannel summary"
-    output = send_command(tab, cmd, timeout=10)
+    output = send_command(tab, cmd, timeout=10, host=host)
     if not output:
         crt.Dialog.MessageBox("Timeout on OS detection command, assuming IOS XE.")
         return "iosxe"
@@ -328,4 +834,37 @@ def get_os_type(tab):
     else:
         return "iosxe"
 
-main()
\ No newline at end of file
+# OS types, port-channel members and port neighbors of the switches a trace goes through are reused for this long (in
+# seconds), so a warm trace only looks the MAC up on each switch
+TOPOLOGY_TTL = 24 * 60 * 60
+
+def load_topology_cache():
+    # Per-device facts learned by earlier traces (see crt_tools/host_cache.py), if crt_tools is available
+    try:
+        from host_cache import HostCache, default_cache_dir
+    except ImportError:
+        return None
+    return HostCache(os.path.join(default_cache_dir(), "topology.json"), ttl=TOPOLOGY_TTL)
+
+def cached_fact(host, key, discover):
+    # A fact about a device from the topology cache, or discovered on the device (and cached) if it isn't known yet.
+    # Nothing is cached when discover() returns None.
+    if TOPOLOGY:
+        value = TOPOLOGY.get(host, key)
+        if value is not None:
+            return value
+    value = discover()
+    if TOPOLOGY and value is not None:
+        TOPOLOGY.set(host, key, value)
+        TOPOLOGY.save()
+    return value
+
+LATENCY = load_latency_model()
+TOPOLOGY = load_topology_cache()
+AUTH_LIMITER = load_auth_limiter()
+try:
+    main()
+finally:
+    # The learned timings are written once, at the end of the run
+    if LATENCY:
+        LATENCY.save()
\ No newline at end of file
@@ -0,0 +1,138 @@
+# SecureCRT Python Script to harvest the MAC address tables of a list of switches into one CSV
+# Compatible with SecureCRT 9.6.3, Python 3.13.7 x64
+# Works for Cisco ISR4431, ISR1001X, Catalyst 3850, 9300, 9410, 9606, 4510, Nexus
+#
+# The device list is a text or CSV file with a hostname or IP address in the first column of each line.  Every switch
+# is opened in its own tab (a window of them at a time) and closed once its tables have been read.  Each MAC is written
+# once, at its access port (see crt_tools/mac_harvest.py for how uplinks and trunks are found).
+
+import os
+import csv
+import sys
+
+# Shared modules from the crt_tools folder of this repository (next to the tools-macs folder)
+CRT_TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(crt.ScriptFullName)), "crt_tools")
+if CRT_TOOLS_DIR not in sys.path:
+    sys.path.insert(0, CRT_TOOLS_DIR)
+
+from mac_harvest import FleetIndex, harvest, DEFAULT_WINDOW
+from mac_sightings import record_sightings
+from command_pipeline import learn_prompt
+from auth_limiter import AuthRateLimiter, aaa_domain, is_auth_failure
+from connect_arguments import ssh2_arguments
+from host_cache import default_cache_dir
+from oui_lookup import load_oui_database
+
+# Number of switches worked on at the same time, each in its own tab
+WINDOW = DEFAULT_WINDOW
+
+def read_device_list(path):
+    hosts = []
+    with open(path, 'r', newline='') as device_file:
+        for row in csv.reader(device_file):
+            if not row or not row[0].strip() or row[0].strip().startswith('#'):
+                continue
+            host = row[0].strip()
+            if host.lower() in ('host', 'hostname', 'ip', 'ip address', 'device'):
+                continue
+            if host not in hosts:
+                hosts.append(host)
+    return hosts
+
+# Accounts of the login.py menu, whose keys name the AAA servers that check them
+ACCOUNT_MENU = "[1] AD Account\n\n[2] TAC NetEng\n\n[3] TAC DNAC\n\n[4] Local NetEng\n"
+ACCOUNT_KEYS = {"1": "ad_account", "2": "tac_NetEng", "3": "tac_DNAC01", "4": "local_NetEng"}
+
+# Meters logins per credential and AAA domain (see crt_tools/auth_limiter.py), shared with login.py
+AUTH_LIMITER = AuthRateLimiter(os.path.join(default_cache_dir(), "auth_limiter.json"),
+                               sleep=lambda seconds: crt.Sleep(int(seconds * 1000)))
+
+def report_login(host, success):
+    AUTH_LIMITER.report(username, aaa_domain(account_key, host), success=success)
+    AUTH_LIMITER.save()
+
+def connect(host):
+    # Open the switch in a new tab and get it to the enable prompt
+    AUTH_LIMITER.acquire(username, aaa_domain(account_key, host))
+    try:
+        new_tab = crt.Session.ConnectInTab(ssh2_arguments(username, password, host))
+    except Exception:
+        error = crt.GetLastErrorMessage() or f"Unable to connect to {host}"
+        # Only a rejected login is an answer from the AAA servers (an unreachable switch isn't)
+        if is_auth_failure(error):
+            report_login(host, False)
+        raise Exception(error)
+    report_login(host, True)
+    new_tab.Screen.Synchronous = True
+    prompt = learn_prompt(new_tab)
+    if prompt and prompt.endswith('>'):
+        new_tab.Screen.Send("enable\r")
+        if new_tab.Screen.WaitForString("Password:", 5):
+            new_tab.Screen.Send(enable_pass + "\r")
+        prompt = learn_prompt(new_tab)
+    if not prompt or not prompt.endswith('#'):
+        new_tab.Session.Disconnect()
+        new_tab.Close()
+        raise Exception("Couldn't get to the enable prompt")
+    return new_tab, prompt
+
+# Choose the device list
+device_path = crt.Dialog.FileOpenDialog("Select Device List", "Open", "devices.txt",
+                                        "Device Lists (*.txt;*.csv)|*.txt;*.csv||")
+hosts = read_device_list(device_path) if device_path and os.path.isfile(device_path) else []
+if not hosts:
+    crt.Dialog.MessageBox("No devices to harvest.")
+    sys.exit()
+
+# Credentials used for every switch
+account_key = ACCOUNT_KEYS.get(crt.Dialog.Prompt(ACCOUNT_MENU, "Harvest MAC Tables", ""))
+if not account_key:
+    sys.exit()
+username = crt.Dialog.Prompt("Username:", "Harvest MAC Tables", "")
+if not username:
+    sys.exit()
+password = crt.Dialog.Prompt("Password:", "Harvest MAC Tables", "", True)
+enable_pass = crt.Dialog.Prompt("Enable password (blank for the same as the password):", "Harvest MAC Tables", "",
+                                True) or password
+
+# Collect every switch and merge the tables
+index = FleetIndex()
+failures = []
+for result in harvest(hosts, connect, WINDOW):
+    if result.error:
+        failures.append(f"{result.host}: {result.error}")
+    else:
+        index.add(result)
+
+# Remember where each MAC was seen, so get_mac_tracker.py can answer without tracing it live
+for switch in index.switches:
+    record_sightings(switch, index.access_rows(switch))
+
+locations = index.locations()
+
+# Look up the vendor of each MAC in the IEEE registry (MAC-resources/vendorsMaccsv.csv, compiled on first use)
+try:
+    ouis = load_oui_database()
+    vendors = ouis.lookup([location['mac'] for location in locations])
+    ouis.close()
+except IOError:
+    vendors = [""] * len(locations)
+
+# Prompt for CSV save location and name
+save_path = crt.Dialog.FileOpenDialog("Save MAC Index CSV", "Save", "mac_index.csv", "CSV Files (*.csv)|*.csv||")
+if not save_path:
+    crt.Dialog.MessageBox("Save canceled.")
+else:
+    # Vendor names aren't all ASCII
+    with open(save_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Switch Name", "MAC", "Port", "VLAN", "Port Description", "Device ID", "Platform", "Vendor",
+                         "Port Role"])
+        for location, vendor in zip(locations, vendors):
+            writer.writerow([location['switch'], location['mac'], location['port'], location['vlan'],
+                             location['description'], location['neighbor'], location['platform'], vendor,
+                             location['role']])
+    summary = f"Harvested {len(index.switches)} of {len(hosts)} switches, {len(locations)} MACs."
+    if failures:
+        summary += "\n\nFailed:\n" + "\n".join(failures)
+    crt.Dialog.MessageBox(summary)